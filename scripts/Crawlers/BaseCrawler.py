@@ -9,6 +9,7 @@ import git
 import requests
 from datalad import api
 
+from scripts.annex_inventory import AnnexInventory
 from scripts.Crawlers.constants import DATS_FIELDS
 from scripts.Crawlers.constants import LICENSE_CODES
 from scripts.Crawlers.constants import MODALITIES
@@ -601,13 +602,7 @@ Functional checks:
             )
 
         # Retrieve modalities from files
-        file_paths = map(
-            lambda x: x.split(" ")[-1],
-            filter(
-                lambda x: " " in x,
-                git.Repo(dataset_dir).git.annex("list").split("\n"),
-            ),
-        )  # Get file paths
+        file_paths = AnnexInventory.from_dataset(dataset_dir).paths
         file_names = list(
             map(lambda x: x.split("/")[-1] if "/" in x else x, file_paths),
         )  # Get file names from path
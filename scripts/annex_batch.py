@@ -0,0 +1,217 @@
+"""Batch mode git-annex commands.
+
+Commands such as `rmurl` or `registerurl` accept ``--batch``: a single git-annex
+process reads one request per line on its stdin and answers each of them on its
+stdout. Streaming the requests into one process avoids launching git-annex once
+per file, which dominates the run time on datasets with many annexed files.
+"""
+from __future__ import annotations
+
+import json
+import subprocess
+import threading
+from collections import deque
+from typing import Iterable
+from typing import Iterator
+
+
+class AnnexBatch:
+    """A `git annex <command> --batch --json` process of a dataset.
+
+    Parameters
+    ----------
+    dataset : str
+        Path to the dataset root.
+    command : str
+        git-annex subcommand supporting ``--batch``, e.g. `rmurl` or `registerurl`.
+    *args : str
+        Extra arguments given to the subcommand.
+    """
+
+    def __init__(self, dataset: str, command: str, *args: str):
+        self.dataset = dataset
+        self.command = command
+        self.argv = [
+            "git",
+            "annex",
+            command,
+            "--batch",
+            "--json",
+            "--json-error-messages",
+            *args,
+        ]
+
+    def run(self, lines: Iterable[str]) -> Iterator[tuple[str, dict]]:
+        """Send the requests to git-annex and yield its answer to each of them.
+
+        The requests are written by a separate thread while the answers are
+        read, so neither pipe fills up and the lines are never all held in
+        memory.
+
+        Parameters
+        ----------
+        lines : Iterable[str]
+            Requests in the input format of the subcommand, without newline.
+
+        Yields
+        ------
+        tuple[str, dict]
+            Each request with the decoded JSON answer of git-annex. A request
+            git-annex could not parse is answered with ``{"success": False}``.
+        """
+        process = subprocess.Popen(
+            self.argv,
+            cwd=self.dataset,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+        )
+        # git-annex answers the requests in order, the writer hands them over
+        # to the reader before sending them.
+        sent: deque[str] = deque()
+        errors: list[BaseException] = []
+
+        def write():
+            try:
+                for line in lines:
+                    sent.append(line)
+                    process.stdin.write(f"{line}\n")
+                    process.stdin.flush()
+            except BaseException as e:  # reported by the reader
+                errors.append(e)
+            finally:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+
+        writer = threading.Thread(target=write, daemon=True)
+        writer.start()
+        try:
+            for answer in process.stdout:
+                line = sent.popleft()
+                answer = answer.strip()
+                yield line, json.loads(answer) if answer else {"success": False}
+        finally:
+            process.stdout.close()
+            writer.join()
+            returncode = process.wait()
+
+        if errors:
+            raise errors[0]
+        if returncode != 0:
+            raise subprocess.CalledProcessError(
+                returncode,
+                f"git annex {self.command} --batch",
+            )
+
+
+def rmurl(dataset: str, pairs: Iterable[tuple[str, str]]) -> Iterator[tuple[str, dict]]:
+    """Remove URLs from annexed files with a single git-annex process.
+
+    Parameters
+    ----------
+    dataset : str
+        Path to the dataset root.
+    pairs : Iterable[tuple[str, str]]
+        (file, url) pairs to remove.
+    """
+    return AnnexBatch(dataset, "rmurl").run(f"{file} {url}" for file, url in pairs)
+
+
+def registerurl(
+    dataset: str,
+    pairs: Iterable[tuple[str, str]],
+) -> Iterator[tuple[str, dict]]:
+    """Register URLs for git-annex keys with a single git-annex process.
+
+    Parameters
+    ----------
+    dataset : str
+        Path to the dataset root.
+    pairs : Iterable[tuple[str, str]]
+        (key, url) pairs to register.
+    """
+    return AnnexBatch(dataset, "registerurl").run(f"{key} {url}" for key, url in pairs)
+
+
+def addurl(
+    dataset: str,
+    pairs: Iterable[tuple[str, str]],
+    *args: str,
+) -> Iterator[tuple[str, dict]]:
+    """Add URLs to files of the dataset with a single git-annex process.
+
+    Parameters
+    ----------
+    dataset : str
+        Path to the dataset root.
+    pairs : Iterable[tuple[str, str]]
+        (url, file) pairs to add.
+    *args : str
+        Extra arguments given to `git annex addurl`, e.g. `--fast`.
+    """
+    return AnnexBatch(dataset, "addurl", "--with-files", *args).run(
+        f"{url} {file}" for url, file in pairs
+    )
+
+
+def set_metadata(
+    dataset: str,
+    items: Iterable[tuple[str, dict]],
+) -> Iterator[tuple[str, dict]]:
+    """Set git-annex metadata fields of files with a single git-annex process.
+
+    Parameters
+    ----------
+    dataset : str
+        Path to the dataset root.
+    items : Iterable[tuple[str, dict]]
+        (file, fields) pairs, where fields maps each metadata field to its list
+        of values.
+    """
+    return AnnexBatch(dataset, "metadata").run(
+        json.dumps({"file": file, "fields": fields}) for file, fields in items
+    )
+
+
+def replace_urls(
+    dataset: str,
+    replacements: Iterable[tuple[str, str, str, str]],
+) -> Iterator[tuple[tuple[str, str, str, str], str, dict]]:
+    """Replace URLs of annexed files: register the new URLs, then remove the old ones.
+
+    The new URLs are registered first so that a file never loses all of its
+    URLs. The old URL of a file is only removed once its new URL was registered.
+
+    Parameters
+    ----------
+    dataset : str
+        Path to the dataset root.
+    replacements : Iterable[tuple[str, str, str, str]]
+        (file, key, old url, new url) tuples.
+
+    Yields
+    ------
+    tuple[tuple[str, str, str, str], str, dict]
+        Each replacement once, with the git-annex command that concluded it,
+        `registerurl` when the new URL could not be registered and `rmurl`
+        otherwise, and the answer of git-annex to that command.
+    """
+    replacements = list(replacements)
+    registered = []
+    for replacement, (_, result) in zip(
+        replacements,
+        registerurl(dataset, ((key, new) for _, key, _, new in replacements)),
+    ):
+        if result.get("success", False):
+            registered.append(replacement)
+        else:
+            yield replacement, "registerurl", result
+
+    for replacement, (_, result) in zip(
+        registered,
+        rmurl(dataset, ((file, old) for file, _, old, _ in registered)),
+    ):
+        yield replacement, "rmurl", result
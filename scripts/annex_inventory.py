@@ -0,0 +1,211 @@
+"""Structured inventory of the annexed files of a DataLad dataset.
+
+The inventory is built by streaming the JSON output of git-annex rather than
+scraping the text output of ``git annex list``. It is stored column-wise, one
+entry per annexed file, so that queries over large datasets stay cheap.
+"""
+from __future__ import annotations
+
+import heapq
+import json
+import subprocess
+import warnings
+from array import array
+from typing import Iterable
+from typing import Iterator
+
+
+DATALAD_ARCHIVES = "datalad-archives"
+WEB = "web"
+
+UNKNOWN_SIZE = -1
+
+
+def iter_annex_json(dataset: str, command: str, *args: str) -> Iterator[dict]:
+    """Stream the records of a git-annex command run with ``--json``.
+
+    Records are yielded as soon as git-annex prints them, so the whole output
+    is never held in memory.
+
+    Parameters
+    ----------
+    dataset : str
+        Path to the dataset root.
+    command : str
+        git-annex subcommand, e.g. `whereis` or `find`.
+    *args : str
+        Extra arguments given to the subcommand.
+
+    Yields
+    ------
+    dict
+        One decoded JSON record per annexed file.
+
+    Warns
+    -----
+    UserWarning
+        When git-annex exits with status 1 after reporting some records, e.g.
+        `whereis` on files without any known copy. The failed files are listed.
+
+    Raises
+    ------
+    subprocess.CalledProcessError
+        When git-annex exits with another non-zero status, or with status 1
+        without reporting any record.
+    """
+    process = subprocess.Popen(
+        ["git", "annex", command, "--json", *args],
+        cwd=dataset,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    records = 0
+    failed: list[str] = []
+    try:
+        for line in process.stdout:
+            if line.strip():
+                record = json.loads(line)
+                records += 1
+                if not record.get("success", True):
+                    failed.append(record.get("file", record.get("key", "")))
+                yield record
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+
+    if returncode == 1 and records:
+        warnings.warn(
+            f"git annex {command} failed on {len(failed)} files in {dataset}: "
+            + ", ".join(failed),
+        )
+    elif returncode != 0:
+        raise subprocess.CalledProcessError(returncode, f"git annex {command}")
+
+
+def key_size(key: str) -> int:
+    """Return the size in Bytes encoded in a git-annex key.
+
+    Keys have the form `BACKEND[-sSIZE][-mMTIME][-Sx-Cy]--NAME`. Keys created
+    without a size, e.g. relaxed URL keys, return `UNKNOWN_SIZE`.
+    """
+    fields = key.split("--", 1)[0].split("-")[1:]
+    for field in fields:
+        if field.startswith("s") and field[1:].isdigit():
+            return int(field[1:])
+    return UNKNOWN_SIZE
+
+
+def remote_name(entry: dict) -> str:
+    """Return a readable name for a remote of a `whereis` record."""
+    description = entry.get("description", "")
+    if description.startswith("[") and description.endswith("]"):
+        return description[1:-1]
+    return description
+
+
+class AnnexInventory:
+    """Column-oriented inventory of the annexed files in a dataset.
+
+    Each file has a path, a git-annex key, a size in Bytes and a bitmask of the
+    remotes holding its content. Bit `i` of the mask is set when the file is
+    available from `remotes[i]`.
+    """
+
+    def __init__(self):
+        self.paths: list[str] = []
+        self.keys: list[str] = []
+        self.sizes = array("q")
+        self.presence: list[int] = []
+        self.remotes: list[str] = []
+        self._remote_bits: dict[str, int] = {}
+        self._index: dict[str, int] | None = None
+
+    @classmethod
+    def from_dataset(cls, dataset: str) -> AnnexInventory:
+        """Build the inventory of a dataset from `git annex whereis --json`."""
+        return cls.from_records(iter_annex_json(dataset, "whereis"))
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> AnnexInventory:
+        """Build the inventory from decoded `git annex whereis --json` records."""
+        inventory = cls()
+        for record in records:
+            inventory.add(record)
+        return inventory
+
+    def add(self, record: dict) -> None:
+        """Append a `whereis` record to the inventory."""
+        mask = 0
+        for entry in record.get("whereis", []):
+            mask |= 1 << self._remote_bit(entry)
+
+        self.paths.append(record["file"])
+        self.keys.append(record.get("key", ""))
+        self.sizes.append(key_size(record.get("key", "")))
+        self.presence.append(mask)
+        self._index = None
+
+    def _remote_bit(self, entry: dict) -> int:
+        uuid = entry.get("uuid", "")
+        if uuid not in self._remote_bits:
+            self._remote_bits[uuid] = len(self.remotes)
+            self.remotes.append(remote_name(entry))
+        return self._remote_bits[uuid]
+
+    def _mask(self, remote: str) -> int:
+        return sum(1 << bit for bit, name in enumerate(self.remotes) if name == remote)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.index
+
+    @property
+    def index(self) -> dict[str, int]:
+        """Mapping of each file path to its row in the inventory."""
+        if self._index is None:
+            self._index = {path: row for row, path in enumerate(self.paths)}
+        return self._index
+
+    def has_remote(self, remote: str) -> bool:
+        return remote in self.remotes
+
+    def key(self, path: str) -> str:
+        return self.keys[self.index[path]]
+
+    def size(self, path: str) -> float:
+        """Size of a file in Bytes, `inf` when git-annex does not know it."""
+        size = self.sizes[self.index[path]]
+        return float("inf") if size == UNKNOWN_SIZE else size
+
+    def files_in(self, remote: str) -> list[str]:
+        """Files whose content is available from `remote`."""
+        mask = self._mask(remote)
+        return [p for p, bits in zip(self.paths, self.presence) if bits & mask]
+
+    def files_not_in(self, remote: str) -> list[str]:
+        """Files whose content is not available from `remote`."""
+        mask = self._mask(remote)
+        return [p for p, bits in zip(self.paths, self.presence) if not bits & mask]
+
+    def files_only_in(self, remote: str) -> list[str]:
+        """Files whose content is available from `remote` and nowhere else."""
+        mask = self._mask(remote)
+        return [
+            p for p, bits in zip(self.paths, self.presence) if bits and not bits & ~mask
+        ]
+
+    def k_smallest(self, k: int, paths: Iterable[str] | None = None) -> list[str]:
+        """Return the `k` smallest files, files of unknown size come last.
+
+        Parameters
+        ----------
+        k : int
+            Number of files to return.
+        paths : Iterable[str], optional
+            Restrict the selection to those files, by default every file.
+        """
+        if paths is None:
+            paths = self.paths
+        return heapq.nsmallest(k, paths, key=self.size)
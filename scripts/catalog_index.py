@@ -0,0 +1,569 @@
+"""SQLite index of the DATS.json files of the CONP datasets.
+
+The projects directory is scanned once and the normalized fields used by the reporting
+tools are stored in a SQLite file. Refreshing the index only parses the DATS.json files
+whose modification time or size changed and whose content hash differs.
+"""
+import configparser
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+
+# default location of the index, relative to the conp-dataset directory
+CATALOG_INDEX_PATH = os.getenv("CONP_CATALOG_INDEX", ".conp-catalog.sqlite")
+
+# below this number of modified DATS.json files, they are parsed in the main process
+PARALLEL_PARSE_THRESHOLD = 32
+
+# properties of a DATS dataset stored as lists of values
+DATASET_VALUES = ("keywords", "formats", "licenses", "types", "is_about")
+
+# DataType schemas of a DATS types entry
+DATATYPE_SCHEMAS = ("information", "method", "platform", "instrument")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    top_level INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    title TEXT,
+    privacy TEXT,
+    provider TEXT,
+    dats TEXT
+);
+CREATE TABLE IF NOT EXISTS distributions (
+    path TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    landing_page TEXT,
+    size REAL,
+    unit TEXT,
+    authorizations TEXT
+);
+CREATE TABLE IF NOT EXISTS extra_properties (
+    path TEXT NOT NULL,
+    category TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    value
+);
+CREATE TABLE IF NOT EXISTS creators (
+    path TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT,
+    roles TEXT
+);
+CREATE TABLE IF NOT EXISTS dataset_values (
+    path TEXT NOT NULL,
+    property TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    value
+);
+CREATE INDEX IF NOT EXISTS distributions_path ON distributions (path);
+CREATE INDEX IF NOT EXISTS extra_properties_path ON extra_properties (path);
+CREATE INDEX IF NOT EXISTS creators_path ON creators (path);
+CREATE INDEX IF NOT EXISTS dataset_values_path ON dataset_values (path, property);
+"""
+
+CHILD_TABLES = ("distributions", "extra_properties", "creators", "dataset_values")
+
+
+def get_subdataset_dirs(dataset_dir):
+    """
+    Returns the subdataset directories declared in the .gitmodules of a dataset.
+
+    :param dataset_dir: path to the dataset
+     :type dataset_dir: str
+
+    :return: list of the subdataset directories
+     :rtype: list
+    """
+
+    gitmodules = os.path.join(dataset_dir, ".gitmodules")
+    if not os.path.isfile(gitmodules):
+        return []
+
+    config = configparser.ConfigParser()
+    config.read(gitmodules)
+    return [
+        os.path.join(dataset_dir, config[section]["path"])
+        for section in config.sections()
+        if "path" in config[section]
+    ]
+
+
+def discover_dats_files(conp_dataset_dir):
+    """
+    Finds the DATS.json files of the datasets present in the projects directory.
+
+    A dataset is described by the DATS.json of its root directory, or by the DATS.json
+    files of its subfolders when it has none. The DATS.json files of the subdatasets
+    declared in the .gitmodules of a dataset are also returned.
+
+    :param conp_dataset_dir: path to the conp-dataset directory
+     :type conp_dataset_dir: str
+
+    :return: list of (dataset path relative to conp_dataset_dir, parent dataset path, top level)
+     :rtype: list
+    """
+
+    projects_dir = os.path.join(conp_dataset_dir, "projects")
+    found = []
+
+    for dataset in sorted(os.listdir(projects_dir)):
+        dataset_dir = os.path.join(projects_dir, dataset)
+        if not os.path.isdir(dataset_dir):
+            continue
+
+        if os.path.isfile(os.path.join(dataset_dir, "DATS.json")):
+            stack = [(dataset_dir, None, True)]
+        else:
+            stack = [
+                (os.path.join(dataset_dir, subdataset), None, True)
+                for subdataset in sorted(os.listdir(dataset_dir))
+                if os.path.isfile(os.path.join(dataset_dir, subdataset, "DATS.json"))
+            ]
+        stack.reverse()
+
+        while stack:
+            directory, parent, top_level = stack.pop()
+            path = os.path.relpath(directory, conp_dataset_dir)
+            if os.path.isfile(os.path.join(directory, "DATS.json")):
+                found.append((path, parent, top_level))
+            stack.extend(
+                (subdataset_dir, path, False)
+                for subdataset_dir in reversed(sorted(get_subdataset_dirs(directory)))
+            )
+
+    return found
+
+
+def first(items, default=None):
+    return items[0] if items else default
+
+
+def to_sql_value(value):
+    """SQLite stores numbers and strings as they are, other values are stored as JSON."""
+
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return json.dumps(value)
+
+
+def normalize_dats(dats):
+    """
+    Extracts the indexed fields of a DATS dictionary.
+
+    :param dats: content of a DATS.json file
+     :type dats: dict
+
+    :return: dictionary with the dataset columns and the rows of each child table
+     :rtype: dict
+    """
+
+    distributions = dats.get("distributions") or []
+    access = first(distributions, {}).get("access", {})
+
+    values = {
+        "keywords": [keyword.get("value") for keyword in dats.get("keywords", [])],
+        "formats": [
+            file_format
+            for distribution in distributions
+            for file_format in distribution.get("formats", [])
+        ],
+        "licenses": [licence.get("name") for licence in dats.get("licenses", [])],
+        "types": [
+            datatype[schema]["value"]
+            for datatype in dats.get("types", [])
+            for schema in DATATYPE_SCHEMAS
+            if schema in datatype
+        ],
+        "is_about": [
+            entry.get("name", entry.get("value"))
+            for entry in dats.get("isAbout", [])
+            if "name" in entry or "value" in entry
+        ],
+    }
+
+    return {
+        "title": dats.get("title"),
+        "privacy": dats.get("privacy"),
+        "provider": access.get("landingPage"),
+        "distributions": [
+            (
+                position,
+                distribution.get("access", {}).get("landingPage"),
+                to_sql_value(distribution.get("size")),
+                distribution.get("unit", {}).get("value"),
+                json.dumps(
+                    [
+                        authorization.get("value")
+                        for authorization in distribution["access"]["authorizations"]
+                    ],
+                )
+                if "authorizations" in distribution.get("access", {})
+                else None,
+            )
+            for position, distribution in enumerate(distributions)
+        ],
+        "extra_properties": [
+            (prop["category"], position, to_sql_value(value.get("value")))
+            for prop in dats.get("extraProperties", [])
+            for position, value in enumerate(prop.get("values", []))
+        ],
+        "creators": [
+            (
+                position,
+                creator.get("name"),
+                json.dumps([role.get("value") for role in creator.get("roles", [])]),
+            )
+            for position, creator in enumerate(dats.get("creators", []))
+        ],
+        "dataset_values": [
+            (prop, position, to_sql_value(value))
+            for prop in DATASET_VALUES
+            for position, value in enumerate(values[prop])
+        ],
+    }
+
+
+def load_dats_file(dats_path, known_sha256=None):
+    """
+    Reads, hashes and normalizes a DATS.json file. Runs in the worker processes of
+    CatalogIndex.refresh.
+
+    :param dats_path   : path to the DATS.json file
+     :type dats_path   : str
+    :param known_sha256: sha256 of the indexed content, the file is not parsed if unchanged
+     :type known_sha256: str
+
+    :return: dictionary with the mtime_ns, size, sha256, normalized fields (None when the
+             content is unchanged) and the compact JSON of the DATS.json file
+     :rtype: dict
+    """
+
+    stat = os.stat(dats_path)
+    with open(dats_path, "rb") as dats_file:
+        content = dats_file.read()
+    sha256 = hashlib.sha256(content).hexdigest()
+
+    loaded = {
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": sha256,
+        "fields": None,
+        "dats": None,
+    }
+    if sha256 != known_sha256:
+        dats = json.loads(content)
+        loaded["fields"] = normalize_dats(dats)
+        loaded["dats"] = json.dumps(dats)
+    return loaded
+
+
+class CatalogIndex:
+    """
+    Index of the DATS.json files of a conp-dataset directory.
+
+    :param conp_dataset_dir: path to the conp-dataset directory
+     :type conp_dataset_dir: str
+    :param index_path      : path to the SQLite file, relative to conp_dataset_dir
+     :type index_path      : str
+    """
+
+    def __init__(self, conp_dataset_dir, index_path=CATALOG_INDEX_PATH):
+        self.conp_dataset_dir = conp_dataset_dir
+        self.index_path = os.path.join(conp_dataset_dir, index_path)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.index_path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def refresh(self, jobs=None):
+        """
+        Updates the index with the DATS.json files added, modified or removed since the last
+        refresh. The modified files are parsed in parallel.
+
+        :param jobs: number of processes parsing the DATS.json files, by default the number
+                     of CPUs
+         :type jobs: int
+
+        :return: number of DATS.json files parsed
+         :rtype: int
+        """
+
+        found = discover_dats_files(self.conp_dataset_dir)
+        with self.lock:
+            stale = [
+                (path, parent, top_level, sha256)
+                for path, parent, top_level in found
+                for is_stale, sha256 in [self._is_stale(path)]
+                if is_stale
+            ]
+
+        dats_paths = [
+            os.path.join(self.conp_dataset_dir, path, "DATS.json")
+            for path, _, _, _ in stale
+        ]
+        known_sha256 = [sha256 for _, _, _, sha256 in stale]
+        if jobs == 1 or len(stale) < PARALLEL_PARSE_THRESHOLD:
+            loaded = map(load_dats_file, dats_paths, known_sha256)
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                loaded = list(
+                    executor.map(load_dats_file, dats_paths, known_sha256, chunksize=8),
+                )
+
+        parsed = 0
+        with self.lock, self.connection:
+            for (path, parent, top_level, _), dats_file in zip(stale, loaded):
+                parsed += self._store(path, parent, top_level, dats_file)
+
+            indexed = {
+                row["path"]
+                for row in self.connection.execute(
+                    "SELECT path FROM datasets",
+                )
+            }
+            for path in indexed - {path for path, _, _ in found}:
+                self._delete(path)
+        return parsed
+
+    def refresh_dataset(self, path):
+        """
+        Updates the index entry of a single dataset, e.g. after it was installed.
+
+        :param path: path of the dataset relative to the conp-dataset directory
+         :type path: str
+        """
+
+        path = os.path.normpath(path)
+        dats_path = os.path.join(self.conp_dataset_dir, path, "DATS.json")
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT parent, top_level FROM datasets WHERE path = ?",
+                (path,),
+            ).fetchone()
+            parent, top_level = (row["parent"], row["top_level"]) if row else (None, 1)
+            if os.path.isfile(dats_path):
+                is_stale, sha256 = self._is_stale(path)
+                if is_stale:
+                    dats_file = load_dats_file(dats_path, sha256)
+                    self._store(path, parent, top_level, dats_file)
+            elif row:
+                self._delete(path)
+
+    def _is_stale(self, path):
+        """
+        Whether the modification time or the size of a DATS.json file changed.
+
+        :return: tuple with whether the file is stale and its indexed sha256, if any
+         :rtype: tuple
+        """
+
+        stat = os.stat(os.path.join(self.conp_dataset_dir, path, "DATS.json"))
+        row = self.connection.execute(
+            "SELECT mtime_ns, size, sha256 FROM datasets WHERE path = ?",
+            (path,),
+        ).fetchone()
+        if row is None:
+            return True, None
+        if (row["mtime_ns"], row["size"]) == (stat.st_mtime_ns, stat.st_size):
+            return False, row["sha256"]
+        return True, row["sha256"]
+
+    def _store(self, path, parent, top_level, dats_file):
+        if dats_file["fields"] is None:
+            # Same content, only the modification time changed.
+            self.connection.execute(
+                "UPDATE datasets SET mtime_ns = ?, size = ? WHERE path = ?",
+                (dats_file["mtime_ns"], dats_file["size"], path),
+            )
+            return 0
+
+        fields = dats_file["fields"]
+        self._delete(path)
+        self.connection.execute(
+            "INSERT INTO datasets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                path,
+                parent,
+                int(top_level),
+                dats_file["mtime_ns"],
+                dats_file["size"],
+                dats_file["sha256"],
+                fields["title"],
+                to_sql_value(fields["privacy"]),
+                fields["provider"],
+                dats_file["dats"],
+            ),
+        )
+        for table in CHILD_TABLES:
+            rows = fields[table]
+            if not rows:
+                continue
+            placeholders = ", ".join("?" * (len(rows[0]) + 1))
+            self.connection.executemany(
+                f"INSERT INTO {table} VALUES ({placeholders})",
+                [(path, *row) for row in rows],
+            )
+        return 1
+
+    def _delete(self, path):
+        self.connection.execute("DELETE FROM datasets WHERE path = ?", (path,))
+        for table in CHILD_TABLES:
+            self.connection.execute(f"DELETE FROM {table} WHERE path = ?", (path,))
+
+    def query(self, sql, parameters=()):
+        """
+        Runs a SQL query on the index.
+
+        :return: list of sqlite3.Row
+         :rtype: list
+        """
+
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def datasets(self, top_level=None):
+        """
+        Returns the indexed datasets ordered by path.
+
+        :param top_level: True for the datasets of the projects directory only, False for the
+                          nested subdatasets only, None for all of them
+         :type top_level: bool
+
+        :return: list of sqlite3.Row with the columns of the datasets table
+         :rtype: list
+        """
+
+        if top_level is None:
+            return self.query("SELECT * FROM datasets ORDER BY path")
+        return self.query(
+            "SELECT * FROM datasets WHERE top_level = ? ORDER BY path",
+            (int(top_level),),
+        )
+
+    def dats(self, top_level=None):
+        """
+        Returns the content of the indexed DATS.json files ordered by dataset path.
+
+        :return: list of dictionaries with the DATS.json content
+         :rtype: list
+        """
+
+        return [json.loads(row["dats"]) for row in self.datasets(top_level)]
+
+    def dataset(self, path):
+        return first(
+            self.query(
+                "SELECT * FROM datasets WHERE path = ?",
+                (os.path.normpath(path),),
+            ),
+        )
+
+    def distributions(self, path):
+        """
+        :return: list of dictionaries with the landing_page, size, unit and the list of
+                 authorizations (None when missing) of each distribution of the dataset
+         :rtype: list
+        """
+
+        rows = self.query(
+            "SELECT * FROM distributions WHERE path = ? ORDER BY position",
+            (os.path.normpath(path),),
+        )
+        return [
+            {
+                "landing_page": row["landing_page"],
+                "size": row["size"],
+                "unit": row["unit"],
+                "authorizations": json.loads(row["authorizations"])
+                if row["authorizations"] is not None
+                else None,
+            }
+            for row in rows
+        ]
+
+    def extra_properties(self, path):
+        """
+        :return: dictionary with the list of values of each extraProperties category
+         :rtype: dict
+        """
+
+        properties = {}
+        for row in self.query(
+            "SELECT category, value FROM extra_properties WHERE path = ? "
+            "ORDER BY rowid",
+            (os.path.normpath(path),),
+        ):
+            properties.setdefault(row["category"], []).append(row["value"])
+        return properties
+
+    def creators(self, path):
+        """
+        :return: list of dictionaries with the name and the list of roles of each creator
+         :rtype: list
+        """
+
+        return [
+            {"name": row["name"], "roles": json.loads(row["roles"])}
+            for row in self.query(
+                "SELECT name, roles FROM creators WHERE path = ? ORDER BY position",
+                (os.path.normpath(path),),
+            )
+        ]
+
+    def values(self, prop, path=None):
+        """
+        Returns the values of a list property (keywords, formats, licenses, types, is_about).
+
+        :param prop: name of the property
+         :type prop: str
+        :param path: path of a dataset, None for the values of every dataset
+         :type path: str
+
+        :return: list of the values, ordered by dataset path
+         :rtype: list
+        """
+
+        if path is None:
+            rows = self.query(
+                "SELECT value FROM dataset_values WHERE property = ? "
+                "ORDER BY path, position",
+                (prop,),
+            )
+        else:
+            rows = self.query(
+                "SELECT value FROM dataset_values WHERE property = ? AND path = ? "
+                "ORDER BY position",
+                (prop, os.path.normpath(path)),
+            )
+        return [row["value"] for row in rows]
+
+    def close(self):
+        self.connection.close()
+
+
+@functools.lru_cache(maxsize=None)
+def get_catalog_index(conp_dataset_dir):
+    """
+    Returns the refreshed index of a conp-dataset directory, shared within a process.
+
+    :param conp_dataset_dir: path to the conp-dataset directory
+     :type conp_dataset_dir: str
+
+    :return: the catalog index
+     :rtype: CatalogIndex
+    """
+
+    index = CatalogIndex(conp_dataset_dir)
+    index.refresh()
+    return index
@@ -1,22 +1,41 @@
+import hashlib
 import json
 import logging
 import os
-from collections import Counter
-from copy import deepcopy
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", ".."))
+from scripts.catalog_index import get_catalog_index  # noqa: E402
+
 
 logger = logging.getLogger(__name__)
 
 
 CONP_DATASET_ROOT_DIR = os.path.abspath(os.path.join(__file__, "../../.."))
-# conp-dataset/projects
-PROJECTS_DIR = os.path.join(CONP_DATASET_ROOT_DIR, "projects")
 CURRENT_WORKING_DIR = os.path.dirname(os.path.realpath(__file__))
 
 # More about NIF API endpoints https://neuinfo.org/about/webservices
 NIF_API_URL = "https://scicrunch.org/api/1/ilx/search/term/"
+# Concurrent requests and maximum number of requests per second sent to the NIF API
+NIF_API_WORKERS = 8
+NIF_API_RATE_LIMIT = float(os.getenv("CONP_NIF_API_RATE_LIMIT", "5"))
+
+# On-disk cache of the InterLex URIs of the terms, entries expire after 30 days
+TERM_CACHE_PATH = os.getenv(
+    "CONP_TERM_CACHE",
+    os.path.join(
+        os.path.expanduser("~"),
+        ".cache",
+        "conp-dataset",
+        "interlex-terms.json",
+    ),
+)
+TERM_CACHE_TTL = int(os.getenv("CONP_TERM_CACHE_TTL", 30 * 24 * 60 * 60))
 
 # Load JSON-LD template
 with open("template.jsonld", encoding="utf-8") as template_file:
@@ -28,11 +47,12 @@ with open("api_key.json", encoding="utf-8") as api_key_file:
     API_KEY = json.load(api_key_file)["api_key"]
 
 
-def get_api_response(term):
+def get_api_response(term, rate_limiter=None):
     """
     Call NIF API and retrieve InterLex URI for a term.
     :param term: string with the term to send to the API
-    :return: string Interlex URI
+    :param rate_limiter: RateLimiter shared by the concurrent calls, if any
+    :return: string Interlex URI, None if the API call failed
     """
 
     # API Key must be provided
@@ -43,9 +63,12 @@ def get_api_response(term):
 
     try:
         api_key = f"?key={API_KEY}"
+        if rate_limiter is not None:
+            rate_limiter.wait()
         r = requests.get(
             NIF_API_URL + term + api_key,
             headers={"accept": "application/json"},
+            timeout=30,
         )
         r.raise_for_status()
         response = json.loads(r.content.decode("utf-8"))
@@ -61,10 +84,101 @@ def get_api_response(term):
             match = "no match found"
         return match
 
-    except requests.exceptions.HTTPError as e:
+    except requests.exceptions.RequestException as e:
         logger.error(f"Error: {e}")
 
 
+class RateLimiter:
+    """
+    Spaces the calls of several threads to at most `rate` calls per second.
+    """
+
+    def __init__(self, rate=NIF_API_RATE_LIMIT):
+        self.interval = 1 / rate if rate > 0 else 0
+        self.lock = threading.Lock()
+        self.next_call = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class TermCache:
+    """
+    On-disk cache of the InterLex URIs of the terms, shared across runs.
+    Entries are stored as JSON {term: {"uri": str, "checked": timestamp}}
+    and expire after `ttl` seconds.
+    """
+
+    def __init__(self, path=TERM_CACHE_PATH, ttl=TERM_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        try:
+            with open(path, encoding="utf-8") as cache_file:
+                self.entries = json.load(cache_file)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, term, now=None):
+        """
+        :return: the cached URI of the term, None if unknown or expired
+        """
+        entry = self.entries.get(term)
+        now = time.time() if now is None else now
+        if entry is None or now - entry["checked"] > self.ttl:
+            return None
+        return entry["uri"]
+
+    def set(self, term, uri, now=None):
+        self.entries[term] = {
+            "uri": uri,
+            "checked": time.time() if now is None else now,
+        }
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as cache_file:
+            json.dump(self.entries, cache_file, indent=4, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def resolve_terms(terms, cache=None, api_call=get_api_response):
+    """
+    Retrieve the InterLex URI of each unique term. Only the terms missing from the cache
+    are sent to the API, concurrently and under the NIF API rate limit.
+    :param terms: iterable of lowercased terms, possibly repeated
+    :param cache: TermCache, defaults to the one at TERM_CACHE_PATH
+    :param api_call: function called with a term and a RateLimiter to retrieve its URI
+    :return: dict with the InterLex URI of each term
+    """
+    cache = TermCache() if cache is None else cache
+    uris = {term: cache.get(term) for term in set(terms)}
+    missing = sorted(term for term, uri in uris.items() if uri is None)
+
+    if missing:
+        rate_limiter = RateLimiter()
+        with ThreadPoolExecutor(max_workers=NIF_API_WORKERS) as executor:
+            for term, uri in zip(
+                missing,
+                executor.map(lambda term: api_call(term, rate_limiter), missing),
+            ):
+                uris[term] = uri
+                # failed calls are not cached so they are retried on the next run
+                if uri is not None:
+                    cache.set(term, uri)
+        cache.save()
+
+    print(f"Terms resolved: {len(uris)} ({len(missing)} sent to the NIF API)")
+    return uris
+
+
 def collect_values(
     privacy=True,
     types=True,
@@ -74,85 +188,36 @@ def collect_values(
     keywords=True,
 ):
     """
-    Iterates over the projects directory content retrieving DATS file for each project.
+    Queries the catalog index of the DATS files of the projects directory.
     Aggregates all values and their count for selected properties in the report object.
     :param : set to False in order to exclude the property from the final report
     :return: dict object report, int how many DATS files were processed
     """
 
-    # Text values to collect
-    privacy_values = set()
-    licenses_values = set()
-    types_datatype_values = set()
-    is_about_values = set()
-    distributions_formats = set()
-    keywords_values = set()
-
-    dats_files_count = 0
-
-    # Access DATS.json in each project's root directory
-    for path, _, files in os.walk(PROJECTS_DIR):
-        if "DATS.json" in files:
-            dats_files_count += 1
-            dats_file = os.path.join(path, "DATS.json")
-            with open(dats_file, encoding="utf-8") as json_file:
-                dats_data = json.load(json_file)
-
-                # privacy is not required
-                if privacy and "privacy" in dats_data:
-                    privacy_values.add(dats_data["privacy"])
-
-                if types:
-                    # types are required
-                    for typ in dats_data["types"]:
-                        # types takes four possible datatype schemas
-                        datatype_schemas = [
-                            "information",
-                            "method",
-                            "platform",
-                            "instrument",
-                        ]
-                        types_datatype_values.update(
-                            {typ[t]["value"] for t in datatype_schemas if t in typ},
-                        )
-
-                if licenses:
-                    # licenses is required
-                    licenses_values.update(
-                        {licence["name"] for licence in dats_data["licenses"]},
-                    )
-
-                # isAbout is not required
-                if is_about and "isAbout" in dats_data:
-                    for each_is_about in dats_data["isAbout"]:
-                        if "name" in each_is_about:
-                            is_about_values.add(each_is_about["name"])
-                        elif "value" in each_is_about:
-                            is_about_values.add(each_is_about["value"])
-                        else:
-                            pass
-
-                # distributions is required
-                if formats:
-                    for dist in dats_data["distributions"]:
-                        if "formats" in dist:
-                            distributions_formats.update({f for f in dist["formats"]})
-
-                if keywords:
-                    keywords_values.update({k["value"] for k in dats_data["keywords"]})
+    # Every DATS.json of the projects directory and of the subdatasets declared in the
+    # .gitmodules files, parsed in parallel by the catalog index
+    index = get_catalog_index(CONP_DATASET_ROOT_DIR)
+    dats_files_count = len(index.datasets())
 
-    report = {}
-    for key, value in zip(
-        ["privacy", "licenses", "types", "is_about", "formats", "keywords"],
-        [
-            privacy_values,
-            licenses_values,
-            types_datatype_values,
-            is_about_values,
-            distributions_formats,
-            keywords_values,
-        ],
+    # Merge the values of every selected property in a single pass over the index
+    selected = {
+        "privacy": privacy,
+        "licenses": licenses,
+        "types": types,
+        "is_about": is_about,
+        "formats": formats,
+        "keywords": keywords,
+    }
+    values = {prop: set() for prop in selected}
+    for row in index.query(
+        "SELECT property, value FROM dataset_values "
+        "UNION ALL SELECT 'privacy', privacy FROM datasets",
     ):
+        if selected[row["property"]] and row["value"] is not None:
+            values[row["property"]].add(row["value"])
+
+    report = {}
+    for key, value in values.items():
         if value:
             report[key] = {
                 "count": len(value),
@@ -187,32 +252,111 @@ def find_duplicates(report):
     return errors
 
 
-def generate_jsonld_files(report, use_api=True):
+def build_jsonld_documents(report, uris=None):
     """
-    Generates a JSON-LD file for each unique term.
-    Files are saved to the directories respective to their properties.
+    Builds the JSON-LD document of each unique term in memory.
     :param report: json object returned by collect_values()
-    :param use_api: defaults to True; if False then NIF API won't be called for InterLex match
+    :param uris: dict with the InterLex URI of each lowercased term, if any
+    :return: dict with the JSON-LD document of each file path, relative to the output directory
     """
-    terms_counter = Counter()
+    documents = {}
     for key, value in report.items():
         for term in value["values"]:
-            terms_counter.update((term.lower(),))
-            jsonld_description = deepcopy(JSONLD_TEMPLATE)
-            jsonld_description["label"] = f"{term.lower()}"
-            if use_api:
-                # Get NIF API matching URI
-                jsonld_description["sameAs"] = get_api_response(term.lower())
-            # Create a folder for each text value type (e.g. privacy, licenses, etc.)
-            if not os.path.exists(os.path.join(CURRENT_WORKING_DIR, key)):
-                os.makedirs(os.path.join(CURRENT_WORKING_DIR, key))
+            label = term.lower()
+            document = {**JSONLD_TEMPLATE, "label": label}
+            if uris is not None:
+                document["sameAs"] = uris[label]
             filename = "".join(x for x in term.title().replace(" ", "") if x.isalnum())
-            # Create and save JSON-LD file in the respective folder
-            with open(
-                f"{os.path.join(CURRENT_WORKING_DIR, key, filename)}.jsonld",
-                "w",
-                encoding="utf-8",
-            ) as jldfile:
-                json.dump(jsonld_description, jldfile, indent=4, ensure_ascii=False)
-    print(f"JSON-LD files created: {len(terms_counter.keys())}")
-    return
+            documents[os.path.join(key, f"{filename}.jsonld")] = document
+    return documents
+
+
+def write_if_changed(path, content):
+    """
+    Writes a file unless it already holds the same content.
+    :param path: path of the file
+    :param content: string to write
+    :return: True if the file was written, False if its content was unchanged
+    """
+    data = content.encode("utf-8")
+    try:
+        with open(path, "rb") as existing_file:
+            if (
+                hashlib.sha256(existing_file.read()).digest()
+                == hashlib.sha256(data).digest()
+            ):
+                return False
+    except FileNotFoundError:
+        pass
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as jldfile:
+        jldfile.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+def to_jsonld_graph(documents):
+    """
+    Consolidates the JSON-LD documents of the terms into a single graph sharing the
+    template context.
+    :param documents: dict returned by build_jsonld_documents()
+    :return: JSON-LD document with an @graph of the terms
+    """
+    context = JSONLD_TEMPLATE["@context"]
+    graph = []
+    for path in sorted(documents):
+        node = {k: v for k, v in documents[path].items() if k != "@context"}
+        graph.append(node)
+    return {"@context": context, "@graph": graph}
+
+
+def generate_jsonld_files(
+    report,
+    use_api=True,
+    output_dir=CURRENT_WORKING_DIR,
+    graph_path=None,
+):
+    """
+    Generates a JSON-LD file for each unique term.
+    Files are saved to the directories respective to their properties, and are only
+    rewritten when their content changed.
+    :param report: json object returned by collect_values()
+    :param use_api: defaults to True; if False then NIF API won't be called for InterLex match
+    :param output_dir: directory containing the directories of the properties
+    :param graph_path: if set, a single JSON-LD graph of all the terms is saved to this
+                       path instead of one file per term
+    """
+    uris = None
+    if use_api:
+        # Get NIF API matching URIs, each term is looked up once
+        uris = resolve_terms(
+            term.lower() for value in report.values() for term in value["values"]
+        )
+    documents = build_jsonld_documents(report, uris)
+
+    if graph_path is not None:
+        written = write_if_changed(
+            graph_path,
+            json.dumps(to_jsonld_graph(documents), indent=4, ensure_ascii=False),
+        )
+        print(
+            f"JSON-LD graph of {len(documents)} terms "
+            f"{'saved to' if written else 'unchanged in'} {graph_path}",
+        )
+        return
+
+    # Create a folder for each text value type (e.g. privacy, licenses, etc.)
+    for key in report:
+        os.makedirs(os.path.join(output_dir, key), exist_ok=True)
+
+    written = 0
+    for path, document in documents.items():
+        written += write_if_changed(
+            os.path.join(output_dir, path),
+            json.dumps(document, indent=4, ensure_ascii=False),
+        )
+    print(
+        f"JSON-LD files created or updated: {written} "
+        f"({len(documents) - written} unchanged)",
+    )
@@ -18,6 +18,7 @@ def main(argv):
             "formats=",
             "keywords=",
             "use_api=",
+            "graph=",
             "help",
         ],
     )
@@ -31,6 +32,7 @@ def main(argv):
         keywords=True,
     )
     use_api = True
+    graph_path = None
 
     for opt, arg in opts:
         opt_properties = [
@@ -45,6 +47,8 @@ def main(argv):
             options[opt.replace("--", "")] = False
         elif opt == "--use_api" and arg == "False":
             use_api = False
+        elif opt == "--graph":
+            graph_path = arg
         else:
             help_info()
             exit()
@@ -65,14 +69,15 @@ def main(argv):
     )
     print(f"DATS files processed: {dats_files_count}")
 
-    generate_jsonld_files(report=report, use_api=use_api)
+    generate_jsonld_files(report=report, use_api=use_api, graph_path=graph_path)
 
 
 def help_info():
     print(
         "Usage:"
         "python jsonld_generator.py [--privacy=False --types=False --licenses=False "
-        "--is_about= --formats=False --keywords=False --use_api=False --help]",
+        "--is_about= --formats=False --keywords=False --use_api=False "
+        "--graph=<path> --help]",
     )
 
 
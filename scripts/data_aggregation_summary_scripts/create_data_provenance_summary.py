@@ -1,10 +1,12 @@
 import csv
 import datetime
 import getopt
-import json
 import os
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", ".."))
+from scripts.catalog_index import get_catalog_index  # noqa: E402
+
 
 def main(argv):
 
@@ -63,7 +65,7 @@ def parse_input(argv):
 
 def read_conp_dataset_dir(conp_dataset_dir):
 
-    dataset_dirs_list = os.listdir(conp_dataset_dir + "/projects")
+    index = get_catalog_index(conp_dataset_dir)
 
     csv_content = [
         [
@@ -77,76 +79,31 @@ def read_conp_dataset_dir(conp_dataset_dir):
         ],
     ]
 
-    for dataset in dataset_dirs_list:
-        if dataset in [".touchfile", ".DS_Store"]:
-            continue
-        dats_path = conp_dataset_dir + "/projects/" + dataset + "/DATS.json"
-        if not (os.path.exists(dats_path)):
-            subdataset_content_list = look_for_dats_file_in_subfolders(
-                conp_dataset_dir,
-                dataset,
-            )
-            csv_content.extend(subdataset_content_list)
-            continue
-
-        parsed_result = parse_dats_json_file(dats_path)
-        csv_content.append(parsed_result)
+    for dataset in index.datasets(top_level=True):
+        csv_content.append(parse_dataset_provenance(index, dataset))
 
     return csv_content
 
 
-def look_for_dats_file_in_subfolders(conp_dataset_dir, dataset):
-
-    subdataset_dirs_list = os.listdir(conp_dataset_dir + "/projects/" + dataset)
-
-    subdataset_content = []
-
-    for subdataset in subdataset_dirs_list:
-        dats_path = (
-            conp_dataset_dir + "/projects/" + dataset + "/" + subdataset + "/DATS.json"
-        )
-        parsed_result = parse_dats_json_file(dats_path)
-        subdataset_content.append(parsed_result)
-
-    return subdataset_content
+def parse_dataset_provenance(index, dataset):
 
+    values_dict = {
+        category: ", ".join(str(value) for value in values)
+        for category, values in index.extra_properties(dataset["path"]).items()
+    }
 
-def parse_dats_json_file(dats_path):
-
-    print(dats_path)
-
-    with open(dats_path, encoding="utf8") as dats_file:
-        dats_dict = json.loads(dats_file.read())
-
-    extra_properties = dats_dict["extraProperties"]
-    values_dict = {}
-    for extra_property in extra_properties:
-        values_dict[extra_property["category"]] = ", ".join(
-            str(value) for value in [exp["value"] for exp in extra_property["values"]]
-        )
-
-    creators = dats_dict["creators"]
-    for creator in creators:
-        if "roles" in creator.keys():
-            for role in creator["roles"]:
-                if (
-                    role["value"] == "Principal Investigator"
-                    and "name" in creator.keys()
-                ):
-                    values_dict["principal_investigator"] = creator["name"]
+    for creator in index.creators(dataset["path"]):
+        if "Principal Investigator" in creator["roles"] and creator["name"]:
+            values_dict["principal_investigator"] = creator["name"]
 
     return [
-        dats_dict["title"],
-        values_dict["principal_investigator"]
-        if "principal_investigator" in values_dict
-        else "",
-        values_dict["origin_consortium"] if "origin_consortium" in values_dict else "",
-        values_dict["origin_institution"]
-        if "origin_institution" in values_dict
-        else "",
-        values_dict["origin_city"] if "origin_city" in values_dict else "",
-        values_dict["origin_province"] if "origin_province" in values_dict else "",
-        values_dict["origin_country"] if "origin_country" in values_dict else "",
+        dataset["title"],
+        values_dict.get("principal_investigator", ""),
+        values_dict.get("origin_consortium", ""),
+        values_dict.get("origin_institution", ""),
+        values_dict.get("origin_city", ""),
+        values_dict.get("origin_province", ""),
+        values_dict.get("origin_country", ""),
     ]
 
 
@@ -3,6 +3,7 @@ import getopt
 import os
 import sys
 
+import lib.Statistics as Statistics
 import lib.Utility as Utility
 
 
@@ -15,33 +16,12 @@ def main(argv):
     # directory present in ~
     tool_descriptor_list = Utility.read_boutiques_cached_dir(tools_json_dir_path)
 
-    # digest the content of the DATS.json files into a summary of variables of interest
-    tools_summary_dict = {}
-    i = 0
-    for tool in tool_descriptor_list:
-        tools_summary_dict[i] = parse_json_information(tool)
-        i += 1
+    # digest the content of the JSON descriptors into a table of variables of interest
+    tools = Statistics.read_tool_table(tool_descriptor_list)
 
     # create the summary statistics of the variables of interest organized per
-    # domain of application
-    csv_content = [
-        [
-            "Domain of Application",
-            "Number Of Tools",
-            "Containers",
-            "Execution Capacity",
-        ],
-    ]
-    for field in [
-        "Neuroinformatics",
-        "Bioinformatics",
-        "MRI",
-        "EEG",
-        "Connectome",
-        "BIDS-App",
-    ]:
-        summary_list = get_stats_per_domain(tools_summary_dict, field)
-        csv_content.append(summary_list)
+    # domain of application found in the tags of the tools
+    csv_content = Statistics.to_csv_content(Statistics.get_stats_per_domain(tools))
 
     # write the summary statistics into a CSV file
     Utility.write_csv_file("tools_summary_statistics_per_domain", csv_content)
@@ -63,7 +43,7 @@ def parse_input(argv):
     description = (
         "\nThis tool facilitates the creation of tools summary statistics per domain of application for "
         "reporting purposes. It will read Boutiques's JSON files and print out a summary per domain based "
-        "on the following list of tags: \nNeuroinformatics, Bioinformatics, MRI, EEG, Connectome, BIDS-App.\n"
+        "on the domain tags of the tools, e.g. Neuroinformatics, MRI, EEG, and on BIDS-App.\n"
     )
     usage = (
         "\n"
@@ -104,90 +84,5 @@ def parse_input(argv):
     return tools_dir_path
 
 
-def parse_json_information(json_dict):
-    """
-    Parse the content of the JSON dictionary and grep the variables of interest for the summary statistics.
-
-    :param json_dict: dictionary with the content of a tool JSON descriptor file
-     :type json_dict: dict
-
-    :return: dictionary with the variables of interest to use to produce the
-             summary statistics
-     :rtype: dict
-    """
-    tool_summary_dict = {
-        "title": json_dict["name"],
-        "container_type": None,
-        "domain": None,
-        "online_platform_urls": None,
-    }
-
-    if "container-image" in json_dict and "type" in json_dict["container-image"]:
-        tool_summary_dict["container_type"] = json_dict["container-image"]["type"]
-
-    if "tags" in json_dict and "domain" in json_dict["tags"]:
-        tool_summary_dict["domain"] = [x.lower() for x in json_dict["tags"]["domain"]]
-
-    if "online-platform-urls" in json_dict:
-        tool_summary_dict["online_platform_urls"] = json_dict["online-platform-urls"]
-
-    return tool_summary_dict
-
-
-def get_stats_per_domain(tool_summary_dict, domain):
-    """
-    Produce a summary statistics per domain (Neuroinformatics, Bioinformatics, MRI, EEG...) of the identified variables of interest.  # noqa: E501.
-
-    :param tool_summary_dict: dictionary with the variables of interest for the summary
-     :type tool_summary_dict: dict
-    :param domain           : name of the domain of application
-     :type domain           : str
-
-    :return: list with the summary statistics on the variables for the domain of application
-     :rtype: list
-    """
-    container = {
-        "docker": 0,
-        "singularity": 0,
-    }
-    number_of_tools = 0
-    number_of_cbrain_tools = 0
-
-    for index in tool_summary_dict:
-
-        tool_dict = tool_summary_dict[index]
-
-        if not tool_dict["domain"]:
-            continue
-
-        if domain.lower() not in tool_dict["domain"] and domain != "BIDS-App":
-            continue
-
-        if domain == "BIDS-App" and "bids app" not in tool_dict["title"].lower():
-            continue
-
-        number_of_tools += 1
-
-        if tool_dict["container_type"] == "docker":
-            container["docker"] += 1
-        elif tool_dict["container_type"] == "singularity":
-            container["singularity"] += 1
-
-        print(tool_dict["online_platform_urls"])
-
-        if (
-            tool_dict["online_platform_urls"]
-            and "https://portal.cbrain.mcgill.ca" in tool_dict["online_platform_urls"]
-        ):
-            number_of_cbrain_tools += 1
-
-    return [
-        domain,
-        str(number_of_tools),
-        f'Docker ({str(container["docker"])}); Singularity ({str(container["singularity"])})',  # noqa: E702
-        "CBRAIN (" + str(number_of_cbrain_tools) + ")",
-    ]
-
-
 if __name__ == "__main__":
     main(sys.argv[1:])
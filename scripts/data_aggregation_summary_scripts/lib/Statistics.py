@@ -0,0 +1,336 @@
+import json
+from urllib.parse import urlparse
+
+import pandas as pd
+
+
+# size of each DATS size unit in GB
+SIZE_UNITS_IN_GB = {
+    "b": 1 / pow(1024, 3),
+    "kb": 1 / pow(1024, 2),
+    "mb": 1 / 1024,
+    "gb": 1,
+    "tb": 1024,
+    "pb": pow(1024, 2),
+}
+
+# keyword present in every dataset, excluded from the keywords describing the data
+CONP_KEYWORD = "canadian-open-neuroscience-platform"
+
+# authorizations of the datasets requiring to log in to the data provider
+LOGIN_AUTHORIZATIONS = ["private", "restricted"]
+
+CBRAIN_URL = "https://portal.cbrain.mcgill.ca"
+
+# data providers reported, keyed by the name found in the host of their landing pages
+DATA_PROVIDERS = {
+    "braincode": "braincode",
+    "frdr": "frdr",
+    "loris": "loris",
+    "osf": "osf",
+    "zenodo": "zenodo",
+}
+
+# domains of application reported, BIDS-App gathers the BIDS apps of every domain
+DOMAINS = ["Neuroinformatics", "Bioinformatics", "MRI", "EEG", "Connectome"]
+BIDS_APP_DOMAIN = "BIDS-App"
+
+
+def get_data_provider(landing_page):
+    """
+    Finds the data provider of a landing page from its host,
+    e.g. https://zenodo.org/record/1 -> zenodo, https://x.loris.ca -> loris
+
+    :param landing_page: URL of the landing page of a dataset
+     :type landing_page: str
+
+    :return: name of the data provider, unknown if not in DATA_PROVIDERS
+     :rtype: str
+    """
+
+    if not landing_page:
+        return "unknown"
+
+    host = (urlparse(landing_page).hostname or landing_page).lower()
+    for name, data_provider in DATA_PROVIDERS.items():
+        if name in host:
+            return data_provider
+    return "unknown"
+
+
+def get_authorization(authorizations):
+    """
+    Returns the first authorization of the JSON list of a distribution, unknown if
+    there is none.
+    """
+
+    values = json.loads(authorizations) if isinstance(authorizations, str) else None
+    return values[0] if values else "unknown"
+
+
+def read_dataset_table(index):
+    """
+    Reads the variables of interest of every dataset of the catalog index into a
+    table with one row per dataset.
+
+    :param index: catalog index of the conp-dataset directory
+     :type index: scripts.catalog_index.CatalogIndex
+
+    :return: table with the title, data_provider, authorization, size_in_gb,
+             number_of_files and keywords (list) columns
+     :rtype: pandas.DataFrame
+    """
+
+    rows = index.query(
+        """
+        SELECT datasets.path, datasets.title, distributions.landing_page,
+               distributions.authorizations, distributions.size, distributions.unit,
+               extra_properties.value AS number_of_files
+        FROM datasets
+        LEFT JOIN distributions
+            ON distributions.path = datasets.path AND distributions.position = 0
+        LEFT JOIN extra_properties
+            ON extra_properties.path = datasets.path
+            AND extra_properties.category = 'files'
+            AND extra_properties.position = 0
+        WHERE datasets.top_level = 1
+        ORDER BY datasets.path
+        """,
+    )
+    keywords = index.query(
+        "SELECT path, value FROM dataset_values WHERE property = 'keywords' "
+        "ORDER BY path, position",
+    )
+
+    datasets = pd.DataFrame(
+        [dict(row) for row in rows],
+        columns=[
+            "path",
+            "title",
+            "landing_page",
+            "authorizations",
+            "size",
+            "unit",
+            "number_of_files",
+        ],
+    )
+    keywords = pd.DataFrame([dict(row) for row in keywords], columns=["path", "value"])
+
+    datasets["data_provider"] = datasets["landing_page"].map(get_data_provider)
+    datasets["authorization"] = datasets["authorizations"].map(get_authorization)
+    datasets["size_in_gb"] = pd.to_numeric(
+        datasets["size"],
+        errors="coerce",
+    ) * datasets["unit"].str.lower().map(SIZE_UNITS_IN_GB)
+    datasets["number_of_files"] = pd.to_numeric(
+        datasets["number_of_files"].astype(str).str.replace(",", "", regex=False),
+        errors="coerce",
+    )
+    datasets["keywords"] = (
+        datasets["path"]
+        .map(keywords.groupby("path")["value"].agg(list))
+        .apply(lambda values: values if isinstance(values, list) else [])
+    )
+
+    return datasets[
+        [
+            "title",
+            "data_provider",
+            "authorization",
+            "size_in_gb",
+            "number_of_files",
+            "keywords",
+        ]
+    ]
+
+
+def get_stats_per_data_provider(datasets):
+    """
+    Produces the summary statistics of every data provider in a single group-by.
+
+    :param datasets: table returned by read_dataset_table
+     :type datasets: pandas.DataFrame
+
+    :return: table with one row per data provider of DATA_PROVIDERS, including those
+             without any dataset
+     :rtype: pandas.DataFrame
+    """
+
+    datasets = datasets.assign(
+        requires_login=datasets["authorization"].str.lower().isin(LOGIN_AUTHORIZATIONS),
+    )
+    keywords = (
+        explode_keywords(datasets)
+        .groupby("data_provider")["keyword"]
+        .agg(
+            lambda values: ", ".join(values.drop_duplicates()),
+        )
+    )
+
+    stats = (
+        datasets.groupby("data_provider")
+        .agg(
+            number_of_datasets=("title", "size"),
+            requires_login=("requires_login", "sum"),
+            number_of_files=("number_of_files", "sum"),
+            size_in_gb=("size_in_gb", "sum"),
+        )
+        .reindex(sorted(set(DATA_PROVIDERS.values())), fill_value=0)
+    )
+
+    return pd.DataFrame(
+        {
+            "Data Provider": stats.index,
+            "Number Of Datasets": stats["number_of_datasets"].astype(int).values,
+            "Number Of Datasets Requiring Authentication": stats["requires_login"]
+            .astype(int)
+            .values,
+            "Total Number Of Files": stats["number_of_files"].astype(int).values,
+            "Total Size (GB)": stats["size_in_gb"].round().astype(int).values,
+            "Keywords Describing The Data": keywords.reindex(stats.index)
+            .fillna("")
+            .values,
+        },
+    )
+
+
+def get_stats_per_keyword(datasets):
+    """
+    Produces the number of datasets and the data providers of every keyword.
+
+    :param datasets: table returned by read_dataset_table
+     :type datasets: pandas.DataFrame
+
+    :return: table with one row per keyword, sorted by decreasing number of datasets
+     :rtype: pandas.DataFrame
+    """
+
+    keywords = explode_keywords(datasets).drop_duplicates(["title", "keyword"])
+    stats = keywords.groupby("keyword").agg(
+        number_of_datasets=("title", "size"),
+        data_providers=(
+            "data_provider",
+            lambda values: ", ".join(sorted(values.unique())),
+        ),
+    )
+    stats = stats.sort_values("number_of_datasets", ascending=False, kind="stable")
+
+    return pd.DataFrame(
+        {
+            "Keyword": stats.index,
+            "Number Of Datasets": stats["number_of_datasets"].values,
+            "Data Providers": stats["data_providers"].values,
+        },
+    )
+
+
+def explode_keywords(datasets):
+    """Returns one row per (dataset, keyword), without the CONP keyword."""
+
+    keywords = (
+        datasets[["title", "data_provider", "keywords"]]
+        .explode("keywords")
+        .rename(columns={"keywords": "keyword"})
+        .dropna(subset=["keyword"])
+    )
+    return keywords[keywords["keyword"] != CONP_KEYWORD]
+
+
+def read_tool_table(tool_descriptor_list):
+    """
+    Reads the variables of interest of the Boutiques descriptors into a table with one
+    row per tool.
+
+    :param tool_descriptor_list: list of Boutiques' JSON descriptor contents
+     :type tool_descriptor_list: list
+
+    :return: table with the title, container_type, domain (list), bids_app and cbrain columns
+     :rtype: pandas.DataFrame
+    """
+
+    tools = pd.DataFrame(
+        {
+            "title": [tool["name"] for tool in tool_descriptor_list],
+            "container_type": [
+                tool.get("container-image", {}).get("type")
+                for tool in tool_descriptor_list
+            ],
+            "domain": [
+                tool.get("tags", {}).get("domain") or []
+                for tool in tool_descriptor_list
+            ],
+            "cbrain": [
+                CBRAIN_URL in (tool.get("online-platform-urls") or [])
+                for tool in tool_descriptor_list
+            ],
+        },
+    )
+    tools["bids_app"] = tools["title"].str.lower().str.contains("bids app", regex=False)
+    return tools
+
+
+def get_stats_per_domain(tools):
+    """
+    Produces the summary statistics of every domain of application in a single group-by.
+    BIDS apps, recognized by their name among the tools with a domain, are summarized
+    as the BIDS-App domain.
+
+    :param tools: table returned by read_tool_table
+     :type tools: pandas.DataFrame
+
+    :return: table with one row per domain of DOMAINS followed by BIDS-App, including
+             those without any tool
+     :rtype: pandas.DataFrame
+    """
+
+    domains = tools.explode("domain").dropna(subset=["domain"])
+    # the domain tags are matched regardless of their case
+    domains = domains.assign(key=domains["domain"].str.lower())
+    bids_apps = domains[domains["bids_app"]].drop_duplicates("title")
+    domains = pd.concat(
+        [
+            domains.drop_duplicates(["title", "key"]),
+            bids_apps.assign(key=BIDS_APP_DOMAIN.lower()),
+        ],
+    )
+
+    reported = DOMAINS + [BIDS_APP_DOMAIN]
+    stats = (
+        domains.groupby("key")
+        .agg(
+            number_of_tools=("title", "size"),
+            docker=("container_type", lambda values: (values == "docker").sum()),
+            singularity=(
+                "container_type",
+                lambda values: (values == "singularity").sum(),
+            ),
+            cbrain=("cbrain", "sum"),
+        )
+        .reindex([domain.lower() for domain in reported], fill_value=0)
+    )
+
+    return pd.DataFrame(
+        {
+            "Domain of Application": reported,
+            "Number Of Tools": stats["number_of_tools"].values,
+            "Containers": [
+                f"Docker ({docker}); Singularity ({singularity})"
+                for docker, singularity in zip(stats["docker"], stats["singularity"])
+            ],
+            "Execution Capacity": [f"CBRAIN ({cbrain})" for cbrain in stats["cbrain"]],
+        },
+    )
+
+
+def to_csv_content(table):
+    """
+    Converts a table into the list of list expected by Utility.write_csv_file.
+
+    :param table: table to convert
+     :type table: pandas.DataFrame
+
+    :return: list with the header followed by one list of strings per row
+     :rtype: list
+    """
+
+    return [list(table.columns)] + table.astype(str).values.tolist()
@@ -2,13 +2,20 @@ import csv
 import datetime
 import json
 import os
+import sys
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", ".."),
+)
+from scripts.catalog_index import get_catalog_index  # noqa: E402
 
 
 def read_conp_dataset_dir(conp_dataset_dir_path):
     """
     Reads the conp-dataset projects directory and return the contents
     of every dataset DATS.json file in a list (one list item = one
-    dataset DATS.json content).
+    dataset DATS.json content). The DATS.json files are read from the
+    catalog index, which only parses the files modified since the last run.
 
     :param conp_dataset_dir_path: path to the conp-dataset directory
      :type conp_dataset_dir_path: str
@@ -18,65 +25,7 @@ def read_conp_dataset_dir(conp_dataset_dir_path):
      :rtype: list
     """
 
-    dataset_dirs_list = os.listdir(conp_dataset_dir_path + "/projects")
-
-    dataset_descriptor_list = []
-
-    for dataset in dataset_dirs_list:
-        if dataset == ".touchfile":
-            continue
-
-        dats_path = conp_dataset_dir_path + "/projects/" + dataset + "/DATS.json"
-        if not (os.path.exists(dats_path)):
-            subdataset_content_list = read_dats_file_from_subdataset_folders(
-                conp_dataset_dir_path,
-                dataset,
-            )
-            dataset_descriptor_list.extend(subdataset_content_list)
-            continue
-
-        print("Reading file: " + dats_path)
-        with open(dats_path) as dats_file:
-            dats_dict = json.loads(dats_file.read())
-            dataset_descriptor_list.append(dats_dict)
-
-    return dataset_descriptor_list
-
-
-def read_dats_file_from_subdataset_folders(conp_dataset_dir_path, dataset_name):
-    """
-    Reads DATS.json files present in the subdataset folder of a dataset_name.
-
-    :param conp_dataset_dir_path: path to the conp-dataset_name directory
-     :type conp_dataset_dir_path: str
-    :param dataset_name         : name of the dataset to look for subdataset's DATS.json files
-     :type dataset_name         : str
-
-    :return: list of dictionaries with subdatasets' DATS.json content
-             (one list item = one subdataset DATS.json content)
-     :rtype: list
-    """
-
-    subdataset_dirs_list = os.listdir(
-        conp_dataset_dir_path + "/projects/" + dataset_name,
-    )
-
-    subdataset_content = []
-
-    for subdataset in subdataset_dirs_list:
-        dats_path = os.path.join(
-            conp_dataset_dir_path,
-            "projects",
-            dataset_name,
-            subdataset,
-            "DATS.json",
-        )
-        print("Reading file: " + dats_path)
-        with open(dats_path) as dats_file:
-            dats_dict = json.loads(dats_file.read())
-            subdataset_content.append(dats_dict)
-
-    return subdataset_content
+    return get_catalog_index(conp_dataset_dir_path).dats(top_level=True)
 
 
 def read_boutiques_cached_dir(tools_json_dir_path):
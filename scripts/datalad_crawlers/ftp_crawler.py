@@ -1,38 +1,126 @@
 import argparse
 import os
+import queue
+import sys
+import time
+from ftplib import all_errors
 from ftplib import FTP
 
-import git
-from tqdm import tqdm
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", ".."))
+from scripts.datalad_crawlers.listing import add_crawl_arguments  # noqa: E402
+from scripts.datalad_crawlers.listing import crawl_tree  # noqa: E402
+from scripts.datalad_crawlers.listing import Entry  # noqa: E402
 
 
-def crawl(host, root, subdir, *, ftp):
-    """
-    Recursively prints the URLs of the files under dir and adds them to git-annex
+# listing saved by the last crawl in incremental mode, relative to the dataset
+LISTING_PATH = ".ftp_crawler_listing.jsonl"
+
+
+class FTPPool:
     """
-    cwd = os.path.join("/", root, subdir)
-    print(f"\nCrawling {cwd}")
+    Pool of logged-in FTP connections to a host, shared by the listing threads.
 
-    for filename, metadata in tqdm(ftp.mlsd(cwd)):
-        filepath = os.path.join(subdir, filename)
+    Connections are opened on first use. A connection that fails is closed and
+    replaced, and the failed call is retried with an exponential backoff.
+    """
 
-        while True:
+    def __init__(self, host, size=8, attempts=5, backoff=1.0):
+        self.host = host
+        self.attempts = attempts
+        self.backoff = backoff
+        self.idle = queue.LifoQueue()
+        # None stands for a connection that is not opened yet
+        for _ in range(size):
+            self.idle.put(None)
+
+    def mlsd(self, path):
+        """
+        Lists a directory, retrying on a new connection on failure.
+
+        :return: list of (name, facts) tuples
+        """
+        for attempt in range(self.attempts):
+            ftp = self.idle.get()
             try:
-                if metadata.get("type") == "dir":
-                    crawl(host, root, filepath, ftp=ftp)
+                if ftp is None:
+                    ftp = FTP(self.host)
+                    ftp.login()
+                entries = list(ftp.mlsd(path))
+            except all_errors as e:
+                if ftp is not None:
+                    ftp.close()
+                self.idle.put(None)
+                if attempt + 1 == self.attempts:
+                    raise
+                delay = self.backoff * 2**attempt
+                print(f"WARNING: Listing {path} failed, retrying in {delay}s: {e}")
+                time.sleep(delay)
+                continue
+            self.idle.put(ftp)
+            return entries
+
+    def close(self):
+        while not self.idle.empty():
+            ftp = self.idle.get()
+            if ftp is not None:
+                try:
+                    ftp.quit()
+                except all_errors:
+                    ftp.close()
+
+
+def ftp_lister(host, root, pool):
+    """
+    Returns the list_dir function of list_tree for a directory of an FTP host.
+    """
 
-                elif metadata.get("type") == "file":
-                    git.Repo().git.annex(
-                        "addurl",
+    def list_dir(subdir):
+        cwd = os.path.join("/", root, subdir)
+        files, subdirs = [], []
+        for filename, facts in pool.mlsd(cwd):
+            filepath = os.path.join(subdir, filename)
+            if facts.get("type") == "dir":
+                subdirs.append(filepath)
+            elif facts.get("type") == "file":
+                files.append(
+                    Entry(
                         f"ftp://{host}/" + os.path.join(cwd, filename),
-                        file=filepath,
-                    )
-                break
-
-            except Exception as e:
-                print(f"WARNING: Connection restarted on file: {filepath}: {e}")
-                ftp.connect()
-                ftp.login()
+                        filepath,
+                        int(facts["size"]) if "size" in facts else None,
+                        facts.get("modify"),
+                    ),
+                )
+        return files, subdirs
+
+    return list_dir
+
+
+def crawl(
+    host,
+    root,
+    subdir,
+    *,
+    jobs=8,
+    listing_path=None,
+    resume=False,
+    incremental=False,
+):
+    """
+    Lists the files under subdir concurrently and adds their URLs to git-annex.
+    """
+    print(f"\nCrawling {os.path.join('/', root, subdir)}")
+    pool = FTPPool(host, size=jobs)
+    try:
+        return crawl_tree(
+            ftp_lister(host, root, pool),
+            subdir,
+            jobs=jobs,
+            listing_path=listing_path,
+            resume=resume,
+            incremental=incremental,
+        )
+    finally:
+        pool.close()
 
 
 def parse_args():
@@ -54,13 +142,24 @@ def parse_args():
     parser.add_argument(
         "sub_directory", nargs="?", type=str, default="", help="Subdirectory to crawl."
     )
+    add_crawl_arguments(parser, LISTING_PATH)
 
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
-
-    with FTP(args.host) as ftp:
-        ftp.login()
-        crawl(args.host, args.directory, args.sub_directory, ftp=ftp)
+    if args.incremental and not args.listing:
+        args.listing = LISTING_PATH
+
+    failed = crawl(
+        args.host,
+        args.directory,
+        args.sub_directory,
+        jobs=args.jobs,
+        listing_path=args.listing,
+        resume=args.resume,
+        incremental=args.incremental,
+    )
+    if failed:
+        sys.exit(f"{len(failed)} files could not be added to git-annex.")
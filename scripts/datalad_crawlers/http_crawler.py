@@ -0,0 +1,251 @@
+import argparse
+import os
+import sys
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import quote
+from urllib.parse import unquote
+from urllib.parse import urljoin
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", ".."))
+from scripts.datalad_crawlers.listing import add_crawl_arguments  # noqa: E402
+from scripts.datalad_crawlers.listing import crawl_tree  # noqa: E402
+from scripts.datalad_crawlers.listing import Entry  # noqa: E402
+
+
+# listing saved by the last crawl in incremental mode, relative to the dataset
+LISTING_PATH = ".http_crawler_listing.jsonl"
+
+TIMEOUT = 60
+
+
+class Sessions(threading.local):
+    """
+    One requests session per listing thread. Failed requests and server errors are
+    retried with an exponential backoff.
+    """
+
+    def __init__(self, attempts=5, backoff=1.0):
+        self.session = requests.Session()
+        retry = Retry(
+            total=attempts,
+            backoff_factor=backoff,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET", "HEAD"],
+        )
+        self.session.mount("http://", HTTPAdapter(max_retries=retry))
+        self.session.mount("https://", HTTPAdapter(max_retries=retry))
+
+
+class LinkParser(HTMLParser):
+    """
+    Collects the href of the links of an HTML page.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href)
+
+
+def autoindex_lister(base_url, head_pool=None, sessions=None):
+    """
+    Returns the list_dir function of list_tree for an HTTP directory index, such as
+    the Apache or nginx autoindex pages.
+
+    Only the links to the children of a directory are followed; the links to its
+    parent, to sort the index or to other sites are ignored. The links are compared
+    by their unquoted path, as the server may encode the names differently, and the
+    URLs of the files are kept as served.
+
+    :param base_url: URL of the root directory of the index
+    :param head_pool: executor sending a HEAD request for each file to capture its
+                      size, Last-Modified and ETag headers, on threads other than the
+                      listing ones; the files are listed without them if None
+    """
+    base_url = base_url if base_url.endswith("/") else base_url + "/"
+    sessions = sessions or Sessions()
+
+    def list_dir(subdir):
+        url = urljoin(base_url, quote(subdir))
+        response = sessions.session.get(url, timeout=TIMEOUT)
+        response.raise_for_status()
+        parser = LinkParser()
+        parser.feed(response.text)
+
+        site = urlsplit(url)
+        prefix = unquote(site.path)
+        files, subdirs = [], []
+        for href in parser.links:
+            target = urljoin(url, href)
+            parts = urlsplit(target)
+            path = unquote(parts.path)
+            if (
+                parts.query
+                or parts.fragment
+                or parts[:2] != site[:2]
+                or not path.startswith(prefix)
+            ):
+                continue
+            name = path[len(prefix) :]
+            if name.endswith("/") and name.count("/") == 1:
+                subdirs.append(subdir + name)
+            elif name and "/" not in name:
+                files.append((target, subdir + name))
+
+        if head_pool is None:
+            return [Entry(*file, None, None) for file in files], subdirs
+        entries = head_pool.map(lambda file: http_entry(sessions.session, *file), files)
+        return list(entries), subdirs
+
+    return list_dir
+
+
+def http_entry(session, url, path):
+    """
+    Returns the Entry of a file of a directory index. A file whose HEAD request
+    fails is listed without its size, Last-Modified and ETag.
+    """
+    try:
+        response = session.head(url, timeout=TIMEOUT, allow_redirects=True)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        print(f"WARNING: HEAD {url} failed, listing it without its headers: {e}")
+        return Entry(url, path, None, None)
+    size = response.headers.get("Content-Length")
+    etag = response.headers.get("ETag")
+    return Entry(
+        url,
+        path,
+        int(size) if size is not None else None,
+        response.headers.get("Last-Modified"),
+        etag.strip('"') if etag is not None else None,
+    )
+
+
+def s3_lister(endpoint, bucket, prefix="", sessions=None):
+    """
+    Returns the list_dir function of list_tree for an S3-compatible bucket, listed
+    with ListObjectsV2. The keys are split on "/" into directories so that the
+    prefixes are listed concurrently.
+
+    :param endpoint: URL of the S3 endpoint, e.g. https://s3.amazonaws.com
+    :param bucket: name of the bucket, which must allow anonymous listing
+    :param prefix: prefix of the keys to crawl
+    """
+    endpoint = endpoint.rstrip("/")
+    prefix = prefix if not prefix or prefix.endswith("/") else prefix + "/"
+    sessions = sessions or Sessions()
+
+    def list_dir(subdir):
+        params = {"list-type": "2", "prefix": prefix + subdir, "delimiter": "/"}
+        files, subdirs = [], []
+        while True:
+            response = sessions.session.get(
+                f"{endpoint}/{bucket}",
+                params=params,
+                timeout=TIMEOUT,
+            )
+            response.raise_for_status()
+            result = ET.fromstring(response.content)
+
+            for content in result.findall("{*}Contents"):
+                key = content.findtext("{*}Key")
+                # folder markers created by some S3 clients
+                if key.endswith("/"):
+                    continue
+                size = content.findtext("{*}Size")
+                etag = content.findtext("{*}ETag")
+                files.append(
+                    Entry(
+                        f"{endpoint}/{bucket}/{quote(key)}",
+                        key[len(prefix) :],
+                        int(size) if size is not None else None,
+                        content.findtext("{*}LastModified"),
+                        etag.strip('"') if etag is not None else None,
+                    ),
+                )
+            for common_prefix in result.findall("{*}CommonPrefixes"):
+                subdirs.append(common_prefix.findtext("{*}Prefix")[len(prefix) :])
+
+            if result.findtext("{*}IsTruncated") != "true":
+                return files, subdirs
+            params["continuation-token"] = result.findtext("{*}NextContinuationToken")
+
+    return list_dir
+
+
+def parse_args():
+    example_text = """Example:
+    python /path/to/http_crawler.py autoindex https://example.org/data/
+    python /path/to/http_crawler.py s3 https://s3.amazonaws.com $BUCKET $PREFIX
+
+    This will recursively annex the URL of all files of the directory index, or of all
+    objects of the bucket under the prefix, in the git-annex of the current directory.
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Datalad crawler to crawl HTTP directory indexes and S3 buckets.",
+        epilog=example_text,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    subparsers = parser.add_subparsers(dest="source", required=True)
+
+    autoindex = subparsers.add_parser(
+        "autoindex", help="Crawl an HTTP directory index."
+    )
+    autoindex.add_argument("url", type=str, help="URL of the root directory.")
+    autoindex.add_argument(
+        "--no-head",
+        action="store_true",
+        help="Do not send a HEAD request per file to capture its size and ETag.",
+    )
+    add_crawl_arguments(autoindex, LISTING_PATH)
+
+    s3 = subparsers.add_parser("s3", help="Crawl an S3-compatible bucket.")
+    s3.add_argument("endpoint", type=str, help="URL of the S3 endpoint.")
+    s3.add_argument("bucket", type=str, help="Name of the bucket.")
+    s3.add_argument("prefix", nargs="?", type=str, default="", help="Prefix to crawl.")
+    add_crawl_arguments(s3, LISTING_PATH)
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.incremental and not args.listing:
+        args.listing = LISTING_PATH
+
+    # The HEAD requests of the files of a directory are sent concurrently, the pool is
+    # shut down once the crawl ends
+    with ThreadPoolExecutor(max_workers=args.jobs) as head_pool:
+        if args.source == "autoindex":
+            list_dir = autoindex_lister(
+                args.url,
+                head_pool=None if args.no_head else head_pool,
+            )
+        else:
+            list_dir = s3_lister(args.endpoint, args.bucket, args.prefix)
+
+        failed = crawl_tree(
+            list_dir,
+            jobs=args.jobs,
+            listing_path=args.listing,
+            resume=args.resume,
+            incremental=args.incremental,
+            metadata=True,
+        )
+    if failed:
+        sys.exit(f"{len(failed)} files could not be added to git-annex.")
@@ -0,0 +1,259 @@
+"""Listing engine shared by the DataLad crawlers.
+
+A crawler provides a `list_dir` function returning the files and subdirectories of a
+remote directory. The tree is listed concurrently, the files are added to git-annex
+with a single batch process, and the listing can be saved to resume an interrupted
+crawl or to only update the files that changed since the last crawl.
+"""
+import json
+import os
+import subprocess
+import sys
+from collections import deque
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", ".."))
+from scripts.annex_batch import addurl  # noqa: E402
+from scripts.annex_batch import set_metadata  # noqa: E402
+
+
+# A file of the remote listing; size, modify and etag are None when the remote does not
+# provide them
+Entry = namedtuple("Entry", ["url", "path", "size", "modify", "etag"], defaults=[None])
+
+
+def list_tree(list_dir, root="", jobs=8):
+    """
+    Lists a directory tree concurrently, breadth-first.
+
+    :param list_dir: function listing a subdirectory, returns the Entry of its files
+                     and the paths of its subdirectories
+    :param root: subdirectory to start from
+    :param jobs: number of directories listed concurrently
+    :return: generator of the Entry of every file, in no particular order
+    """
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = {executor.submit(list_dir, root)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                yield from files
+                pending |= {executor.submit(list_dir, subdir) for subdir in subdirs}
+
+
+def save_listing(entries, listing_path):
+    """
+    Writes the entries to a JSON lines listing as they are yielded. The listing only
+    replaces listing_path once it is complete.
+    """
+    tmp_path = f"{listing_path}.tmp"
+    with open(tmp_path, "w") as listing_file:
+        for entry in entries:
+            listing_file.write(json.dumps(entry._asdict()) + "\n")
+            yield entry
+    os.replace(tmp_path, listing_path)
+
+
+def load_listing(listing_path):
+    """
+    Reads a listing written by save_listing.
+
+    :return: generator of the Entry of every file
+    """
+    with open(listing_path) as listing_file:
+        for line in listing_file:
+            if line.strip():
+                yield Entry(**json.loads(line))
+
+
+def diff_listings(previous, current):
+    """
+    Compares two listings on the URL, size, modify and etag facts of their files.
+
+    :param previous: dict of the Entry of each path of the last crawl
+    :param current: dict of the Entry of each path of the new crawl
+    :return: lists of the added, removed and changed Entry
+    """
+    added, changed = [], []
+    for path, entry in current.items():
+        old = previous.get(path)
+        if old is None:
+            added.append(entry)
+        elif old != entry:
+            changed.append(entry)
+    removed = [entry for path, entry in previous.items() if path not in current]
+    return added, removed, changed
+
+
+def remove_files(paths):
+    """
+    Removes files from the dataset with a single `git rm`. The paths are literal, so
+    names with glob characters (e.g. `*`, `[`) only match themselves.
+    """
+    if not paths:
+        return
+    subprocess.run(
+        [
+            "git",
+            "--literal-pathspecs",
+            "rm",
+            "--quiet",
+            "--ignore-unmatch",
+            "--pathspec-from-file=-",
+            "--pathspec-file-nul",
+        ],
+        input="\0".join(paths).encode(),
+        check=True,
+    )
+
+
+def annex_entries(entries, metadata=False):
+    """
+    Adds the URLs of the files to git-annex with a single `addurl --batch` process.
+    Files already present in the working tree are skipped, so an interrupted crawl
+    resumes where it stopped.
+
+    :param entries: Entry of the files to add
+    :param metadata: whether to record the size, modify and etag of the added files
+                     as git-annex metadata, with a single `metadata --batch` process
+    :return: list of the Entry of the files that git-annex failed to add
+    """
+    # the entries are streamed to git-annex as they are listed, they are kept until
+    # git-annex answers them
+    pending = deque()
+
+    def requests():
+        for entry in entries:
+            if not os.path.lexists(entry.path):
+                pending.append(entry)
+                yield entry.url, entry.path
+
+    failed = []
+    added = []
+    for line, result in tqdm(addurl(".", requests(), "--fast"), unit="file"):
+        entry = pending.popleft()
+        if not result.get("success", False):
+            failed.append(entry)
+            print(f"WARNING: Failed to add {line}: {result.get('error-messages')}")
+        elif metadata:
+            added.append((entry.path, entry_metadata(entry)))
+
+    if added:
+        for line, result in set_metadata(".", added):
+            if not result.get("success", False):
+                print(f"WARNING: Failed to set the metadata {line}")
+    return failed
+
+
+def entry_metadata(entry):
+    """
+    Returns the git-annex metadata fields of the known facts of an Entry.
+    """
+    facts = {"size": entry.size, "modify": entry.modify, "etag": entry.etag}
+    return {field: [str(value)] for field, value in facts.items() if value is not None}
+
+
+def update_entries(entries, listing_path, metadata=False):
+    """
+    Applies the differences between the listing saved at listing_path and the new
+    entries to the dataset, then saves the new listing.
+
+    :return: list of the Entry of the files that git-annex failed to add
+    """
+    previous = {}
+    if os.path.isfile(listing_path):
+        previous = {entry.path: entry for entry in load_listing(listing_path)}
+    current = {entry.path: entry for entry in entries}
+    added, removed, changed = diff_listings(previous, current)
+    print(
+        f"\n{len(added)} files added, {len(removed)} removed and {len(changed)} changed"
+        f" since the last crawl",
+    )
+
+    # Changed files get a new key: they are removed, then added with their new URL
+    remove_files([entry.path for entry in removed + changed])
+    failed = annex_entries(added + changed, metadata=metadata)
+
+    # The files that failed are saved with their previous entry, or left out if they
+    # are new, so that the next crawl only retries them
+    for entry in failed:
+        if entry.path in previous:
+            current[entry.path] = previous[entry.path]
+        else:
+            del current[entry.path]
+    for _ in save_listing(current.values(), listing_path):
+        pass
+    return failed
+
+
+def crawl_tree(
+    list_dir,
+    root="",
+    *,
+    jobs=8,
+    listing_path=None,
+    resume=False,
+    incremental=False,
+    metadata=False,
+):
+    """
+    Lists the files under root concurrently and adds their URLs to git-annex.
+
+    The listing is saved to listing_path, if given, before the files are added; with
+    resume, the files of a saved listing are added without listing the tree again.
+    In incremental mode, the new listing is compared with the one saved at
+    listing_path by the last crawl: only the files added, removed or whose facts
+    changed are updated in the dataset.
+
+    :return: list of the Entry of the files that git-annex failed to add
+    """
+    if resume and listing_path and os.path.isfile(listing_path):
+        print(f"\nResuming from the listing {listing_path}")
+        return annex_entries(load_listing(listing_path), metadata=metadata)
+
+    entries = list_tree(list_dir, root, jobs=jobs)
+    if incremental:
+        return update_entries(entries, listing_path, metadata=metadata)
+    if listing_path:
+        # The complete listing is saved before any file is added, so that a crawl
+        # interrupted while adding the files can be resumed from it
+        for _ in save_listing(entries, listing_path):
+            pass
+        print(f"\nListing saved to {listing_path}")
+        entries = load_listing(listing_path)
+    return annex_entries(entries, metadata=metadata)
+
+
+def add_crawl_arguments(parser, listing_path):
+    """
+    Adds the options of crawl_tree to the argument parser of a crawler.
+    """
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=8,
+        help="Number of directories listed concurrently.",
+    )
+    parser.add_argument(
+        "--listing",
+        type=str,
+        help="Path to save the listing of the files to, as JSON lines.",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only update the files added, removed or modified since the listing saved "
+        f"by the last crawl, {listing_path} by default.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Annex the files of the saved listing instead of crawling again.",
+    )
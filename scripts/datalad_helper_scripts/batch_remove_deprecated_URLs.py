@@ -1,11 +1,18 @@
 import getopt
-import json
 import os
 import re
 import sys
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
-import git
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", ".."))
+from scripts.annex_batch import replace_urls  # noqa: E402
+from scripts.annex_batch import rmurl  # noqa: E402
+from scripts.annex_inventory import iter_annex_json  # noqa: E402
+
+
+# number of URLs processed between two progress reports
+PROGRESS_INTERVAL = 1000
 
 
 def parse_input(argv):
@@ -25,7 +32,10 @@ def parse_input(argv):
         "\nThis script can be used to remove from git-annex a series of URLs matching"
         " a specific pattern.\n"
         "\t- To run the script and print out the URLs that will be removed, use options"
-        " -d <dataset path> -u <invalid URL regex>.\n"
+        " -d <dataset path> -u <invalid URL regex>. Option -d can be repeated to process"
+        " several datasets concurrently.\n"
+        "\t- Option -r <replacement> registers, for each removed URL, the URL obtained by"
+        " substituting the regex matches with the replacement before removing it.\n"
         "\t- After examination of the result of the script, rerun the script with the same"
         " option and add the -c argument for actual removal of the URLs.\n"
         "\t- Option -v prints out progress of the script in the terminal.\n"
@@ -34,19 +44,24 @@ def parse_input(argv):
     usage = (
         f"\nusage  : python {__file__} -d <DataLad dataset directory path> -u <invalid URL regex>\n"
         "\noptions: \n"
-        "\t-d: path to the DataLad dataset to work on\n"  # noqa: E131
+        "\t-d: path to the DataLad dataset to work on, can be repeated\n"  # noqa: E131
         "\t-u: regular expression for invalid URLs to remove from git-annex\n"  # noqa: E131
+        "\t-r: replacement of the regex matches, the new URLs are registered in git-annex\n"  # noqa: E131
+        "\t-j: number of datasets processed concurrently, 4 by default\n"  # noqa: E131
         "\t-c: confirm that the removal of the URLs should be performed. By default it will just print out what needs to be removed for validation\n"  # noqa: E501,E131
         "\t-v: verbose\n"  # noqa: E131
     )
 
     try:
-        opts, args = getopt.getopt(argv, "hcd:u:")
+        opts, args = getopt.getopt(argv, "hcvd:u:r:j:")
     except getopt.GetoptError:
         sys.exit()
 
     script_options["run_removal"] = False
     script_options["verbose"] = False
+    script_options["dataset_paths"] = []
+    script_options["replacement"] = None
+    script_options["jobs"] = 4
 
     if not opts:
         print(description + usage)
@@ -57,15 +72,19 @@ def parse_input(argv):
             print(description + usage)
             sys.exit()
         elif opt == "-d":
-            script_options["dataset_path"] = arg
+            script_options["dataset_paths"].append(arg)
         elif opt == "-u":
             script_options["invalid_url_regex"] = arg
+        elif opt == "-r":
+            script_options["replacement"] = arg
+        elif opt == "-j":
+            script_options["jobs"] = int(arg)
         elif opt == "-c":
             script_options["run_removal"] = True
         elif opt == "-v":
             script_options["verbose"] = True
 
-    if "dataset_path" not in script_options.keys():
+    if not script_options["dataset_paths"]:
         print(
             "\n\t* ----------------------------------------------------------------------------------------------------------------------- *"  # noqa: E501
             "\n\t* ERROR: a path to the DataLad dataset to process needs to be given as an argument to the script by using the option `-d` *"  # noqa: E501
@@ -74,23 +93,24 @@ def parse_input(argv):
         print(description + usage)
         sys.exit()
 
-    if not os.path.exists(script_options["dataset_path"]):
-        print(
-            f"\n\t* ------------------------------------------------------------------------------ *"
-            f"\n\t* ERROR: {script_options['dataset_path']} does not appear to be a valid path   "
-            f"\n\t* ------------------------------------------------------------------------------ *",
-        )
-        print(description + usage)
-        sys.exit()
+    for dataset_path in script_options["dataset_paths"]:
+        if not os.path.exists(dataset_path):
+            print(
+                f"\n\t* ------------------------------------------------------------------------------ *"
+                f"\n\t* ERROR: {dataset_path} does not appear to be a valid path   "
+                f"\n\t* ------------------------------------------------------------------------------ *",
+            )
+            print(description + usage)
+            sys.exit()
 
-    if not os.path.exists(os.path.join(script_options["dataset_path"], ".datalad")):
-        print(
-            f"\n\t* ----------------------------------------------------------------------------------- *"
-            f"\n\t* ERROR: {script_options['dataset_path']} does not appear to be a DataLad dataset   "
-            f"\n\t* ----------------------------------------------------------------------------------- *",
-        )
-        print(description + usage)
-        sys.exit()
+        if not os.path.exists(os.path.join(dataset_path, ".datalad")):
+            print(
+                f"\n\t* ----------------------------------------------------------------------------------- *"
+                f"\n\t* ERROR: {dataset_path} does not appear to be a DataLad dataset   "
+                f"\n\t* ----------------------------------------------------------------------------------- *",
+            )
+            print(description + usage)
+            sys.exit()
 
     if "invalid_url_regex" not in script_options.keys():
         print(
@@ -104,127 +124,160 @@ def parse_input(argv):
     return script_options
 
 
-def get_files_and_urls(dataset_path, annex):
+def iter_invalid_urls(dataset_path, regex_pattern):
     """
-    Runs git annex whereis in the dataset directory to retrieve
-    a list of annexed files with their URLs' location.
+    Streams git annex whereis in the dataset directory and yields the URLs of the
+    annexed files matching a regular expression as the records arrive, so that only
+    the matching URLs are ever kept in memory.
 
     :param dataset_path: full path to the DataLad dataset
      :type dataset_path: string
-    :param annex: the git annex object
-     :type annex: object
-
-    :return: files path and there URLs organized as follows:
-             {
-                <file-1_path> => [file-1_url-1, file-1_url-2 ...]
-                <file-2_path> => [file-2_url-1, file-2_url-2 ...]
-                ...
-             }
-     :rtype: dict
-    """
-
-    current_path = os.path.dirname(os.path.realpath(__file__))
+    :param regex_pattern: compiled regular expression pattern for URL filtering
+     :type regex_pattern: re.Pattern
 
-    results = {}
-    try:
-        os.chdir(dataset_path)
-        annex_results = annex("whereis", ".", "--json")
-        results_list = annex_results.split("\n")
-        for annex_result_item in results_list:
-            r_json = json.loads(annex_result_item)
-            file_path = r_json["file"]
-            file_urls = []
-            for entry in r_json["whereis"]:
-                file_urls.extend(entry["urls"])
-            results[file_path] = file_urls
-    except Exception:
-        traceback.print_exc()
-        sys.exit()
-    finally:
-        os.chdir(current_path)
+    :return: generator of (file path, git-annex key, URL) tuples
+     :rtype: generator
+    """
 
-    return results
+    search = regex_pattern.search
+    for r_json in iter_annex_json(dataset_path, "whereis"):
+        for entry in r_json["whereis"]:
+            for url in entry["urls"]:
+                if search(url):
+                    yield r_json["file"], r_json["key"], url
 
 
-def filter_invalid_urls(files_and_urls_dict, regex_pattern):
+class Progress:
     """
-    Filters out the URLs that need to be removed based on a regular
-    expression pattern.
-
-    :param files_and_urls_dict: files' path and their respective URLs.
-     :type files_and_urls_dict: dict
-    :param regex_pattern: regular expression pattern for URL filtering
-     :type regex_pattern: str
-
-    :return: filtered URLs per file
-     :rtype: dict
+    Counter of the URLs processed in a dataset, printed every PROGRESS_INTERVAL URLs.
     """
 
-    filtered_dict = {}
-    for file_path in files_and_urls_dict.keys():
-        filtered_urls_list = filter(
-            lambda x: re.search(regex_pattern, x),
-            files_and_urls_dict[file_path],
+    def __init__(self, dataset_path, action, total=None):
+        self.dataset_path = dataset_path
+        self.action = action
+        self.total = total
+        self.done = 0
+        self.failed = 0
+
+    def update(self, success):
+        self.done += 1
+        self.failed += not success
+        if self.done % PROGRESS_INTERVAL == 0 or self.done == self.total:
+            print(self)
+
+    def __str__(self):
+        total = "" if self.total is None else f"/{self.total}"
+        return (
+            f" => {self.dataset_path}: {self.action} {self.done}{total} URLs"
+            f" ({self.failed} failed)"
         )
-        filtered_dict[file_path] = filtered_urls_list
 
-    return filtered_dict
 
+def remove_invalid_urls(invalid_urls, script_options, dataset_path):
+    """
+    Removes the invalid URLs from the files. The removals, and the registrations of
+    the replacement URLs, are streamed into a single `git annex rmurl --batch`
+    (respectively `registerurl --batch`) process.
+
+    :param invalid_urls: (file path, git-annex key, URL) tuples to remove
+     :type invalid_urls: iterable
+    :param script_options: options give to the script
+     :type script_options: dict
+    :param dataset_path: path to the DataLad dataset
+     :type dataset_path: str
+    """
 
-def remove_invalid_urls(filtered_file_urls_dict, script_options, annex):
+    regex_pattern = re.compile(script_options["invalid_url_regex"])
+    replacement = script_options["replacement"]
+
+    if not script_options["run_removal"]:
+        for file_path, key, url in invalid_urls:
+            if replacement is not None:
+                print(
+                    f"\nWill be running `git annex registerurl {key} "
+                    f"{regex_pattern.sub(replacement, url)}`",
+                )
+            print(f"\nWill be running `git annex rmurl {file_path} {url}`\n")
+        return
+
+    if replacement is not None:
+        # the replacement URLs are registered first so that a file never loses
+        # all of its URLs, its old URLs are only removed if the new one was added
+        invalid_urls = list(invalid_urls)
+        progress = Progress(dataset_path, "replaced", len(invalid_urls))
+        for (_, _, url, _), command, result in replace_urls(
+            dataset_path,
+            (
+                (file_path, key, url, regex_pattern.sub(replacement, url))
+                for file_path, key, url in invalid_urls
+            ),
+        ):
+            success = command == "rmurl" and result.get("success", False)
+            progress.update(success)
+            if not success and script_options["verbose"]:
+                print(f"\n => Failed to run `git annex {command}` for {url}: {result}")
+        return
+
+    # the URLs are removed as git annex whereis finds them
+    progress = Progress(dataset_path, "removed")
+    for line, result in rmurl(
+        dataset_path,
+        ((file_path, url) for file_path, _, url in invalid_urls),
+    ):
+        progress.update(result.get("success", False))
+        if not result.get("success", False) and script_options["verbose"]:
+            print(f"\n => Failed to run `git annex rmurl {line}`: {result}")
+    print(progress)
+
+
+def process_dataset(dataset_path, script_options):
     """
-    Removes URLs listed in the filtered dictionary from the files.
+    Removes the invalid URLs of a DataLad dataset.
 
-    :param filtered_file_urls_dict: filtered URLs to remove per file
-     :type filtered_file_urls_dict: dict
+    :param dataset_path: path to the DataLad dataset
+     :type dataset_path: str
     :param script_options: options give to the script
      :type script_options: dict
-    :param annex: the git annex object
-     :type annex: object
+
+    :return: whether the invalid URLs of the dataset were processed without error
+     :rtype: bool
     """
 
-    dataset_path = script_options["dataset_path"]
-    current_path = os.path.dirname(os.path.realpath(__file__))
+    # stream the URLs of the annexed files matching the invalid URL regex
+    regex_pattern = re.compile(script_options["invalid_url_regex"])
+    if script_options["verbose"]:
+        print(
+            f"\n => Reading {dataset_path} and grep the annexed files URLs matching the"
+            f" regular expression {regex_pattern}\n",
+        )
+    invalid_urls = iter_invalid_urls(dataset_path, regex_pattern)
 
+    # remove the invalid URLs found for each annexed file
     try:
-        os.chdir(dataset_path)
-        for file_path in filtered_file_urls_dict.keys():
-            for url in filtered_file_urls_dict[file_path]:
-                if script_options["run_removal"]:
-                    if script_options["verbose"]:
-                        print(f"\n => Running `git annex rmurl {file_path} {url}`\n")
-                    annex("rmurl", file_path, url)
-                else:
-                    print(
-                        f"\nWill be running `git annex rmurl {file_path} {url}`\n",
-                    )
+        remove_invalid_urls(invalid_urls, script_options, dataset_path)
     except Exception:
+        print(f"\n => Failed to process the invalid URLs of {dataset_path}")
         traceback.print_exc()
-    finally:
-        os.chdir(current_path)
+        return False
+    return True
 
 
 if __name__ == "__main__":
 
     script_options = parse_input(sys.argv[1:])
 
-    repo = git.Repo(script_options["dataset_path"])
-    annex = repo.git.annex
-
-    # fetch files and urls attached to the file
-    if script_options["verbose"]:
-        print(
-            f"\n => Reading {script_options['dataset_path']} and grep annexed files with their URLs\n",
+    with ThreadPoolExecutor(max_workers=script_options["jobs"]) as executor:
+        results = list(
+            executor.map(
+                lambda dataset_path: process_dataset(dataset_path, script_options),
+                script_options["dataset_paths"],
+            ),
         )
-    files_and_urls_dict = get_files_and_urls(script_options["dataset_path"], annex)
 
-    # grep only the invalid URLs that need to be removed from the annexed files
-    regex_pattern = re.compile(script_options["invalid_url_regex"])
-    if script_options["verbose"]:
-        print(
-            f"\n => Grep the invalid URLs based on the regular expression {regex_pattern}",
-        )
-    filtered_file_urls_dict = filter_invalid_urls(files_and_urls_dict, regex_pattern)
-
-    # remove the invalid URLs found for each annexed file
-    remove_invalid_urls(filtered_file_urls_dict, script_options, annex)
+    failed = [
+        dataset_path
+        for dataset_path, success in zip(script_options["dataset_paths"], results)
+        if not success
+    ]
+    if failed:
+        sys.exit(f"\n => Failed to process the datasets: {', '.join(failed)}")
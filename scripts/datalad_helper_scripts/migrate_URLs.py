@@ -0,0 +1,414 @@
+import getopt
+import json
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", ".."))
+from scripts.annex_batch import replace_urls  # noqa: E402
+from scripts.annex_inventory import iter_annex_json  # noqa: E402
+from scripts.catalog_index import get_subdataset_dirs  # noqa: E402
+from scripts.dats_validator.validator import get_response_status  # noqa: E402
+
+
+# default path of the journal of the migrated URLs, relative to the working directory
+JOURNAL_PATH = "migrate_URLs.journal.jsonl"
+
+# journal status of the URLs whose migration is complete
+MIGRATED = "migrated"
+
+# number of new URLs verified concurrently, in total and per host
+VERIFY_JOBS = 16
+VERIFY_JOBS_PER_HOST = 4
+
+
+def parse_input(argv):
+    """
+    Displays the script's help section and parses the options given to the script.
+
+    :param argv: command line arguments
+     :type argv: array
+
+    :return: parsed and validated script options
+     :rtype: dict
+    """
+
+    script_options = {
+        "conp_dataset_dir": os.getcwd(),
+        "dataset_paths": [],
+        "run_migration": False,
+        "verify": False,
+        "jobs": 4,
+        "journal_path": JOURNAL_PATH,
+        "report_path": None,
+        "verbose": False,
+    }
+
+    description = (
+        "\nThis script rewrites the URLs registered in git-annex of every installed"
+        " dataset of the conp-dataset, following a mapping of regular expressions to"
+        " replacements.\n"
+        "\t- By default, the script writes a report of the URLs that would be rewritten.\n"
+        "\t- After examination of the report, rerun the script with the same options and"
+        " add the -c argument to register the new URLs and remove the old ones.\n"
+        "\t- Each migrated URL is recorded in a journal, an interrupted migration"
+        " resumes where it stopped when the script is run again.\n"
+    )
+
+    usage = (
+        f"\nusage  : python {__file__} -m <mapping JSON file> [-d <conp-dataset path>]\n"
+        "\noptions: \n"
+        "\t-m: JSON file mapping regular expressions of the URLs to rewrite to their replacement,"  # noqa: E501
+        " the first matching expression applies\n"  # noqa: E131
+        "\t-d: path to the conp-dataset, the current directory by default\n"  # noqa: E131
+        "\t-s: path to a dataset to migrate, can be repeated. By default every installed"  # noqa: E131
+        " subdataset is migrated\n"  # noqa: E131
+        "\t-c: confirm that the migration of the URLs should be performed\n"  # noqa: E131
+        "\t-V: verify that the new URLs respond before registering them\n"  # noqa: E131
+        "\t-j: number of datasets migrated concurrently, 4 by default\n"  # noqa: E131
+        f"\t-l: path to the journal of the migrated URLs, {JOURNAL_PATH} by default\n"  # noqa: E131
+        "\t-o: path of the report of the URLs to rewrite, printed out by default\n"  # noqa: E131
+        "\t-v: verbose\n"  # noqa: E131
+    )
+
+    try:
+        opts, args = getopt.getopt(argv, "hcvVm:d:s:j:l:o:")
+    except getopt.GetoptError:
+        sys.exit()
+
+    if not opts:
+        print(description + usage)
+        sys.exit()
+
+    for opt, arg in opts:
+        if opt == "-h":
+            print(description + usage)
+            sys.exit()
+        elif opt == "-m":
+            script_options["mapping_path"] = arg
+        elif opt == "-d":
+            script_options["conp_dataset_dir"] = arg
+        elif opt == "-s":
+            script_options["dataset_paths"].append(arg)
+        elif opt == "-c":
+            script_options["run_migration"] = True
+        elif opt == "-V":
+            script_options["verify"] = True
+        elif opt == "-j":
+            script_options["jobs"] = int(arg)
+        elif opt == "-l":
+            script_options["journal_path"] = arg
+        elif opt == "-o":
+            script_options["report_path"] = arg
+        elif opt == "-v":
+            script_options["verbose"] = True
+
+    if "mapping_path" not in script_options:
+        print(
+            "\n\t* ERROR: a JSON file mapping the URL regular expressions to their replacement"
+            " should be provided to the script by using the option `-m`",
+        )
+        print(description + usage)
+        sys.exit()
+
+    return script_options
+
+
+def load_mapping(mapping_path):
+    """
+    Loads the mapping of the URL regular expressions to their replacement.
+
+    :param mapping_path: path to a JSON object {<regex>: <replacement>}
+     :type mapping_path: str
+
+    :return: list of (compiled regex, replacement) in the order of the file
+     :rtype: list
+    """
+
+    with open(mapping_path) as mapping_file:
+        mapping = json.load(mapping_file)
+    return [(re.compile(regex), replacement) for regex, replacement in mapping.items()]
+
+
+def rewrite_url(url, mapping):
+    """
+    Rewrites a URL with the first regular expression of the mapping matching it.
+
+    :param url: URL to rewrite
+     :type url: str
+    :param mapping: list of (compiled regex, replacement)
+     :type mapping: list
+
+    :return: the rewritten URL, None if no expression matches or the URL is unchanged
+     :rtype: str
+    """
+
+    for regex, replacement in mapping:
+        if regex.search(url):
+            new_url = regex.sub(replacement, url)
+            return new_url if new_url != url else None
+    return None
+
+
+def find_datasets(conp_dataset_dir):
+    """
+    Finds the installed subdatasets of the conp-dataset, including the nested ones.
+
+    :param conp_dataset_dir: path to the conp-dataset
+     :type conp_dataset_dir: str
+
+    :return: list of the paths to the installed datasets
+     :rtype: list
+    """
+
+    datasets = []
+    stack = list(reversed(get_subdataset_dirs(conp_dataset_dir)))
+    while stack:
+        dataset = stack.pop()
+        if not os.path.isdir(dataset) or not os.listdir(dataset):
+            continue
+        datasets.append(dataset)
+        stack.extend(reversed(get_subdataset_dirs(dataset)))
+    return datasets
+
+
+def iter_migrations(dataset_path, mapping):
+    """
+    Streams git annex whereis in the dataset directory and yields the URLs to rewrite.
+
+    :param dataset_path: path to the DataLad dataset
+     :type dataset_path: str
+    :param mapping: list of (compiled regex, replacement)
+     :type mapping: list
+
+    :return: generator of (file path, git-annex key, old URL, new URL) tuples
+     :rtype: generator
+    """
+
+    for r_json in iter_annex_json(dataset_path, "whereis"):
+        for entry in r_json["whereis"]:
+            for url in entry["urls"]:
+                new_url = rewrite_url(url, mapping)
+                if new_url is not None:
+                    yield r_json["file"], r_json["key"], url, new_url
+
+
+def verify_urls(urls, jobs=VERIFY_JOBS, jobs_per_host=VERIFY_JOBS_PER_HOST):
+    """
+    Checks that the URLs respond, without any cache, so that only URLs responding
+    at the time of the migration are registered.
+
+    :param urls: URLs to check
+     :type urls: list
+    :param jobs: number of URLs checked concurrently
+     :type jobs: int
+    :param jobs_per_host: number of URLs of the same host checked concurrently
+     :type jobs_per_host: int
+
+    :return: whether each URL responds, URLs that cannot be reached do not
+     :rtype: dict
+    """
+
+    urls = set(urls)
+    if not urls:
+        return {}
+
+    hosts = {urlsplit(url).netloc: threading.Semaphore(jobs_per_host) for url in urls}
+
+    def verify(url):
+        with hosts[urlsplit(url).netloc]:
+            return bool(get_response_status(url))
+
+    with ThreadPoolExecutor(max_workers=min(jobs, len(urls))) as executor:
+        return dict(zip(urls, executor.map(verify, urls)))
+
+
+class Journal:
+    """
+    Append-only JSONL journal of the URL migrations, shared by the dataset threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.migrated = set()
+        if os.path.isfile(path):
+            with open(path) as journal_file:
+                for line in journal_file:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if entry["status"] == MIGRATED:
+                        self.migrated.add(
+                            (entry["dataset"], entry["file"], entry["old_url"]),
+                        )
+        self.journal_file = None
+
+    def is_migrated(self, dataset_path, file_path, old_url):
+        return (dataset_path, file_path, old_url) in self.migrated
+
+    def record(self, dataset_path, file_path, old_url, new_url, status, message=None):
+        entry = {
+            "dataset": dataset_path,
+            "file": file_path,
+            "old_url": old_url,
+            "new_url": new_url,
+            "status": status,
+            "time": time.time(),
+        }
+        if message:
+            entry["message"] = message
+        with self.lock:
+            if self.journal_file is None:
+                self.journal_file = open(self.path, "a")
+            self.journal_file.write(json.dumps(entry) + "\n")
+            self.journal_file.flush()
+            if status == MIGRATED:
+                self.migrated.add((dataset_path, file_path, old_url))
+
+    def close(self):
+        if self.journal_file is not None:
+            self.journal_file.close()
+
+
+def format_report(dataset_path, migrations):
+    """
+    Formats the URLs to rewrite in a dataset as a diff.
+
+    :param dataset_path: path to the DataLad dataset
+     :type dataset_path: str
+    :param migrations: (file path, git-annex key, old URL, new URL) tuples
+     :type migrations: list
+
+    :return: the diff of the URLs of each file
+     :rtype: str
+    """
+
+    lines = [f"--- {dataset_path}", f"+++ {dataset_path}"]
+    current_file = None
+    for file_path, _, old_url, new_url in migrations:
+        if file_path != current_file:
+            lines.append(f"@@ {file_path} @@")
+            current_file = file_path
+        lines.extend([f"-{old_url}", f"+{new_url}"])
+    return "\n".join(lines) + "\n"
+
+
+def migrate_dataset(dataset_path, mapping, journal, script_options):
+    """
+    Optionally verifies that the new URLs of a dataset respond, registers the new URLs
+    then removes the old URLs. Each step streams its requests into a single batch git-annex
+    process.
+
+    :param dataset_path: path to the DataLad dataset
+     :type dataset_path: str
+    :param mapping: list of (compiled regex, replacement)
+     :type mapping: list
+    :param journal: journal of the URL migrations
+     :type journal: Journal
+    :param script_options: options given to the script
+     :type script_options: dict
+
+    :return: the diff of the URLs to rewrite in dry-run mode, the number of migrated
+             URLs otherwise
+     :rtype: str or int
+    """
+
+    migrations = [
+        migration
+        for migration in iter_migrations(dataset_path, mapping)
+        if not journal.is_migrated(dataset_path, migration[0], migration[2])
+    ]
+    if not script_options["run_migration"]:
+        return format_report(dataset_path, migrations) if migrations else ""
+    if not migrations:
+        return 0
+    total = len(migrations)
+
+    # only the new URLs that respond are registered
+    if script_options["verify"]:
+        statuses = verify_urls([new_url for _, _, _, new_url in migrations])
+        for migration in migrations:
+            if not statuses[migration[3]]:
+                journal.record(
+                    dataset_path,
+                    migration[0],
+                    migration[2],
+                    migration[3],
+                    "verify_failed",
+                )
+        migrations = [migration for migration in migrations if statuses[migration[3]]]
+
+    # the new URLs are registered first so that a file never loses all of its URLs
+    migrated = 0
+    for migration, command, result in replace_urls(dataset_path, migrations):
+        success = command == "rmurl" and result.get("success", False)
+        migrated += success
+        if success:
+            status = MIGRATED
+        else:
+            status = "register_failed" if command == "registerurl" else "remove_failed"
+        journal.record(
+            dataset_path,
+            migration[0],
+            migration[2],
+            migration[3],
+            status,
+            None if success else json.dumps(result.get("error-messages", [])),
+        )
+
+    if script_options["verbose"]:
+        print(f" => {dataset_path}: {migrated}/{total} URLs migrated")
+    return migrated
+
+
+if __name__ == "__main__":
+
+    script_options = parse_input(sys.argv[1:])
+    mapping = load_mapping(script_options["mapping_path"])
+    dataset_paths = script_options["dataset_paths"] or find_datasets(
+        script_options["conp_dataset_dir"],
+    )
+    journal = Journal(script_options["journal_path"])
+
+    def run(dataset_path):
+        try:
+            return migrate_dataset(dataset_path, mapping, journal, script_options)
+        except Exception:
+            print(f"\n => Failed to migrate the URLs of {dataset_path}")
+            traceback.print_exc()
+            return None
+
+    try:
+        with ThreadPoolExecutor(max_workers=script_options["jobs"]) as executor:
+            results = list(executor.map(run, dataset_paths))
+    finally:
+        journal.close()
+
+    failed = [
+        dataset_path
+        for dataset_path, result in zip(dataset_paths, results)
+        if result is None
+    ]
+    results = [result for result in results if result is not None]
+
+    if script_options["run_migration"]:
+        print(f"\n => {sum(results)} URLs migrated in {len(results)} datasets")
+    else:
+        report = "".join(results)
+        if script_options["report_path"]:
+            with open(script_options["report_path"], "w") as report_file:
+                report_file.write(report)
+            print(
+                f"\n => Report of the URLs to rewrite written to {script_options['report_path']}"
+            )
+        else:
+            print(report)
+
+    if failed:
+        sys.exit(f"\n => Failed to process the datasets: {', '.join(failed)}")
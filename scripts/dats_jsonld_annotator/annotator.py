@@ -1,19 +1,147 @@
 import argparse
+import functools
 import json
 import logging
+import multiprocessing
+import os
 import pathlib as pal
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urldefrag
 
 import jsonschema as jss
 
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", ".."))
+from scripts.dats_traversal import dump  # noqa: E402
+from scripts.dats_traversal import trampoline  # noqa: E402
 
 CONTEXT_DIR = (pal.Path(__file__).parent / "context" / "sdo").resolve()
 SCHEMA_DIR = (pal.Path(__file__).parent / "schema").resolve()
 logger = logging.getLogger("DATS annotator")
 
 
-def find_schema(parent_schema, term, json_object):
+class SchemaRegistry:
+    """
+    Loads the DATS JSON schemas of a directory once, and memoizes what find_schema needs:
+    the resolved schemas per (parent schema id, reference), the candidate schemata per
+    (parent schema id, term) and one compiled validator per schema.
+
+    :param schema_dir: the directory path where the DATS JSON schema files can be found
+    """
+
+    COMBINATORS = ("anyOf", "oneOf", "allOf")
+
+    def __init__(self, schema_dir=SCHEMA_DIR):
+        self.schema_dir = pal.Path(schema_dir)
+        self.store = {}
+        for schema_f in sorted(self.schema_dir.glob("*.json")):
+            with open(schema_f) as f:
+                schema = json.load(f)
+            if isinstance(schema, dict) and "id" in schema:
+                self.store[urldefrag(schema["id"])[0]] = schema
+        self.resolvers = {}
+        self.resolved = {}
+        self.validators = {}
+        self.terms = {}
+
+        # Precompute the term -> candidate schemata table of every schema in the directory
+        for schema in self.store.values():
+            for term in schema.get("properties", {}):
+                try:
+                    self.term_candidates(schema, term)
+                except jss.RefResolutionError as e:
+                    logger.debug(f"Cannot precompute the schema of {term = }: {e}")
+
+    def is_known(self, schema):
+        """Only the schemata of the directory are memoized by their id"""
+        return urldefrag(schema.get("id", ""))[0] in self.store
+
+    def resolver(self, parent_schema):
+        base_uri = parent_schema["id"]
+        if base_uri not in self.resolvers:
+            self.resolvers[base_uri] = jss.RefResolver(
+                base_uri=base_uri, referrer=None, store=self.store
+            )
+        return self.resolvers[base_uri]
+
+    def resolve(self, parent_schema, ref_name):
+        """
+        Resolve a reference relative to the parent schema, a reference to the parent schema
+        itself returns the parent schema.
+        """
+        key = (parent_schema["id"], ref_name)
+        if key in self.resolved and self.is_known(parent_schema):
+            return self.resolved[key]
+
+        resolver = self.resolver(parent_schema)
+        _schema_uri, _schema = resolver.resolve(ref_name)
+        if _schema_uri == resolver.base_uri:
+            _schema = parent_schema
+        if self.is_known(parent_schema):
+            self.resolved[key] = _schema
+        return _schema
+
+    def validator(self, schema):
+        """Return a compiled Draft4Validator for the schema, cached by schema id"""
+        key = schema.get("id")
+        if key is None or not self.is_known(schema):
+            return jss.Draft4Validator(
+                schema, resolver=jss.RefResolver.from_schema(schema, store=self.store)
+            )
+        if key not in self.validators:
+            self.validators[key] = jss.Draft4Validator(
+                schema, resolver=jss.RefResolver.from_schema(schema, store=self.store)
+            )
+        return self.validators[key]
+
+    def term_candidates(self, parent_schema, term):
+        """
+        Find the possible schemata of a term of the parent schema.
+
+        :return: None if the term does not need to be annotated, otherwise a tuple with the
+            combinator ("anyOf", "oneOf", "allOf" or None for a single "$ref") and the list
+            of (reference name, schema) candidates
+        """
+        key = (parent_schema["id"], term)
+        if key in self.terms and self.is_known(parent_schema):
+            return self.terms[key]
+
+        # See if "items" is in the schema entry
+        search_dict = parent_schema["properties"][term]
+        if "items" in search_dict.keys():
+            search_dict = search_dict["items"]
+
+        combinators = set(search_dict.keys()).intersection(self.COMBINATORS)
+        if "$ref" in search_dict.keys():
+            # There is only one possible schema
+            ref_name = search_dict["$ref"]
+            candidates = (None, [(ref_name, self.resolve(parent_schema, ref_name))])
+        elif len(combinators) > 0:
+            # There is (most likely) more than one option for the schema as indicated by one of the
+            # keys from ["anyOf", "oneOf", "allOf"]
+            schema_rel = list(combinators)[0]
+            candidates = (
+                schema_rel,
+                [
+                    (ref["$ref"], self.resolve(parent_schema, ref["$ref"]))
+                    for ref in search_dict[schema_rel]
+                ],
+            )
+        else:
+            candidates = None
+
+        if self.is_known(parent_schema):
+            self.terms[key] = candidates
+        return candidates
+
+
+@functools.lru_cache(maxsize=None)
+def get_schema_registry(schema_dir=SCHEMA_DIR):
+    return SchemaRegistry(schema_dir)
+
+
+def find_schema(parent_schema, term, json_object, registry=None):
     """
     This function finds the appropriate JSON schema for a term in a DATS JSON object. To do
     so, it relies on the JSON schema of the supplied JSON object.
@@ -21,6 +149,7 @@ def find_schema(parent_schema, term, json_object):
     :param parent_schema: The DATS JSON schema that corresponds to the json_object parameter
     :param term: the string term for which the schema shall be found
     :param json_object: the JSON object that contains the term and to which the parent_schema corresponds to
+    :param registry: the SchemaRegistry used to resolve the schemata, by default the one of SCHEMA_DIR
     :return: the DATS JSON schema for the term
     """
     ps = parent_schema["properties"]
@@ -32,99 +161,126 @@ def find_schema(parent_schema, term, json_object):
         )
         return None
 
-    # Set up the schema resolver
-    resolver = jss.RefResolver(base_uri=parent_schema["id"], referrer=None)
-
-    # See if "items" is in the schema entry
-    search_dict = ps[term]
-    if "items" in search_dict.keys():
-        search_dict = ps[term]["items"]
+    if registry is None:
+        registry = get_schema_registry()
 
     # This section is looking for the name of the DATS schema that should be applied to the term
     # If there are multiple possibilities (e.g. "anyOf", "oneOf", "allOf") we want to pick a schema
     # for which the current term value validates
-    if "$ref" in search_dict.keys():
+    candidates = registry.term_candidates(parent_schema, term)
+    if candidates is None:
+        # There is nothing to be done here in terms of annotation
+        logger.info(f"{term = } does not need to be annotated")
+        return None
+
+    schema_rel, schemata = candidates
+    if schema_rel is None:
         # There is only one possible schema
-        schema_name = search_dict["$ref"]
-    elif len(set(search_dict.keys()).intersection(["anyOf", "oneOf", "allOf"])) > 0:
-        # There is (most likely) more than one option for the schema as indicated by one of the
-        # keys from ["anyOf", "oneOf", "allOf"]
-        schema_rel = list(
-            set(search_dict.keys()).intersection(["anyOf", "oneOf", "allOf"])
-        )[0]
-        possible_schemata = []
-        # We will now iterate over the possible schemata for the term
-        for ref in search_dict[schema_rel]:
-            # Get the schema
-            ref_name = ref["$ref"]
-            _schema_uri, _schema = resolver.resolve(ref_name)
-            if _schema_uri == resolver.base_uri:
-                _schema = parent_schema
-            if jss.Draft4Validator(_schema).is_valid(json_object):
-                # If the schema validates the term value (json_object) then we can keep
-                # it around as a potential schema
-                possible_schemata.append(ref_name)
+        schema_name, _schema = schemata[0]
+    else:
+        # We will now iterate over the possible schemata for the term and keep around those
+        # for which the term value (json_object) validates
+        possible_schemata = [
+            (ref_name, _schema)
+            for ref_name, _schema in schemata
+            if registry.validator(_schema).is_valid(json_object)
+        ]
         if len(possible_schemata) > 1:
             # TODO: decide if we let the user pick which option to go with
-            logger.debug(f"I got more than one option for {term}: {possible_schemata}")
+            logger.debug(
+                f"I got more than one option for {term}: {[ref for ref, _ in possible_schemata]}"
+            )
         elif len(possible_schemata) == 0:
             logger.warning(
-                f"I have no fitting schema for {json_object} {term} among {search_dict[schema_rel]}"
+                f"I have no fitting schema for {json_object} {term} among {[ref for ref, _ in schemata]}"
             )
             return None
         # If anything fits, just pick the first one
         # TODO: we may want to leave this up to the user here, particularly if the instances
         #       map to different / meaningful things in SDO
-        schema_name = possible_schemata[0]
-    else:
-        # There is nothing to be done here in terms of annotation
-        logger.info(f"{term = } does not need to be annotated")
-        return None
+        schema_name, _schema = possible_schemata[0]
 
-    _schema_uri, _schema = resolver.resolve(schema_name)
-    if _schema_uri == resolver.base_uri:
-        _schema = parent_schema
     if _schema is None:
         logger.warning(
             f'The schema we found for {schema_name}: was None! The parent schema was: {parent_schema["id"]}'
-            f"and it was resolved using this URI: {resolver.base_uri}"
         )
     return _schema
 
 
+class ContextRegistry:
+    """
+    Loads the DATS SDO context files of a directory at most once, keyed by schema id.
+
+    :param context_dir: the directory path where the DATS SDO context files can be found
+    """
+
+    def __init__(self, context_dir=CONTEXT_DIR):
+        self.context_dir = pal.Path(context_dir)
+        self.contexts = {}
+
+    @staticmethod
+    def context_name(schema_id):
+        """
+        DATS SDO context files follow a similar naming structure to the DATS JSON schema files,
+        e.g. dataset_schema.json -> dataset_sdo_context.jsonld
+        """
+        schema_name = pal.Path(schema_id).name
+        return pal.Path(schema_name.replace("_schema", "_sdo_context")).with_suffix(
+            ".jsonld"
+        )
+
+    def get(self, schema_id):
+        if schema_id not in self.contexts:
+            with open(self.context_dir / self.context_name(schema_id)) as f:
+                self.contexts[schema_id] = json.load(f)["@context"]
+        return self.contexts[schema_id]
+
+
+@functools.lru_cache(maxsize=None)
+def get_context_registry(context_dir=CONTEXT_DIR):
+    return ContextRegistry(context_dir)
+
+
 def find_context(schema_id, context_dir):
     """
     For a given DATS JSON schema, finds and loads the corresponding DATS SDO context file.
-    This function makes use of the fact that DATS SDO context files follow a similar naming structure
-    to the DATS JSON schema files.
+    The loaded contexts are shared by every call with the same context_dir.
 
     :param schema_id: the string URI of the schema
     :param context_dir: the directory path where the DATS SDO context files can be found
     :return: the @context section of the DATS SDO context file as a dictionary
     """
-    schema_name = pal.Path(schema_id).name
-    context_name = pal.Path(schema_name.replace("_schema", "_sdo_context")).with_suffix(
-        ".jsonld"
-    )
-    context = json.load(open(context_dir / context_name))["@context"]
-    return context
+    return get_context_registry(pal.Path(context_dir).resolve()).get(schema_id)
 
 
 def annotate_dats_object(
-    json_object, schema, specific_context, context_dir=CONTEXT_DIR
+    json_object, schema, specific_context, context_dir=CONTEXT_DIR, registry=None
 ):
     """
-    This function recursively traverses a DATS instance and generates two things:
+    This function traverses a DATS instance and generates two things:
 
     1. The @type declarations for each node in the JSONLD graph
     2. A copy of the specific context mappings needed to map the DATS instance to SDO
 
+    The traversal uses an explicit stack, so deep DATS instances do not hit the recursion limit.
+
     :param json_object: A DATS instance as a dictionary
     :param schema: The DATS JSON schema corresponding to the json_object as a dictionary
     :param specific_context:  the DATS instance specific context
     :param context_dir: the path to the DATS context files
+    :param registry: the SchemaRegistry used to resolve the schemata, by default the one of SCHEMA_DIR
     :return: The DATS instance with appropriate @type declarations, and the DATS instance specific context
     """
+    return trampoline(
+        annotate_node(json_object, schema, specific_context, context_dir, registry)
+    )
+
+
+def annotate_node(json_object, schema, specific_context, context_dir, registry):
+    """
+    Annotate a single node of a DATS instance. This is a generator for the trampoline:
+    it yields the annotation of each child node and receives its result back.
+    """
 
     if not isinstance(json_object, dict) or schema is None:
         # If the json_object is not a dict, then it cannot be annotated
@@ -134,9 +290,9 @@ def annotate_dats_object(
     context = find_context(schema["id"], context_dir)
     for k, v in json_object.items():
         if isinstance(v, dict):
-            _schema = find_schema(schema, k, v)
-            json_object[k], _local_context = annotate_dats_object(
-                v, _schema, specific_context, context_dir
+            _schema = find_schema(schema, k, v, registry)
+            json_object[k], _local_context = yield annotate_node(
+                v, _schema, specific_context, context_dir, registry
             )
             specific_context.update(_local_context)
         if isinstance(v, list):
@@ -146,9 +302,9 @@ def annotate_dats_object(
                 if not isinstance(vv, dict):
                     annotation_list.append(vv)
                     continue
-                _schema = find_schema(schema, k, vv)
-                _json_o, _local_context = annotate_dats_object(
-                    vv, _schema, specific_context, context_dir
+                _schema = find_schema(schema, k, vv, registry)
+                _json_o, _local_context = yield annotate_node(
+                    vv, _schema, specific_context, context_dir, registry
                 )
                 annotation_list.append(_json_o)
                 specific_context.update(_local_context)
@@ -209,9 +365,22 @@ def gen_jsonld_outpath(dats_json_f, out_path):
     return dats_jsonld_f
 
 
-def dats_to_jsonld(dats_f, schema_f, context_dir, out_path=None, clobber=False):
+def dats_to_jsonld(
+    dats_f,
+    schema_f,
+    context_dir,
+    out_path=None,
+    clobber=False,
+    schema=None,
+    raise_invalid=False,
+):
     """
     Helper function to load the inputs and store the annotated DATS.jsonld file
+
+    :param schema: the DATS JSON schema already loaded from schema_f, if any
+    :param raise_invalid: raise a ValueError listing the validation errors of an invalid
+        DATS file instead of skipping it
+    :return: the path of the DATS.jsonld file, None if the file was not annotated
     """
     # TODO: log how many terms were not annotated because they are missing from context
     tic = time.time()
@@ -229,13 +398,28 @@ def dats_to_jsonld(dats_f, schema_f, context_dir, out_path=None, clobber=False):
             )
             return
 
-    dats_json = json.load(open(dats_f))
-    schema = json.load(open(schema_f))
+    with open(dats_f) as f:
+        dats_json = json.load(f)
+    if schema is None:
+        with open(schema_f) as f:
+            schema = json.load(f)
+    registry = get_schema_registry(pal.Path(schema_f).parent.resolve())
 
     # Do a very basic validation of the JSON object before we try to annotate it
-    if not jss.Draft4Validator(schema).is_valid(dats_json):
+    validator = registry.validator(schema)
+    if raise_invalid:
+        errors = [
+            f"{'.'.join(str(v) for v in error.path)}: {error.message}"
+            for error in validator.iter_errors(dats_json)
+        ]
+        if errors:
+            raise ValueError(
+                f"{pal.Path(dats_f).resolve()} is not a valid DATS file: "
+                + "; ".join(errors)
+            )
+    elif not validator.is_valid(dats_json):
         logger.error(
-            f"{dats_f.resolve()} is not a valid DATS file. "
+            f"{pal.Path(dats_f).resolve()} is not a valid DATS file. "
             f"If you think this should be a valid DATS file, "
             f"please use the CONP validator to get a list of specific errors."
             f"\n\nSkipping this file."
@@ -244,9 +428,12 @@ def dats_to_jsonld(dats_f, schema_f, context_dir, out_path=None, clobber=False):
 
     # Now do the annotation
     try:
-        dats_jsonld, context = annotate_dats_object(dats_json, schema, {}, context_dir)
-    except Exception as e:
-        logger.exception(f"Annotating {dats_f} did not complete!", e, exc_info=True)
+        dats_jsonld, context = annotate_dats_object(
+            dats_json, schema, {}, context_dir, registry
+        )
+    except Exception:
+        logger.exception(f"Annotating {dats_f} did not complete!")
+        raise
 
     # Prefill the context with the SDO mapping
     context["sdo"] = "https://schema.org/"
@@ -254,10 +441,83 @@ def dats_to_jsonld(dats_f, schema_f, context_dir, out_path=None, clobber=False):
     dats_jsonld["@context"] = [
         context,
     ]
+    # Write to a temporary file first so that an interrupted run never leaves a partial file
+    tmp_f = dats_jsonld_f.with_name(f".{dats_jsonld_f.name}.{os.getpid()}.tmp")
+    with open(tmp_f, "w") as f:
+        # Streamed without recursion, for very large and deep DATS instances
+        dump(dats_jsonld, f, indent=2)
+    os.replace(tmp_f, dats_jsonld_f)
     logger.info(
         f"Final result written to {dats_jsonld_f.resolve()}! This took {time.time()-tic :.2f} seconds"
     )
-    json.dump(dats_jsonld, open(dats_jsonld_f, "w"), indent=2)
+    return dats_jsonld_f
+
+
+# Schema and options of the running batch, inherited by the forked worker processes
+_batch = {}
+
+
+def convert_batch_file(dats_f):
+    """
+    Annotate one file of the batch and time it. Exceptions, including the validation errors
+    of an invalid DATS file, are reported instead of raised.
+
+    :param dats_f: the path to the DATS instance file
+    :return: a dictionary with the file, the output path, the status and the runtime
+    """
+    tic = time.time()
+    result = {"file": str(dats_f), "output": None, "status": "skipped", "error": None}
+    try:
+        dats_jsonld_f = dats_to_jsonld(dats_f=dats_f, raise_invalid=True, **_batch)
+        if dats_jsonld_f is not None:
+            result["output"] = str(dats_jsonld_f)
+            result["status"] = "converted"
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["time"] = time.time() - tic
+    return result
+
+
+def dats_to_jsonld_batch(
+    files_to_convert, schema_f, context_dir, out_path=None, clobber=False, jobs=None
+):
+    """
+    Annotate several DATS files across a pool of processes.
+
+    The schema, the schema registry and the contexts are loaded once before the workers are
+    forked, so that every worker shares them copy-on-write instead of loading them again.
+
+    :param files_to_convert: the paths to the DATS instance files
+    :param jobs: the number of processes, by default the number of CPUs
+    :return: the list of convert_batch_file results, in the order of files_to_convert
+    """
+    with open(schema_f) as f:
+        schema = json.load(f)
+    schema_registry = get_schema_registry(pal.Path(schema_f).parent.resolve())
+    context_registry = get_context_registry(pal.Path(context_dir).resolve())
+    for schema_id in schema_registry.store:
+        try:
+            context_registry.get(schema_id)
+        except FileNotFoundError:
+            logger.debug(f"No context file for {schema_id}")
+
+    _batch.clear()
+    _batch.update(
+        schema_f=schema_f,
+        context_dir=context_dir,
+        out_path=out_path,
+        clobber=clobber,
+        schema=schema,
+    )
+
+    if jobs == 1 or "fork" not in multiprocessing.get_all_start_methods():
+        return [convert_batch_file(dats_f) for dats_f in files_to_convert]
+
+    with ProcessPoolExecutor(
+        max_workers=jobs, mp_context=multiprocessing.get_context("fork")
+    ) as executor:
+        return list(executor.map(convert_batch_file, files_to_convert))
 
 
 def main(cli_args):
@@ -290,6 +550,19 @@ def main(cli_args):
         help="Where to create the JSONLD file(s) (default = in the same folder).",
     )
     parser.add_argument("--clobber", action="store_true")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of processes used to annotate a directory (default = number of CPUs).",
+    )
+    parser.add_argument(
+        "--report",
+        type=pal.Path,
+        default=None,
+        help="Where to write a JSON report with the status and runtime of each file.",
+    )
     args = parser.parse_args(cli_args)
 
     if args.dats_path.is_file():
@@ -302,7 +575,7 @@ def main(cli_args):
         )
     elif args.dats_path.is_dir():
         files_to_convert = list(args.dats_path.glob("*/DATS.json"))
-        if not args.out.is_dir():
+        if args.out is not None and not args.out.is_dir():
             logger.warning(
                 f"The {args.out.resolve()} folder will be created and JSONLD files will be saved in it."
             )
@@ -317,19 +590,28 @@ def main(cli_args):
             f"Found {len(files_to_convert)} files to convert at {args.dats_path.resolve()}"
         )
         start = time.time()
-        for file_idx, dats_f in enumerate(files_to_convert, start=1):
+        results = dats_to_jsonld_batch(
+            files_to_convert,
+            schema_f=args.dats_schema,
+            context_dir=args.dats_context_dir,
+            out_path=args.out,
+            clobber=args.clobber,
+            jobs=args.jobs,
+        )
+        for result in results:
             logger.info(
-                f"Now processing file {file_idx}/{len(files_to_convert)}: {dats_f.parent.name}"
-            )
-            dats_to_jsonld(
-                dats_f=dats_f,
-                schema_f=args.dats_schema,
-                context_dir=args.dats_context_dir,
-                out_path=args.out,
-                clobber=args.clobber,
+                f"{result['status']}: {result['file']} ({result['time']:.2f} seconds)"
             )
+            if result["status"] == "failed":
+                logger.error(f"{result['file']} failed: {result['error']}")
+        if args.report is not None:
+            with open(args.report, "w") as f:
+                json.dump(results, f, indent=2)
         logger.info(
             f"Completed annotating {len(files_to_convert)} DATS files. "
+            f"{sum(r['status'] == 'converted' for r in results)} converted, "
+            f"{sum(r['status'] == 'skipped' for r in results)} skipped, "
+            f"{sum(r['status'] == 'failed' for r in results)} failed. "
             f"This took {time.time()-start :.2f} seconds."
         )
     else:
@@ -0,0 +1,126 @@
+"""Explicit-stack traversal of DATS documents shared by the validator and the annotator.
+
+Deep `hasPart` hierarchies and long lists would otherwise pay one Python call per node
+and may hit the recursion limit, including when the documents are written with json.dump.
+"""
+import json
+from collections import namedtuple
+
+
+def trampoline(node):
+    """
+    Run a recursive procedure written as generators without growing the Python stack.
+
+    A node generator yields the generator of each child it needs the result of, and
+    receives that result back from the yield expression. Children are therefore visited
+    once and in the same order as with plain recursion.
+
+    :param node: the generator of the root node
+    :return: the value returned by the root node generator
+    """
+    stack = [node]
+    value = None
+    while stack:
+        try:
+            child = stack[-1].send(value)
+        except StopIteration as e:
+            stack.pop()
+            value = e.value
+            continue
+        stack.append(child)
+        value = None
+    return value
+
+
+def iter_preorder(root, children):
+    """
+    Iterate over a tree of nodes in depth-first preorder.
+
+    :param root: the root node
+    :param children: a function returning the children of a node
+    :return: a generator of the nodes
+    """
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(list(children(node))))
+
+
+def iter_datasets(dats):
+    """
+    Iterate over a DATS dataset and all of its parts, in depth-first preorder.
+
+    :param dats: the DATS dataset as a dictionary
+    :return: a generator of the datasets
+    """
+    return iter_preorder(dats, lambda dataset: dataset.get("hasPart", []))
+
+
+# A value to encode at a given indentation level
+_Value = namedtuple("_Value", ["value", "level"])
+
+_encode_scalar = json.JSONEncoder().encode
+
+
+def _encode_key(key):
+    if isinstance(key, str):
+        return _encode_scalar(key)
+    if key is True or key is False or key is None:
+        return _encode_scalar(_encode_scalar(key))
+    return _encode_scalar(str(key))
+
+
+def _encode(value, level, indent):
+    if isinstance(value, dict):
+        if not value:
+            yield "{}"
+            return
+        yield "{"
+        for i, (key, item) in enumerate(value.items()):
+            separator = "," if i else ""
+            yield f"{separator}\n{' ' * indent * (level + 1)}{_encode_key(key)}: "
+            yield _Value(item, level + 1)
+        yield f"\n{' ' * indent * level}}}"
+    elif isinstance(value, (list, tuple)):
+        if not value:
+            yield "[]"
+            return
+        yield "["
+        for i, item in enumerate(value):
+            separator = "," if i else ""
+            yield f"{separator}\n{' ' * indent * (level + 1)}"
+            yield _Value(item, level + 1)
+        yield f"\n{' ' * indent * level}]"
+    else:
+        yield _encode_scalar(value)
+
+
+def iterencode(obj, indent=2):
+    """
+    Encode a JSON document chunk by chunk, without recursion.
+
+    The output is the same as json.dump(obj, f, indent=indent), whose pure Python encoder
+    recurses once per nesting level.
+
+    :param obj: the JSON document
+    :param indent: the number of spaces per indentation level
+    :return: a generator of the string chunks of the document
+    """
+    stack = [_encode(obj, 0, indent)]
+    while stack:
+        try:
+            chunk = next(stack[-1])
+        except StopIteration:
+            stack.pop()
+            continue
+        if isinstance(chunk, _Value):
+            stack.append(_encode(chunk.value, chunk.level, indent))
+        else:
+            yield chunk
+
+
+def dump(obj, fp, indent=2):
+    """Write a JSON document to a file object as it is encoded."""
+    for chunk in iterencode(obj, indent=indent):
+        fp.write(chunk)
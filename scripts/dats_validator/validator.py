@@ -1,21 +1,66 @@
+import functools
 import getopt
+import glob
+import hashlib
 import json
 import logging
 import os
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 from sys import argv
+from urllib.parse import urldefrag
 
 import jsonschema
 import requests
 
+try:
+    import fastjsonschema
+except ImportError:
+    # fastjsonschema is an optional accelerator of the schema validation
+    fastjsonschema = None
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", ".."))
+from scripts.catalog_index import discover_dats_files  # noqa: E402
+from scripts.dats_traversal import iter_datasets  # noqa: E402
+
 
 logger = logging.getLogger(__name__)
-# path to a top-level schema
-SCHEMA_PATH = os.path.join(
+# path to the schema directory and to the top-level schema
+SCHEMA_DIR = os.path.join(
     os.path.dirname(os.path.realpath(__file__)),
     "conp-dats",
-    "dataset_schema.json",
 )
-
+SCHEMA_PATH = os.path.join(SCHEMA_DIR, "dataset_schema.json")
+
+# on-disk cache of the derivedFrom URL checks, entries expire after a day
+URL_CACHE_PATH = os.getenv(
+    "CONP_URL_CACHE",
+    os.path.join(
+        os.path.expanduser("~"), ".cache", "conp-dataset", "derived-from.json"
+    ),
+)
+URL_CACHE_TTL = int(os.getenv("CONP_URL_CACHE_TTL", 24 * 60 * 60))
+URL_TIMEOUT = 30
+
+# accept the files the fastjsonschema validator finds valid without validating them
+# with jsonschema; the two libraries may disagree, so this is only enabled on request
+FAST_VALIDATION = os.getenv("CONP_FAST_VALIDATION", "0") == "1"
+
+# results of the validation keyed by DATS content, schema and validator hashes,
+# they expire with the derivedFrom URL checks they depend on
+VALIDATION_STORE_DIR = os.getenv(
+    "CONP_VALIDATION_STORE",
+    os.path.join(
+        os.path.expanduser("~"),
+        ".cache",
+        "conp-dataset",
+        "dats-validation",
+    ),
+)
 
 # set value to 0 if there is no controlled vocabulary list, set value to a list if there is one.
 REQUIRED_EXTRA_PROPERTIES = {
@@ -29,6 +74,9 @@ def main(argv):
     FORMAT = "%(message)s"
     logging.basicConfig(format=FORMAT)
     logging.getLogger().setLevel(logging.INFO)
+    if argv and argv[0] == "validate-all":
+        return main_validate_all(argv[1:])
+
     opts, args = getopt.getopt(argv, "", ["file="])
     json_filename = ""
 
@@ -46,32 +94,137 @@ def main(argv):
         validate_non_schema_required(json_obj)
 
 
+def main_validate_all(argv):
+    opts, args = getopt.getopt(argv, "", ["root=", "jobs=", "output=", "no-cache"])
+    root = "."
+    jobs = None
+    output = "dats-validation.json"
+    store = ValidationStore()
+
+    for opt, arg in opts:
+        if opt == "--root":
+            root = arg
+        elif opt == "--jobs":
+            jobs = int(arg)
+        elif opt == "--output":
+            output = arg
+        elif opt == "--no-cache":
+            store = None
+
+    dats_files = get_dats_files(root)
+    logger.info(f"Validating {len(dats_files)} DATS files.")
+    results = validate_all(dats_files, jobs=jobs, store=store)
+    write_report(results, output)
+
+    invalid = [result["file"] for result in results if not result["valid"]]
+    for dats_file in invalid:
+        logger.error(f"Validation failed: {dats_file}")
+    logger.info(
+        f"{len(results) - len(invalid)}/{len(results)} DATS files are valid. "
+        f"Report written to {output}.",
+    )
+    exit(1 if invalid else 0)
+
+
 def validate_json(json_obj):
-    with open(SCHEMA_PATH) as s:
+    is_valid, errors = validate_schema(json_obj)
+    if is_valid:
+        logger.info("JSON schema validation passed.")
+        return True
+
+    logger.info(f"The file is not valid. Total json schema errors: {len(errors)}")
+    for i, error in enumerate(errors, 1):
+        logger.error(f"{i} {error}")
+    logger.info("JSON schema validation failed.")
+    return False
+
+
+def validate_schema(json_obj, fast=None):
+    """Validates the JSON object against the DATS schema with jsonschema.
+
+    With the fast validation, a file that the fastjsonschema validator finds valid
+    is accepted without running jsonschema. The errors of an invalid file always
+    come from jsonschema.
+
+    :param fast: whether to use the fast validation, FAST_VALIDATION by default
+    """
+
+    fast = FAST_VALIDATION if fast is None else fast
+    fast_validator = get_fast_validator() if fast else None
+    if fast_validator is not None:
+        try:
+            fast_validator(json_obj)
+            return True, []
+        except fastjsonschema.JsonSchemaException:
+            pass
+
+    errors_list = [
+        f"Validation error in {'.'.join(str(v) for v in error.path)}: {error.message}"
+        for error in get_validator().iter_errors(json_obj)
+    ]
+    return not errors_list, errors_list
+
+
+@functools.lru_cache(maxsize=None)
+def load_schema_store(schema_dir=SCHEMA_DIR):
+    """Loads every schema of the DATS schema directory, keyed by their id."""
+
+    store = {}
+    for schema_file in glob.glob(os.path.join(schema_dir, "*.json")):
+        with open(schema_file) as s:
+            schema = json.load(s)
+        if isinstance(schema, dict) and "id" in schema:
+            store[urldefrag(schema["id"])[0]] = schema
+    return store
+
+
+def resolve_remote_schema(uri):
+    """Returns a referenced schema from the local store, downloads it otherwise."""
+
+    store = load_schema_store()
+    url = urldefrag(uri)[0]
+    if url not in store:
+        store[url] = requests.get(url, timeout=30).json()
+    return store[url]
+
+
+@functools.lru_cache(maxsize=None)
+def get_validator(schema_path=SCHEMA_PATH):
+    """Returns the DATS schema validator, compiled once per process."""
+
+    with open(schema_path) as s:
         json_schema = json.load(s)
-    # first validate schema file
-    v = jsonschema.Draft4Validator(
+    resolver = jsonschema.RefResolver.from_schema(
         json_schema,
+        store=load_schema_store(os.path.dirname(schema_path)),
+    )
+    return jsonschema.Draft4Validator(
+        json_schema,
+        resolver=resolver,
         format_checker=jsonschema.FormatChecker(),
     )
-    # now validate json file
+
+
+@functools.lru_cache(maxsize=None)
+def get_fast_validator(schema_path=SCHEMA_PATH):
+    """Returns a code-generated validator of the DATS schema if fastjsonschema is installed."""
+
+    if fastjsonschema is None:
+        return None
+
+    with open(schema_path) as s:
+        json_schema = json.load(s)
     try:
-        jsonschema.validate(
-            json_obj,
+        return fastjsonschema.compile(
             json_schema,
-            format_checker=jsonschema.FormatChecker(),
+            handlers={
+                "http": resolve_remote_schema,
+                "https": resolve_remote_schema,
+            },
         )
-        logger.info("JSON schema validation passed.")
-        return True
-    except jsonschema.exceptions.ValidationError:
-        errors = [e for e in v.iter_errors(json_obj)]
-        logger.info(f"The file is not valid. Total json schema errors: {len(errors)}")
-        for i, error in enumerate(errors, 1):
-            logger.error(
-                f"{i} Validation error in {'.'.join(str(v) for v in error.path)}: {error.message}",
-            )
-        logger.info("JSON schema validation failed.")
-        return False
+    except Exception as e:
+        logger.debug(f"Cannot compile the fast validator, using jsonschema only: {e}")
+        return None
 
 
 def validate_extra_properties(dataset):
@@ -323,25 +476,25 @@ def validate_types(dataset):
         return True, errors_list
 
 
+# checks applied to every dataset of a DATS file by validate_recursively
+NON_SCHEMA_CHECKS = (
+    validate_extra_properties,
+    validate_formats,
+    validate_date_types,
+    validate_privacy,
+    validate_is_about,
+    validate_types,
+)
+
+
 def validate_recursively(obj, errors):
     """Checks all datasets recursively for non-schema checks."""
 
-    val, errors_list = validate_extra_properties(obj)
-    errors.extend(errors_list)
-    val, errors_list = validate_formats(obj)
-    errors.extend(errors_list)
-    val, errors_list = validate_date_types(obj)
-    errors.extend(errors_list)
-    val, errors_list = validate_privacy(obj)
-    errors.extend(errors_list)
-    val, errors_list = validate_is_about(obj)
-    errors.extend(errors_list)
-    val, errors_list = validate_types(obj)
-    errors.extend(errors_list)
-
-    if "hasPart" in obj:
-        for each in obj["hasPart"]:
-            validate_recursively(each, errors)
+    # the datasets are visited with an explicit stack in the same order as a recursion
+    for dataset in iter_datasets(obj):
+        for check in NON_SCHEMA_CHECKS:
+            val, errors_list = check(dataset)
+            errors.extend(errors_list)
 
 
 def validate_non_schema_required(json_obj):
@@ -359,33 +512,388 @@ def validate_non_schema_required(json_obj):
         return True, None
 
 
-# cache responses to avoid redundant calls
-cache = {}
+class UrlStatusCache:
+    """On-disk cache of the derivedFrom URL checks, shared across runs.
+
+    Entries are stored as JSON {url: {"exists": bool, "checked": timestamp}} and
+    expire after URL_CACHE_TTL seconds.
+    """
+
+    def __init__(self, path=URL_CACHE_PATH, ttl=URL_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, url, now=None):
+        """Returns the cached status of the URL, None if unknown or expired."""
+
+        entry = self.entries.get(url)
+        now = time.time() if now is None else now
+        if entry is None or now - entry["checked"] > self.ttl:
+            return None
+        return entry["exists"]
+
+    def set(self, url, exists, now=None):
+        with self.lock:
+            self.entries[url] = {
+                "exists": exists,
+                "checked": time.time() if now is None else now,
+            }
+
+    def save(self):
+        """Writes the cache atomically, keeping the entries saved by other processes."""
+
+        with self.lock:
+            entries = {**self.load(), **self.entries}
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f, indent=4, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self.entries = entries
+
+
+@functools.lru_cache(maxsize=None)
+def get_url_cache():
+    return UrlStatusCache(URL_CACHE_PATH)
 
 
 def dataset_exists(derived_from_url):
-    """Caches response values in cache dict."""
+    """Returns whether the derivedFrom URL is reachable, using the on-disk cache."""
+
+    return check_urls([derived_from_url], jobs=1)[derived_from_url]
+
+
+def check_urls(urls, jobs=16, url_cache=None):
+    """Checks the URLs that are not in the cache concurrently.
+
+    :param urls: URLs to check
+    :param jobs: number of concurrent requests
+    :param url_cache: UrlStatusCache, by default the one at URL_CACHE_PATH
+    :return: dictionary with whether each URL is reachable
+    """
+
+    url_cache = url_cache or get_url_cache()
+    statuses = {url: url_cache.get(url) for url in set(urls)}
+    unknown = [url for url, status in statuses.items() if status is None]
+
+    if unknown:
+        with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(unknown)))) as pool:
+            for url, status in zip(unknown, pool.map(get_response_status, unknown)):
+                statuses[url] = bool(status)
+                # network errors are not cached so they are retried on the next run
+                if status is not None:
+                    url_cache.set(url, status)
+        url_cache.save()
+
+    return statuses
+
+
+def get_response_status(derived_from_url, timeout=URL_TIMEOUT):
+    """Checks that the derivedFrom URL responds with a 200 status code.
+
+    A HEAD request is tried first; servers that do not support it are queried
+    with a streamed GET whose body is not downloaded.
+
+    :return: True or False, None if the server cannot be reached
+    """
+
+    try:
+        r = requests.head(derived_from_url, timeout=timeout, allow_redirects=True)
+        if r.status_code != 200:
+            with requests.get(
+                derived_from_url,
+                timeout=timeout,
+                stream=True,
+            ) as r:
+                pass
+        return r.status_code == 200
+
+    except requests.exceptions.RequestException as e:
+        logger.debug(f"Cannot reach {derived_from_url}: {e}")
+        return None
+
+
+def collect_derived_from(json_obj):
+    """Returns the derivedFrom values of a dataset and of its parts."""
+
+    return [
+        value["value"]
+        for dataset in iter_datasets(json_obj)
+        for prop in dataset.get("extraProperties", [])
+        if prop.get("category") == "derivedFrom"
+        for value in prop.get("values", [])
+    ]
+
+
+def hash_files(paths):
+    """Returns the SHA-256 of the content of the files, in order."""
+
+    sha = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def get_schema_hash(schema_dir=SCHEMA_DIR):
+    return hash_files(sorted(glob.glob(os.path.join(schema_dir, "*.json"))))
+
+
+@functools.lru_cache(maxsize=None)
+def get_validator_version():
+    """Hash of this module and of the modules it imports the rules from, so that any
+    change of the rules invalidates the store."""
+
+    return hash_files(
+        [
+            os.path.realpath(__file__),
+            os.path.realpath(sys.modules[iter_datasets.__module__].__file__),
+        ],
+    )
+
+
+def get_validation_key(content):
+    """Returns the store key of a DATS file content for the current schema and rules."""
+
+    sha = hashlib.sha256(content)
+    sha.update(get_schema_hash().encode())
+    sha.update(get_validator_version().encode())
+    # the fast validation may accept files that jsonschema rejects
+    if FAST_VALIDATION:
+        sha.update(b"fast")
+    return sha.hexdigest()
+
+
+class ValidationStore:
+    """Validation results stored one file per key, written atomically."""
+
+    def __init__(self, directory=VALIDATION_STORE_DIR, max_age=URL_CACHE_TTL):
+        self.directory = directory
+        self.max_age = max_age
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key, now=None):
+        """Returns the stored result, None if missing or older than max_age."""
+
+        try:
+            with open(self.path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        now = time.time() if now is None else now
+        if now - entry["validated"] > self.max_age:
+            return None
+        return entry["result"]
+
+    def put(self, key, result, now=None):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.path(key)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "validated": time.time() if now is None else now,
+                    "result": result,
+                },
+                f,
+            )
+        os.replace(tmp_path, self.path(key))
+
+
+def check_non_schema_required(json_obj):
+    """Same checks as validate_non_schema_required without the error report."""
+
+    errors = []
+    validate_recursively(json_obj, errors)
+    return not errors, errors
+
+
+# checks run by validate-all, in order, on every DATS file; the date types, privacy
+# and isAbout checks are part of NON_SCHEMA_CHECKS, run on every nested dataset
+CHECKS = {
+    "schema": validate_schema,
+    "non_schema_required": check_non_schema_required,
+}
+
+
+def get_dats_files(root="."):
+    """Finds the DATS.json of every project and of their nested subdatasets.
+
+    The datasets are discovered the same way as by the catalog index.
+    """
+
+    return [
+        os.path.join(root, path, "DATS.json")
+        for path, _, _ in discover_dats_files(root)
+    ]
 
-    if derived_from_url not in cache:
-        cache[derived_from_url] = get_response_status(derived_from_url)
-    return cache[derived_from_url]
 
+def validate_file(dats_file, store=None):
+    """Runs every check on a DATS file, unless its result is already in the store.
+
+    :param dats_file: path to the DATS file
+    :param store: ValidationStore of the previous results, None to always validate
+    :return: dictionary with the file, its validity, the errors of each check and the runtime
+    """
 
-def get_response_status(derived_from_url):
-    """Get a response status code for derivedFrom value. Returns True if status code is 200."""
+    start = time.monotonic()
+    result = {"file": dats_file, "valid": True, "errors": {}}
 
     try:
-        r = requests.get(derived_from_url)
-        r.raise_for_status()
-        if r.status_code == 200:
-            return True
+        with open(dats_file, "rb") as f:
+            content = f.read()
+        json_obj = json.loads(content)
+    except (OSError, ValueError) as e:
+        result["valid"] = False
+        result["errors"]["load"] = [f"Cannot load {dats_file}: {e}"]
+        result["time"] = time.monotonic() - start
+        return result
+
+    key = get_validation_key(content) if store is not None else None
+    stored = store.get(key) if store is not None else None
+    if stored is not None:
+        return {
+            **result,
+            "valid": stored["valid"],
+            "errors": stored["errors"],
+            "cached": True,
+            "time": time.monotonic() - start,
+        }
+
+    # a result that depends on an exception or on a URL that could not be reached
+    # is not stored, so that it is computed again on the next run
+    determinate = True
+    for name, check in CHECKS.items():
+        try:
+            is_valid, errors = check(json_obj)
+        except Exception as e:
+            is_valid, errors = False, [f"{type(e).__name__}: {e}"]
+            determinate = False
+        if not is_valid:
+            result["valid"] = False
+            result["errors"][name] = errors
+
+    if determinate:
+        try:
+            url_cache = get_url_cache()
+            determinate = all(
+                url_cache.get(url) is not None for url in collect_derived_from(json_obj)
+            )
+        except (AttributeError, KeyError, TypeError):
+            determinate = False
+
+    if store is not None and determinate:
+        store.put(key, {"valid": result["valid"], "errors": result["errors"]})
+
+    result["time"] = time.monotonic() - start
+    return result
+
+
+def validate_all(dats_files, jobs=None, store=None):
+    """Validates DATS files across a pool of processes.
+
+    :param dats_files: paths to the DATS files
+    :param jobs: number of processes, by default the number of CPUs
+    :param store: ValidationStore of the previous results, None to always validate
+    :return: list of the validate_file results, in the order of dats_files
+    """
 
-    except requests.exceptions.HTTPError:
-        return False
+    # check every derivedFrom URL of the files to validate once, concurrently,
+    # before the validation processes read them from the on-disk cache
+    urls = []
+    for dats_file in dats_files:
+        try:
+            with open(dats_file, "rb") as f:
+                content = f.read()
+            if store is not None and store.get(get_validation_key(content)):
+                continue
+            urls.extend(collect_derived_from(json.loads(content)))
+        except (OSError, ValueError, AttributeError, KeyError, TypeError):
+            continue
+    check_urls(urls)
+    get_url_cache.cache_clear()
+
+    if jobs == 1:
+        return [validate_file(dats_file, store) for dats_file in dats_files]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(
+            executor.map(
+                validate_file,
+                dats_files,
+                [store] * len(dats_files),
+            ),
+        )
+
+
+def write_report(results, output):
+    """Writes the validation results as JUnit XML if output ends with .xml, as JSON otherwise."""
+
+    if output.endswith(".xml"):
+        write_junit_report(results, output)
+        return
+
+    report = {
+        "total": len(results),
+        "invalid": sum(not result["valid"] for result in results),
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=4)
+
+
+def write_junit_report(results, output):
+    """Writes one test case per DATS file and check."""
+
+    testsuite = ET.Element(
+        "testsuite",
+        name="dats-validator",
+        failures=str(sum(len(result["errors"]) for result in results)),
+        time=f"{sum(result['time'] for result in results):.3f}",
+    )
+    for result in results:
+        # a file that cannot be loaded is reported as a single failed load check
+        names = ["load"] if "load" in result["errors"] else list(CHECKS)
+        for name in names:
+            testcase = ET.SubElement(
+                testsuite,
+                "testcase",
+                classname=result["file"],
+                name=name,
+            )
+            if name in result["errors"]:
+                errors = result["errors"][name]
+                failure = ET.SubElement(
+                    testcase,
+                    "failure",
+                    message=f"{len(errors)} validation errors",
+                )
+                failure.text = "\n".join(errors)
+    testsuite.set("tests", str(len(testsuite)))
+
+    ET.ElementTree(testsuite).write(output, encoding="utf-8", xml_declaration=True)
 
 
 def help():
-    return logger.info("Usage: python validator.py --file=doc.json")
+    return logger.info(
+        "Usage: python validator.py --file=doc.json\n"
+        "       python validator.py validate-all [--root=.] [--jobs=N] "
+        "[--output=report.json|report.xml] [--no-cache]",
+    )
 
 
 if __name__ == "__main__":
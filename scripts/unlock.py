@@ -1,11 +1,22 @@
 #!/usr/bin/env python
+from __future__ import annotations
+
 import json
 import os
 import re
+import sys
+import tempfile
 import traceback
+from io import BytesIO
 
 from datalad import api
 from git import Repo
+from gitdb.base import IStream
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from scripts.annex_batch import registerurl  # noqa: E402
+from scripts.annex_batch import rmurl  # noqa: E402
+from scripts.annex_inventory import AnnexInventory  # noqa: E402
 
 
 def project_name2env(project_name: str) -> str:
@@ -34,6 +45,90 @@ def project_name2env(project_name: str) -> str:
     return project_env.upper()
 
 
+def compile_links(links: list[str]) -> re.Pattern:
+    """Compile a single alternation matching any of the archive links.
+
+    Longer links come first so that a link is never matched by one of its prefixes.
+    """
+    return re.compile(
+        "|".join(re.escape(link) for link in sorted(set(links), key=len, reverse=True)),
+    )
+
+
+def inject_token(content: str, links: re.Pattern, token: str) -> str | None:
+    """Append the access token to the links found in a git-annex log.
+
+    Parameters
+    ----------
+    content: str
+        Content of a `.log.web` file of the git-annex branch.
+    links: re.Pattern
+        Pattern returned by `compile_links`.
+    token: str
+        Zenodo access token.
+
+    Return
+    ------
+    content: str | None
+        The content with the token added, None if it is unchanged.
+    """
+    if "access_token" in content:
+        return None
+    content, count = links.subn(lambda m: f"{m.group(0)}?access_token={token}", content)
+    return content if count else None
+
+
+def unlock_archive_links(repo: Repo, links: list[str], token: str) -> bool:
+    """Add the access token to the archive links of the git-annex branch.
+
+    The web URL logs of the git-annex branch are scanned once with a single pattern
+    and the modified logs are committed to the branch through a temporary index,
+    without checking it out.
+
+    Return
+    ------
+    changes: bool
+        Whether the git-annex branch was updated.
+    """
+    # Commit the pending git-annex journal to the branch first.
+    repo.git.annex("merge")
+
+    pattern = compile_links(links)
+    parent = repo.git.rev_parse("refs/heads/git-annex")
+    index_info = []
+    # NUL separated entries keep the paths unquoted.
+    for entry in repo.git.ls_tree("-r", "-z", parent).split("\0"):
+        if not entry:
+            continue
+        meta, path = entry.split("\t", 1)
+        mode, _, sha = meta.split()
+        if not path.endswith(".log.web"):
+            continue
+        _, _, _, data = repo.git.get_object_data(sha)
+        content = inject_token(data.decode("utf-8"), pattern, token)
+        if content is None:
+            continue
+        data = content.encode("utf-8")
+        blob = repo.odb.store(IStream("blob", len(data), BytesIO(data)))
+        index_info.append(f"{mode} {blob.hexsha.decode()}\t{path}")
+
+    if not index_info:
+        return False
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = {"GIT_INDEX_FILE": os.path.join(tmp_dir, "index")}
+        index_info_path = os.path.join(tmp_dir, "index-info")
+        with open(index_info_path, "w") as f:
+            f.write("\n".join(index_info) + "\n")
+        repo.git.read_tree(parent, env=env)
+        with open(index_info_path, "rb") as f:
+            repo.git.update_index("--index-info", istream=f, env=env)
+        tree = repo.git.write_tree(env=env)
+    commit = repo.git.commit_tree(tree, "-p", parent, "-m", "Unlock dataset")
+    repo.git.update_ref("refs/heads/git-annex", commit, parent)
+    return True
+
+
 def unlock():
     repo = Repo()
     project: str = project_name2env(repo.working_dir.split("/")[-1])
@@ -44,7 +139,6 @@ def unlock():
             f"{project}_ZENODO_TOKEN not found. Cannot inject the Zenodo token into the git-annex urls.",
         )
 
-    annex = repo.git.annex
     if repo.active_branch.name != "master":
         raise Exception("Dataset repository not set to branch 'master'")
 
@@ -65,39 +159,47 @@ def unlock():
 
     # Set token in archive link URLs
     if len(metadata["private_files"]["archive_links"]) > 0:
-        repo.git.checkout("git-annex")
-        changes = False
-        for link in metadata["private_files"]["archive_links"]:
-            for dir_name, _, files in os.walk("."):
-                for file_name in files:
-                    file_path = os.path.join(dir_name, file_name)
-                    if ".git" in file_path:
-                        continue
-                    with open(file_path) as f:
-                        s = f.read()
-                    if link in s and "access_token" not in s:
-                        changes = True
-                        s = s.replace(link, link + "?access_token=" + token)
-                        with open(file_path, "w") as f:
-                            f.write(s)
-        if changes:
-            repo.git.add(".")
-            repo.git.commit("-m", "Unlock dataset")
-        repo.git.checkout("master")
+        unlock_archive_links(repo, metadata["private_files"]["archive_links"], token)
 
     # Set token in non-archive link URLs
     if len(metadata["private_files"]["files"]) > 0:
-        datalad = api.Dataset(".")
+        inventory = AnnexInventory.from_dataset(".")
+        files = []
         for file in metadata["private_files"]["files"]:
-            annex("rmurl", file["name"], file["link"])
-            annex(
-                "addurl",
-                file["link"] + "?access_token=" + token,
-                "--file",
-                file["name"],
-                "--relaxed",
+            if file["name"] not in inventory:
+                print(f"WARNING: {file['name']} is not an annexed file, skipping.")
+                continue
+            files.append(file)
+
+        # The old link is only removed once the link with the token is registered.
+        registered = [
+            file
+            for file, (_, result) in zip(
+                files,
+                registerurl(
+                    ".",
+                    (
+                        (
+                            inventory.key(file["name"]),
+                            file["link"] + "?access_token=" + token,
+                        )
+                        for file in files
+                    ),
+                ),
             )
-            datalad.save()
+            if result.get("success", False)
+        ]
+        for file in files:
+            if file not in registered:
+                print(
+                    f"WARNING: could not register the unlocked URL of {file['name']}."
+                )
+        for _, result in rmurl(
+            ".", ((file["name"], file["link"]) for file in registered)
+        ):
+            if not result.get("success", False):
+                print(f"WARNING: {result}")
+        api.Dataset(".").save()
 
     print("Done")
 
@@ -0,0 +1,50 @@
+import os
+
+
+DATASET_TEST_MODULE = "tests.test_datasets"
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--ignore-results-cache",
+        action="store_true",
+        default=False,
+        help="Run the dataset tests even when they already passed on the same commit.",
+    )
+    parser.addoption(
+        "--shard",
+        default=None,
+        help=(
+            "Only run the tests of a shard given as INDEX/TOTAL, e.g. 0/2. Datasets are "
+            "balanced amongs shards with their runtime in the previous test results, "
+            "other tests only run in the first shard."
+        ),
+    )
+    parser.addoption(
+        "--shard-runtimes",
+        default=os.path.join("tests", "runtimes.json"),
+        help=(
+            "Runtimes of the datasets used to balance the shards, saved beforehand "
+            "with `python tests/shard.py`. The same file must be used by every shard."
+        ),
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    shard = config.getoption("--shard")
+    if not shard or shard.startswith("0/"):
+        return
+
+    selected, deselected = [], []
+    for item in items:
+        if (
+            getattr(item, "module", None)
+            and item.module.__name__ == DATASET_TEST_MODULE
+        ):
+            selected.append(item)
+        else:
+            deselected.append(item)
+
+    if deselected:
+        config.hook.pytest_deselected(items=deselected)
+        items[:] = selected
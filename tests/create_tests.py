@@ -1,33 +1,55 @@
+"""Select the datasets tested by tests/test_datasets.py."""
 import os
-import re
-import string
 from typing import List
 
 import requests
 from git import Repo
+from git.exc import GitCommandError
+
+from tests.selection import DATASET_ROOTS
+from tests.selection import DatasetTrie
+from tests.selection import get_changed_files
+from tests.selection import get_merge_base
 
 
 def get_datasets():
-    datasets: List[str] = list(map(lambda x: x.path, Repo(".").submodules))
+    datasets: List[str] = [
+        submodule.path
+        for submodule in Repo(".").submodules
+        if submodule.path.split("/")[0] in DATASET_ROOTS
+    ]
 
     pull_number = os.getenv("CIRCLE_PR_NUMBER", False)
     if pull_number:
+        return minimal_tests(datasets, get_pr_files(pull_number))
+
+    # Datasets that already passed are not dropped here but skipped test by test,
+    # so that every CircleCI node shards the same list of datasets.
+    return datasets
+
+
+def get_pr_files(pull_number) -> List[str]:
+    """Return the files modified by a pull request.
+
+    The files are computed locally from the merge base with the master branch.
+    The GitHub API is only used when the history is not available locally.
+    """
+    try:
+        return get_changed_files(get_merge_base())
+    except GitCommandError:
         response = requests.get(
             f"https://api.github.com/repos/CONP-PCNO/conp-dataset/pulls/{pull_number}/files",
         )
-        pr_files: List[str] = [data["filename"] for data in response.json()]
-
-        return minimal_tests(datasets, pr_files)
-    return datasets
+        return [data["filename"] for data in response.json()]
 
 
 def minimal_tests(datasets: List[str], pr_files: List[str]):
     """Return the minimal test set for a pull request.
 
     To return the dataset affected by a pull request changes we verify if the pull
-    request modifies a file from the dataset. Otherwise, we verify if the file is part
-    of a whitelist that does not require testing. If either are the case, we need to
-    test all datasets.
+    request modifies a file from the dataset, using a prefix tree over the dataset
+    paths. Otherwise, we verify if the file is part of a whitelist that does not
+    require testing. If either are the case, we need to test all datasets.
 
 
     Parameters
@@ -53,13 +75,15 @@ def minimal_tests(datasets: List[str], pr_files: List[str]):
     if len(pr_files) == 0:
         return []
 
+    trie = DatasetTrie(datasets)
     modified_datasets: List[str] = []
     for pr_filename in pr_files:
-        if pr_filename.startswith("projects/"):
-            for dataset in datasets:
-                if re.match(f"{dataset}/", pr_filename) or pr_filename == dataset:
-                    modified_datasets.append(dataset)
-                    break
+        dataset = trie.match(pr_filename)
+        if dataset is not None:
+            if dataset not in modified_datasets:
+                modified_datasets.append(dataset)
+        elif pr_filename.startswith("projects/"):
+            continue
         else:
             if pr_filename.split("/")[0] in WHITELIST_EXACT:
                 continue
@@ -68,23 +92,3 @@ def minimal_tests(datasets: List[str], pr_files: List[str]):
             return datasets
 
     return modified_datasets
-
-
-template = string.Template(
-    """import pytest
-
-from tests.template import Template
-
-
-@pytest.mark.parametrize('dataset', ['$dataset'])
-class TestDataset(Template):
-    pass
-
-""",
-)
-
-for dataset in get_datasets():
-    if dataset.split("/")[0] in ["projects", "investigators"]:
-        with open("tests/test_" + dataset.replace("/", "_") + ".py", "w") as f:
-
-            f.write(template.substitute(dataset=dataset))
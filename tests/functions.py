@@ -16,6 +16,9 @@ import pytest
 from datalad.support.annexrepo import AnnexRepo
 from git.exc import InvalidGitRepositoryError
 
+from scripts.annex_inventory import AnnexInventory
+from scripts.annex_inventory import DATALAD_ARCHIVES
+
 
 @contextmanager
 def timeout(time):
@@ -63,35 +66,6 @@ def project_name2env(project_name: str) -> str:
     return project_env.upper()
 
 
-def get_annexed_file_size(dataset, file_path):
-    """Get the size of an annexed file in Bytes.
-
-    Parameters
-    ----------
-    dataset : string
-        Path to the dataset containing the file.
-    file_path : str
-        Realative path of the file within a dataset
-
-    Returns
-    -------
-    float
-        Size of the annexed file in Bytes.
-    """
-    info_output = git.Repo(dataset).git.annex(
-        "info",
-        file_path,
-        json=True,
-        bytes=True,
-    )
-    metadata = json.loads(info_output)
-
-    try:
-        return int(metadata["size"])
-    except Exception:
-        return float("inf")
-
-
 def is_authentication_required(dataset):
     """Verify in the dataset DATS file if authentication is required.
 
@@ -239,30 +213,14 @@ def authenticate(dataset):
         )
 
 
-def get_filenames(dataset, *, minimum):
+def get_filenames(dataset, *, minimum, inventory=None):
+    if inventory is None:
+        inventory = AnnexInventory.from_dataset(dataset)
     contains_archived_files = False
-    annex_list: str = iter(git.Repo(dataset).git.annex("list").split("\n"))
-    remotes = []
 
-    # Retrieve remotes from the header.
-    for line in annex_list:
-        if re.match(r"^\|+$", line):
-            break
-        remotes.append(re.sub(r"^\|*", "", line))
-
-    if "datalad-archives" in remotes:
-        archived_files = []
-        independent_files = []
-        archive_index = remotes.index("datalad-archives")
-
-        for line in annex_list:
-            # Split only for first occurence to prevent failure when filename has spaces.
-            in_remote, filename = line.split(" ", maxsplit=1)
-
-            if in_remote[archive_index] == "X":
-                archived_files.append(filename)
-            else:
-                independent_files.append(filename)
+    if inventory.has_remote(DATALAD_ARCHIVES):
+        archived_files = inventory.files_in(DATALAD_ARCHIVES)
+        independent_files = inventory.files_not_in(DATALAD_ARCHIVES)
 
         if len(independent_files) > minimum:
             filenames = independent_files
@@ -271,14 +229,17 @@ def get_filenames(dataset, *, minimum):
             filenames = archived_files + independent_files
 
     else:
-        filenames = [x.split()[1] for x in annex_list]
+        filenames = list(inventory.paths)
 
     return filenames, contains_archived_files
 
 
 def download_files(dataset, dataset_size, *, num=4):
-    filenames, contains_archived_files = get_filenames(dataset, minimum=num)
-    k_smallest = get_approx_ksmallests(dataset, filenames)
+    inventory = AnnexInventory.from_dataset(dataset)
+    filenames, contains_archived_files = get_filenames(
+        dataset, minimum=num, inventory=inventory
+    )
+    k_smallest = get_approx_ksmallests(dataset, filenames, inventory=inventory)
 
     if len(k_smallest) == 0:
         return
@@ -286,7 +247,7 @@ def download_files(dataset, dataset_size, *, num=4):
     download_size = (
         dataset_size
         if contains_archived_files
-        else get_sample_files_size(dataset, k_smallest)
+        else get_sample_files_size(dataset, k_smallest, inventory=inventory)
     )
     # Set a time limit based on the download size.
     # Limit between 20 sec and 10 minutes to avoid test to fail/hang.
@@ -311,12 +272,12 @@ def download_files(dataset, dataset_size, *, num=4):
         pytest.fail(
             f"The dataset timed out after {time_limit} seconds before retrieving a file."
             " Cannot to tell if the download would be sucessful."
-            f"\n{filename} has size of {humanize.naturalsize(get_annexed_file_size(dataset, filename))}.",
+            f"\n{filename} has size of {humanize.naturalsize(inventory.size(filename))}.",
             pytrace=False,
         )
 
 
-def get_approx_ksmallests(dataset, filenames, k=4, sample_size=200):
+def get_approx_ksmallests(dataset, filenames, k=4, sample_size=200, *, inventory=None):
     # Take random sample of the filenames to avoid timeout or long test runs.
     #
     # Setting the seed to the concatenation of filenames allow to have randomness when
@@ -326,10 +287,9 @@ def get_approx_ksmallests(dataset, filenames, k=4, sample_size=200):
     sample_files = random.sample(filenames, min(sample_size, len(filenames)))
 
     # Return the k smallest files from sample
-    return sorted(
-        [filename for filename in sample_files],
-        key=lambda x: get_annexed_file_size(dataset, x),
-    )[:k]
+    if inventory is None:
+        inventory = AnnexInventory.from_dataset(dataset)
+    return inventory.k_smallest(k, sample_files)
 
 
 def get_proper_submodules(dataset: str):
@@ -378,5 +338,7 @@ def get_proper_submodules(dataset: str):
     return proper_submodules
 
 
-def get_sample_files_size(dir_root, files):
-    return sum([get_annexed_file_size(dir_root, f) for f in files])
+def get_sample_files_size(dir_root, files, *, inventory=None):
+    if inventory is None:
+        inventory = AnnexInventory.from_dataset(dir_root)
+    return sum([inventory.size(f) for f in files])
@@ -8,6 +8,15 @@ from junitparser import Failure
 from junitparser import JUnitXml
 from junitparser import Skipped
 
+from tests.results_cache import CACHED_SKIP_MESSAGE
+from tests.results_cache import get_test_suite_version
+from tests.results_cache import RESULTS_CACHE_PATH
+from tests.results_cache import ResultsCache
+from tests.results_cache import SUCCESS
+from tests.selection import get_submodule_commits
+
+DATASET_TEST_CLASS = "tests.test_datasets.TestDataset"
+
 
 def get_previous_test_results():
     project_slug = "github/CONP-PCNO/conp-dataset"
@@ -40,6 +49,10 @@ def get_test_case_output(case, previous_test_results):
 
         if isinstance(case.result, Failure):
             status = "Failure"
+        elif isinstance(case.result, Skipped) and (message or "").startswith(
+            CACHED_SKIP_MESSAGE,
+        ):
+            status = "Success"
         elif isinstance(case.result, Skipped):
             status = "Skipped"
         elif isinstance(case.result, Error):
@@ -59,16 +72,56 @@ def get_test_case_output(case, previous_test_results):
 
 def case2datasetname(case):
     return (
-        case.classname.replace("tests.test_projects_", "", 1).replace(
-            ".TestDataset",
-            "",
-            1,
-        )
+        dataset2name(case2datasetpath(case))
         + ":"
         + case.name.replace("test_", "", 1).split("[")[0]
     )
 
 
+def case2datasetpath(case):
+    # The dataset path is the parameter of the test, e.g. test_download[projects/x]
+    return case.name.split("[", 1)[1].rsplit("]", 1)[0]
+
+
+def dataset2name(dataset):
+    # Name of a dataset in the test results, e.g. projects/x/y -> x_y
+    return dataset.replace("projects/", "", 1).replace("/", "_")
+
+
+def is_project_test_case(case):
+    return case.classname == DATASET_TEST_CLASS and case2datasetpath(
+        case,
+    ).startswith("projects/")
+
+
+def update_results_cache(xml, cache_path=RESULTS_CACHE_PATH):
+    """Save the result of each dataset test along with the dataset commit."""
+    commits = get_submodule_commits()
+    cache = ResultsCache(cache_path, version=get_test_suite_version())
+
+    for suite in xml:
+        for case in suite:
+            if not is_project_test_case(case):
+                continue
+            # Skipped tests, including those skipped since they already passed,
+            # keep the date of their last actual run.
+            if isinstance(case.result, Skipped):
+                continue
+
+            dataset = case2datasetpath(case)
+            if dataset not in commits:
+                continue
+            cache.update(
+                dataset,
+                commits[dataset],
+                case.name.split("[")[0],
+                "Failure" if case.result else SUCCESS,
+                updated=current_time,
+            )
+
+    cache.save()
+
+
 def parse_test_results():
     output_path = os.path.join(os.getcwd(), "tests")
     if not os.path.exists(output_path):
@@ -84,7 +137,7 @@ def parse_test_results():
             case2datasetname(case): get_test_case_output(case, previous_test_results)
             for suite in xml
             for case in suite
-            if case.classname.startswith("tests.test_projects_")
+            if is_project_test_case(case)
         }
 
         json.dump(
@@ -93,6 +146,8 @@ def parse_test_results():
             indent=4,
         )
 
+    update_results_cache(xml)
+
 
 current_time = str(datetime.now().astimezone())
 if __name__ == "__main__":
@@ -0,0 +1,168 @@
+"""Persistent results of the dataset tests keyed by dataset commit and test."""
+from __future__ import annotations
+
+import glob
+import hashlib
+import json
+import os
+from datetime import datetime
+from datetime import timedelta
+
+RESULTS_CACHE_PATH = os.path.join("tests", "results-cache.json")
+
+# Files whose changes invalidate every cached result: the test suite, the DATS
+# validator and the schemas it validates against.
+VERSIONED_FILES = (
+    os.path.join("tests", "**", "*.py"),
+    os.path.join("scripts", "dats_traversal.py"),
+    os.path.join("scripts", "dats_validator", "*.py"),
+    os.path.join("scripts", "dats_validator", "conp-dats", "**", "*.json"),
+)
+
+SUCCESS = "Success"
+
+# Tests that are skipped when they already passed on the same dataset commit.
+CACHED_TESTS = ("test_download", "test_files_integrity", "test_has_valid_dats")
+
+# Maximum age of a passing result. Tests depending on remote servers or on other
+# datasets are periodically revalidated even when the dataset did not change.
+MAX_AGE = {
+    "test_download": timedelta(hours=int(os.getenv("CONP_DOWNLOAD_MAX_AGE", "24"))),
+    "test_files_integrity": timedelta(days=7),
+    "test_has_valid_dats": timedelta(days=7),
+    "test_has_input_dataset_up_to_date": timedelta(days=1),
+}
+
+CACHED_SKIP_MESSAGE = "Already passed on dataset commit"
+
+
+def get_test_suite_version(root: str = ".") -> str:
+    """Return a hash of the content of the files listed in `VERSIONED_FILES`."""
+    paths = sorted(
+        {
+            path
+            for pattern in VERSIONED_FILES
+            for path in glob.glob(os.path.join(root, pattern), recursive=True)
+        },
+    )
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.relpath(path, root).encode())
+        with open(path, "rb") as fin:
+            digest.update(hashlib.sha256(fin.read()).digest())
+    return digest.hexdigest()
+
+
+class ResultsCache:
+    """Last result of each dataset test, with the commit it was obtained on.
+
+    When a `version` of the test suite is given, results obtained with another
+    version are ignored and discarded on update. The cache is stored as JSON:
+
+        {
+            "projects/dataset": {
+                "commit": "<sha>",
+                "version": "<test suite version>",
+                "tests": {
+                    "test_download": {
+                        "status": "Success",
+                        "updated": "2020-05-19 12:13:28.342326+00:00"
+                    },
+                    ...
+                }
+            },
+            ...
+        }
+    """
+
+    def __init__(self, path: str = RESULTS_CACHE_PATH, version: str | None = None):
+        self.path = path
+        self.version = version
+        try:
+            with open(path) as fin:
+                self.entries: dict = json.load(fin)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = {}
+
+    def _entry(self, dataset: str, commit: str) -> dict | None:
+        """Return the results of the dataset obtained on `commit` and this version."""
+        entry = self.entries.get(dataset)
+        if entry is None or entry["commit"] != commit:
+            return None
+        if self.version is not None and entry.get("version") != self.version:
+            return None
+        return entry
+
+    def result(self, dataset: str, commit: str, test: str) -> dict | None:
+        """Return the last result of `test` if it was obtained on `commit`."""
+        entry = self._entry(dataset, commit)
+        if entry is None:
+            return None
+        return entry["tests"].get(test)
+
+    def passed(
+        self,
+        dataset: str,
+        commit: str,
+        test: str | None = None,
+        *,
+        now: datetime | None = None,
+    ) -> bool:
+        """Whether a test has a recent passing result on the dataset commit.
+
+        Parameters
+        ----------
+        dataset : str
+            Path to the dataset.
+        commit : str
+            Current commit of the dataset.
+        test : str, optional
+            Name of the test, by default every test recorded for the dataset.
+        now : datetime, optional
+            Reference time to compute the age of the results, by default `now`.
+        """
+        entry = self._entry(dataset, commit)
+        if entry is None:
+            return False
+
+        tests = [test] if test else list(entry["tests"])
+        if not tests:
+            return False
+
+        now = now or datetime.now().astimezone()
+        for test_name in tests:
+            result = entry["tests"].get(test_name)
+            if result is None or result["status"] != SUCCESS:
+                return False
+            max_age = MAX_AGE.get(test_name)
+            if max_age and now - datetime.fromisoformat(result["updated"]) > max_age:
+                return False
+        return True
+
+    def update(
+        self,
+        dataset: str,
+        commit: str,
+        test: str,
+        status: str,
+        *,
+        updated: str | None = None,
+    ) -> None:
+        entry = self._entry(dataset, commit)
+        if entry is None:
+            # Results obtained on a previous commit or with another version of the
+            # test suite are no longer relevant.
+            entry = self.entries[dataset] = {"commit": commit, "tests": {}}
+            if self.version is not None:
+                entry["version"] = self.version
+
+        entry["tests"][test] = {
+            "status": status,
+            "updated": updated or str(datetime.now().astimezone()),
+        }
+
+    def save(self) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as fout:
+            json.dump(self.entries, fout, indent=4, sort_keys=True)
+        os.replace(tmp_path, self.path)
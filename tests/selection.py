@@ -0,0 +1,87 @@
+"""Select the datasets to test from the changes between two commits.
+
+The datasets are git submodules of the superdataset, so a change to a dataset
+is a change of its gitlink commit. Both the changed files and the gitlink
+commits are computed locally with git.
+"""
+from __future__ import annotations
+
+from typing import Iterable
+
+from git import Repo
+
+BASE_BRANCH = "origin/master"
+DATASET_ROOTS = ("projects", "investigators")
+GITLINK_MODE = "160000"
+
+# Key marking the node of a dataset in the trie. Path components are strings,
+# so it cannot collide with a child node.
+_DATASET = None
+
+
+class DatasetTrie:
+    """Prefix tree over the path components of the datasets.
+
+    Finding the dataset containing a file costs one dictionary lookup per
+    component of the file path, independently of the number of datasets.
+    """
+
+    def __init__(self, datasets: Iterable[str] = ()):
+        self._root: dict = {}
+        for dataset in datasets:
+            self.add(dataset)
+
+    def add(self, dataset: str) -> None:
+        node = self._root
+        for part in dataset.strip("/").split("/"):
+            node = node.setdefault(part, {})
+        node[_DATASET] = dataset
+
+    def match(self, filename: str) -> str | None:
+        """Return the innermost dataset containing `filename`, if any."""
+        node = self._root
+        dataset = None
+        for part in filename.strip("/").split("/"):
+            node = node.get(part)
+            if node is None:
+                break
+            dataset = node.get(_DATASET, dataset)
+        return dataset
+
+
+def get_merge_base(base: str = BASE_BRANCH, head: str = "HEAD", *, root=".") -> str:
+    return Repo(root).git.merge_base(base, head)
+
+
+def get_changed_files(base: str, head: str = "HEAD", *, root=".") -> list[str]:
+    """Return the files modified between two commits of the superdataset."""
+    output = Repo(root).git.diff("--name-only", "--no-renames", base, head)
+    return [filename for filename in output.split("\n") if filename]
+
+
+def get_submodule_commits(rev: str = "HEAD", *, root=".") -> dict[str, str]:
+    """Return the gitlink commit of every dataset at a revision.
+
+    Parameters
+    ----------
+    rev : str
+        Revision of the superdataset, by default `HEAD`.
+    root : str
+        Path to the superdataset.
+
+    Returns
+    -------
+    dict[str, str]
+        Commit SHA of each dataset, keyed by the dataset path.
+    """
+    output = Repo(root).git.ls_tree("-r", rev, "--", *DATASET_ROOTS)
+
+    commits = {}
+    for line in output.split("\n"):
+        if not line:
+            continue
+        meta, path = line.split("\t", 1)
+        mode, _, sha = meta.split(" ")
+        if mode == GITLINK_MODE:
+            commits[path] = sha
+    return commits
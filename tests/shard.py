@@ -0,0 +1,178 @@
+"""Split the datasets among the CircleCI containers using historical runtimes.
+
+The datasets are bin-packed with the longest-processing-time heuristic: the
+longest datasets are assigned first, each to the least loaded container. The
+runtimes are retrieved once, before the containers start, so that every
+container computes the same assignment:
+
+    python tests/shard.py tests/runtimes.json
+
+The shards are then selected at collection with the `--shard` option of pytest,
+e.g.
+
+    pytest --shard=$CIRCLE_NODE_INDEX/$CIRCLE_NODE_TOTAL tests/
+"""
+from __future__ import annotations
+
+import heapq
+import json
+import os
+import statistics
+import sys
+from collections import defaultdict
+from typing import Hashable
+from typing import Iterable
+
+from tests.parse_results import dataset2name
+from tests.parse_results import get_previous_test_results
+from tests.results_cache import CACHED_SKIP_MESSAGE
+
+# Weight of the datasets when there is no historical runtime at all.
+DEFAULT_RUNTIME = 1.0
+
+# Runtimes shared by the CircleCI containers, saved by the build job.
+RUNTIMES_PATH = os.path.join("tests", "runtimes.json")
+
+
+def load_runtimes(path: str | None = None) -> dict[str, float]:
+    """Return the total runtime of the previous test run of each dataset.
+
+    Parameters
+    ----------
+    path : str, optional
+        Path to a `test-status.json` file, by default the results of the latest
+        run on master are retrieved from the CircleCI artifacts.
+
+    Returns
+    -------
+    dict[str, float]
+        Runtime in seconds keyed by the dataset name used in `test-status.json`.
+        Tests skipped since they already passed are not counted, their runtime
+        does not reflect the runtime of the dataset.
+    """
+    if path:
+        with open(path) as fin:
+            test_status = json.load(fin)
+    else:
+        try:
+            test_status = get_previous_test_results()
+        except Exception as e:
+            print(
+                f"WARNING: Cannot retrieve previous test results: {e}", file=sys.stderr
+            )
+            test_status = {}
+
+    runtimes: dict[str, float] = defaultdict(float)
+    for test_case, result in test_status.items():
+        if (result.get("Message") or "").startswith(CACHED_SKIP_MESSAGE):
+            continue
+        dataset = test_case.rsplit(":", 1)[0]
+        runtimes[dataset] += float(result.get("Runtime") or 0)
+    return dict(runtimes)
+
+
+def save_runtimes(runtimes: dict[str, float], path: str = RUNTIMES_PATH) -> None:
+    """Save the runtimes read by every container with `read_runtimes`."""
+    with open(path, "w") as fout:
+        json.dump(runtimes, fout, indent=4, sort_keys=True)
+
+
+def read_runtimes(path: str = RUNTIMES_PATH) -> dict[str, float]:
+    """Read the runtimes saved by `save_runtimes`.
+
+    Raises
+    ------
+    FileNotFoundError
+        When the runtimes were not saved: the containers could otherwise compute
+        different assignments, testing some datasets twice and others never.
+    """
+    if not os.path.isfile(path):
+        raise FileNotFoundError(
+            f"No runtimes at {path}, run `python tests/shard.py {path}` before "
+            "sharding the tests.",
+        )
+    with open(path) as fin:
+        return json.load(fin)
+
+
+def lpt_shards(weights: dict[Hashable, float], num_shards: int) -> list[list]:
+    """Bin-pack the items into shards of balanced total weight.
+
+    Parameters
+    ----------
+    weights : dict
+        Weight of each item.
+    num_shards : int
+        Number of shards.
+
+    Returns
+    -------
+    list[list]
+        Items assigned to each shard.
+    """
+    shards: list[list] = [[] for _ in range(num_shards)]
+    loads = [(0.0, index) for index in range(num_shards)]
+
+    # Ties are broken on the item to make the assignment deterministic.
+    for item in sorted(weights, key=lambda x: (-weights[x], str(x))):
+        load, index = heapq.heappop(loads)
+        shards[index].append(item)
+        heapq.heappush(loads, (load + weights[item], index))
+
+    return shards
+
+
+def get_dataset_weights(
+    datasets: Iterable[str],
+    runtimes: dict[str, float],
+) -> dict[str, float]:
+    """Weight each dataset by its historical runtime.
+
+    Datasets without history are given the median runtime of the known datasets.
+    """
+    default_runtime = (
+        statistics.median(runtimes.values()) if runtimes else DEFAULT_RUNTIME
+    )
+    return {
+        dataset: runtimes.get(dataset2name(dataset), default_runtime)
+        for dataset in datasets
+    }
+
+
+def select_shard(
+    datasets: Iterable[str],
+    index: int,
+    total: int,
+    runtimes: dict[str, float],
+) -> list[str]:
+    """Return the datasets of shard `index` out of `total` shards.
+
+    Parameters
+    ----------
+    datasets : Iterable[str]
+        Paths of the datasets to split.
+    index : int
+        Index of the shard to return.
+    total : int
+        Number of shards.
+    runtimes : dict[str, float]
+        Historical runtimes, the same on every shard.
+    """
+    datasets = list(datasets)
+    shard = set(lpt_shards(get_dataset_weights(datasets, runtimes), total)[index])
+    # Keep the original order for a stable test collection.
+    return [dataset for dataset in datasets if dataset in shard]
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    """Parse a shard given as `INDEX/TOTAL`, e.g. `0/2`."""
+    index, total = (int(x) for x in value.split("/"))
+    if not 0 <= index < total:
+        raise ValueError(
+            f"Invalid shard {value}: expected INDEX/TOTAL with INDEX < TOTAL."
+        )
+    return index, total
+
+
+if __name__ == "__main__":
+    save_runtimes(load_runtimes(), sys.argv[1] if len(sys.argv) > 1 else RUNTIMES_PATH)
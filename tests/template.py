@@ -1,5 +1,6 @@
 """Template to base the test of the datasets.
 """
+import functools
 import json
 import os
 import time
@@ -10,17 +11,19 @@ import humanfriendly
 import pytest
 from datalad import api
 
-from scripts.dats_validator.validator import validate_date_types
-from scripts.dats_validator.validator import validate_is_about
-from scripts.dats_validator.validator import validate_json
-from scripts.dats_validator.validator import validate_non_schema_required
-from scripts.dats_validator.validator import validate_privacy
+from scripts.dats_validator.validator import validate_file
+from scripts.dats_validator.validator import ValidationStore
 from tests.constants import RETROSPECTIVE_CRAWLED_DATASET_LIST
 from tests.functions import authenticate
 from tests.functions import download_files
 from tests.functions import eval_config
 from tests.functions import get_proper_submodules
 from tests.functions import timeout
+from tests.results_cache import CACHED_SKIP_MESSAGE
+from tests.results_cache import CACHED_TESTS
+from tests.results_cache import get_test_suite_version
+from tests.results_cache import ResultsCache
+from tests.selection import get_submodule_commits
 
 
 def delay_rerun(*args):
@@ -31,9 +34,27 @@ def delay_rerun(*args):
 lock = Lock()
 
 
+@functools.lru_cache(maxsize=None)
+def get_results_cache():
+    return ResultsCache(version=get_test_suite_version()), get_submodule_commits()
+
+
 class Template:
     @pytest.fixture(autouse=True)
-    def install_dataset(self, dataset):
+    def skip_passed_test(self, request, dataset):
+        """Skip the tests that recently passed on the same dataset commit."""
+        test_name = request.function.__name__
+        if test_name in CACHED_TESTS and not request.config.getoption(
+            "--ignore-results-cache",
+        ):
+            results_cache, commits = get_results_cache()
+            commit = commits.get(dataset)
+            if commit and results_cache.passed(dataset, commit, test_name):
+                pytest.skip(f"{CACHED_SKIP_MESSAGE} {commit}.")
+        yield
+
+    @pytest.fixture(autouse=True)
+    def install_dataset(self, dataset, skip_passed_test):
 
         with lock:
             if len(os.listdir(dataset)) == 0:
@@ -53,55 +74,37 @@ class Template:
         if dataset in RETROSPECTIVE_CRAWLED_DATASET_LIST:
             return
 
-        with open(os.path.join(dataset, "DATS.json"), "rb") as f:
-            json_obj = json.load(f)
-            if not validate_json(json_obj):
-                pytest.fail(
-                    f"Dataset {dataset} doesn't contain a valid DATS.json.",
-                    pytrace=False,
-                )
-
-            # Validate the date type values
-            date_type_valid_bool, date_type_errors = validate_date_types(json_obj)
-            if not date_type_valid_bool:
-                summary_error_message = (
-                    f"Dataset {dataset} contains DATS.json that has errors "
-                    f"in date's type encoding. List of errors:\n"
-                )
-                for i, error_message in enumerate(date_type_errors, 1):
-                    summary_error_message += f"- {i}. {error_message}\n"
-                    pytest.fail(summary_error_message, pytrace=False)
-
-            # Validate the privacy values
-            privacy_valid_bool, privacy_errors = validate_privacy(json_obj)
-            if not privacy_valid_bool:
-                summary_error_message = (
-                    f"Dataset {dataset} contains DATS.json that has errors "
-                    f"in privacy value. Error is:\n"
-                    f"- {privacy_errors[0]}"
-                )
-                pytest.fail(summary_error_message, pytrace=False)
-
-            # Validate that isAbout contains at least one species entry if present
-            is_about_valid_bool, is_about_errors = validate_is_about(json_obj)
-            if not is_about_valid_bool:
-                summary_error_message = (
-                    f"Dataset {dataset} contains DATS.json that has errors "
-                    f"in isAbout. Error is:\n"
-                    f"- {is_about_errors[0]}"
-                )
-                pytest.fail(summary_error_message, pytrace=False)
-
-            # Perform the extra validation checks
-            is_valid, errors = validate_non_schema_required(json_obj)
-            if not is_valid:
-                summary_error_message = (
-                    f"Dataset {dataset} contains DATS.json that has errors "
-                    f"in required extra properties or formats. List of errors:\n"
-                )
-                for i, error_message in enumerate(errors, 1):
-                    summary_error_message += f"- {i}. {error_message}\n"
-                pytest.fail(summary_error_message, pytrace=False)
+        # Only DATS.json whose content, schema or validation rules changed
+        # since the last run are validated again.
+        result = validate_file(
+            os.path.join(dataset, "DATS.json"),
+            store=ValidationStore(),
+        )
+        errors = result["errors"]
+
+        if "load" in errors:
+            pytest.fail(errors["load"][0], pytrace=False)
+
+        if "schema" in errors:
+            summary_error_message = (
+                f"Dataset {dataset} doesn't contain a valid DATS.json. "
+                f"List of errors:\n"
+            )
+            for i, error_message in enumerate(errors["schema"], 1):
+                summary_error_message += f"- {i}. {error_message}\n"
+            pytest.fail(summary_error_message, pytrace=False)
+
+        # Perform the extra validation checks, including the date types, privacy
+        # and isAbout checks of every nested dataset
+        if "non_schema_required" in errors:
+            summary_error_message = (
+                f"Dataset {dataset} contains DATS.json that has errors "
+                f"in required extra properties, formats, date types, privacy or "
+                f"isAbout. List of errors:\n"
+            )
+            for i, error_message in enumerate(errors["non_schema_required"], 1):
+                summary_error_message += f"- {i}. {error_message}\n"
+            pytest.fail(summary_error_message, pytrace=False)
 
     def test_download(self, dataset):
         eval_config(dataset)
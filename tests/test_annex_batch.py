@@ -0,0 +1,59 @@
+"""Test the batch mode git-annex commands against a fake git-annex."""
+import os
+import stat
+import sys
+
+import pytest
+
+from scripts.annex_batch import replace_urls
+
+# Answers every request of `git annex <command> --batch`, failing those containing
+# "fail-<command>", and logs the requests.
+FAKE_GIT = """import json
+import sys
+
+command = sys.argv[2]
+with open("requests.log", "a") as log:
+    for line in sys.stdin:
+        log.write(command + " " + line)
+        success = "fail-" + command not in line
+        print(json.dumps({"command": command, "success": success}), flush=True)
+"""
+
+
+@pytest.fixture()
+def dataset(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    git = bin_dir / "git"
+    git.write_text(f"#!{sys.executable}\n{FAKE_GIT}")
+    git.chmod(git.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return tmp_path
+
+
+def test_replace_urls(dataset):
+    replacements = [
+        ("a.txt", "KEY-a", "http://old/a", "http://new/a"),
+        ("b.txt", "KEY-b", "http://old/b", "http://new/fail-registerurl"),
+        ("c.txt", "KEY-c", "http://old/fail-rmurl", "http://new/c"),
+    ]
+    results = [
+        (replacement, command, result["success"])
+        for replacement, command, result in replace_urls(str(dataset), replacements)
+    ]
+    assert results == [
+        (replacements[1], "registerurl", False),
+        (replacements[0], "rmurl", True),
+        (replacements[2], "rmurl", False),
+    ]
+
+    # The old URL of a file whose new URL was not registered is kept.
+    requests = (dataset / "requests.log").read_text().splitlines()
+    assert requests == [
+        "registerurl KEY-a http://new/a",
+        "registerurl KEY-b http://new/fail-registerurl",
+        "registerurl KEY-c http://new/c",
+        "rmurl a.txt http://old/a",
+        "rmurl c.txt http://old/fail-rmurl",
+    ]
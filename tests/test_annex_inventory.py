@@ -0,0 +1,125 @@
+import json
+import os
+import stat
+import subprocess
+import sys
+
+import pytest
+
+from scripts.annex_inventory import AnnexInventory
+from scripts.annex_inventory import DATALAD_ARCHIVES
+from scripts.annex_inventory import iter_annex_json
+from scripts.annex_inventory import key_size
+from scripts.annex_inventory import UNKNOWN_SIZE
+
+WEB_REMOTE = {"uuid": "00000000-0000-0000-0000-000000000001", "description": "web"}
+ARCHIVES_REMOTE = {
+    "uuid": "c04eb54b-4b4e-5755-8436-866b043170fa",
+    "description": "[datalad-archives]",
+}
+
+
+def whereis(filename, key, *remotes):
+    return {
+        "command": "whereis",
+        "file": filename,
+        "key": key,
+        "whereis": [{**remote, "urls": []} for remote in remotes],
+        "success": True,
+    }
+
+
+@pytest.fixture()
+def inventory():
+    return AnnexInventory.from_records(
+        [
+            whereis("sub-01/anat.nii.gz", "MD5E-s300--a.nii.gz", WEB_REMOTE),
+            whereis("file with spaces.txt", "MD5E-s10--b.txt", ARCHIVES_REMOTE),
+            whereis(
+                "archive.tar.gz",
+                "SHA256E-s5-m1600000000--c.tar.gz",
+                WEB_REMOTE,
+                ARCHIVES_REMOTE,
+            ),
+            whereis("relaxed.txt", "URL--https&c%%example.com%relaxed.txt"),
+        ],
+    )
+
+
+@pytest.mark.parametrize(
+    "key, size",
+    [
+        ("MD5E-s300--a.nii.gz", 300),
+        ("SHA256E-s5-m1600000000--c.tar.gz", 5),
+        ("MD5E-s12-S10-C2--d.txt", 12),
+        ("URL--https&c%%example.com%relaxed.txt", UNKNOWN_SIZE),
+        ("URL-s42--https&c%%example.com%data-s7.txt", 42),
+    ],
+)
+def test_key_size(key, size):
+    assert key_size(key) == size
+
+
+def test_remote_queries(inventory):
+    assert inventory.has_remote(DATALAD_ARCHIVES)
+    assert inventory.files_in(DATALAD_ARCHIVES) == [
+        "file with spaces.txt",
+        "archive.tar.gz",
+    ]
+    assert inventory.files_not_in(DATALAD_ARCHIVES) == [
+        "sub-01/anat.nii.gz",
+        "relaxed.txt",
+    ]
+    assert inventory.files_only_in(DATALAD_ARCHIVES) == ["file with spaces.txt"]
+
+
+def test_k_smallest(inventory):
+    assert inventory.k_smallest(2) == ["archive.tar.gz", "file with spaces.txt"]
+    assert inventory.k_smallest(4)[-1] == "relaxed.txt"
+    assert inventory.k_smallest(1, ["sub-01/anat.nii.gz", "relaxed.txt"]) == [
+        "sub-01/anat.nii.gz",
+    ]
+
+
+def test_lookup(inventory):
+    assert len(inventory) == 4
+    assert "file with spaces.txt" in inventory
+    assert inventory.key("sub-01/anat.nii.gz") == "MD5E-s300--a.nii.gz"
+    assert inventory.size("relaxed.txt") == float("inf")
+
+
+@pytest.fixture()
+def fake_annex(tmp_path, monkeypatch):
+    """Put on the PATH a `git` printing the given records and exiting with a status."""
+
+    def install(records, returncode):
+        git = tmp_path / "git"
+        output = "".join(json.dumps(record) + "\n" for record in records)
+        git.write_text(
+            f"#!{sys.executable}\n"
+            "import sys\n"
+            f"sys.stdout.write({output!r})\n"
+            f"sys.exit({returncode})\n",
+        )
+        git.chmod(git.stat().st_mode | stat.S_IEXEC)
+        monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+
+    return install
+
+
+def test_whereis_missing_copies(fake_annex, tmp_path):
+    records = [
+        whereis("a.txt", "MD5E-s1--a.txt", WEB_REMOTE),
+        {**whereis("b.txt", "MD5E-s1--b.txt"), "success": False},
+    ]
+    fake_annex(records, 1)
+    with pytest.warns(UserWarning, match="failed on 1 files.*b.txt"):
+        assert list(iter_annex_json(str(tmp_path), "whereis")) == records
+
+    fake_annex([], 1)
+    with pytest.raises(subprocess.CalledProcessError):
+        list(iter_annex_json(str(tmp_path), "whereis"))
+
+    fake_annex(records, 2)
+    with pytest.raises(subprocess.CalledProcessError):
+        list(iter_annex_json(str(tmp_path), "whereis"))
@@ -0,0 +1,142 @@
+"""Test the catalog index of the DATS.json files."""
+import json
+import os
+
+import pytest
+
+from scripts.catalog_index import CatalogIndex
+
+DATS = {
+    "title": "Dataset A",
+    "privacy": "open",
+    "keywords": [{"value": "mri"}, {"value": "eeg"}],
+    "licenses": [{"name": "CC BY 4.0"}],
+    "types": [{"information": {"value": "imaging"}}],
+    "isAbout": [{"name": "Homo sapiens"}],
+    "creators": [
+        {"name": "Jane Doe", "roles": [{"value": "Principal Investigator"}]},
+        {"name": "CONP"},
+    ],
+    "distributions": [
+        {
+            "formats": ["NIfTI"],
+            "size": 1.5,
+            "unit": {"value": "GB"},
+            "access": {
+                "landingPage": "https://zenodo.org/record/1",
+                "authorizations": [{"value": "public"}],
+            },
+        },
+    ],
+    "extraProperties": [
+        {"category": "files", "values": [{"value": "12"}]},
+        {"category": "derivedFrom", "values": [{"value": "https://example.com"}]},
+    ],
+}
+
+
+def write_dats(directory, dats):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "DATS.json"), "w") as fout:
+        json.dump(dats, fout)
+
+
+@pytest.fixture()
+def conp_dataset(tmp_path):
+    """projects/a has a nested subdataset, projects/b only has DATS.json in subfolders."""
+    projects = tmp_path / "projects"
+    write_dats(projects / "a", DATS)
+    write_dats(projects / "a" / "sub", {**DATS, "title": "Subdataset"})
+    (projects / "a" / ".gitmodules").write_text(
+        '[submodule "sub"]\n\tpath = sub\n\turl = https://example.com\n',
+    )
+    write_dats(projects / "b" / "b1", {"title": "B1"})
+    write_dats(projects / "b" / "b2", {"title": "B2"})
+    os.makedirs(projects / "empty")
+    return str(tmp_path)
+
+
+def test_datasets(conp_dataset):
+    index = CatalogIndex(conp_dataset)
+    assert index.refresh() == 4
+    assert [row["path"] for row in index.datasets()] == [
+        "projects/a",
+        "projects/a/sub",
+        "projects/b/b1",
+        "projects/b/b2",
+    ]
+    assert [dats["title"] for dats in index.dats(top_level=True)] == [
+        "Dataset A",
+        "B1",
+        "B2",
+    ]
+    assert index.dataset("projects/a/sub")["parent"] == "projects/a"
+
+
+def test_normalized_fields(conp_dataset):
+    index = CatalogIndex(conp_dataset)
+    index.refresh()
+    row = index.dataset("projects/a")
+    assert (row["title"], row["privacy"], row["provider"]) == (
+        "Dataset A",
+        "open",
+        "https://zenodo.org/record/1",
+    )
+    assert index.distributions("projects/a") == [
+        {
+            "landing_page": "https://zenodo.org/record/1",
+            "size": 1.5,
+            "unit": "GB",
+            "authorizations": ["public"],
+        },
+    ]
+    assert index.extra_properties("projects/a") == {
+        "files": ["12"],
+        "derivedFrom": ["https://example.com"],
+    }
+    assert index.creators("projects/a")[0] == {
+        "name": "Jane Doe",
+        "roles": ["Principal Investigator"],
+    }
+    assert index.values("keywords", "projects/a") == ["mri", "eeg"]
+    assert index.values("formats") == ["NIfTI", "NIfTI"]
+    assert index.values("types", "projects/a") == ["imaging"]
+    assert index.values("is_about", "projects/a") == ["Homo sapiens"]
+    assert index.distributions("projects/b/b1") == []
+
+
+def test_incremental_refresh(conp_dataset):
+    index = CatalogIndex(conp_dataset)
+    index.refresh()
+    index.close()
+
+    # A new process reuses the index file and only parses the modified files.
+    index = CatalogIndex(conp_dataset)
+    assert index.refresh() == 0
+
+    dats_path = os.path.join(conp_dataset, "projects", "b", "b1", "DATS.json")
+    os.utime(dats_path, ns=(0, 0))
+    assert index.refresh() == 0
+
+    write_dats(os.path.dirname(dats_path), {"title": "B1 renamed"})
+    assert index.refresh() == 1
+    assert index.dataset("projects/b/b1")["title"] == "B1 renamed"
+
+    os.remove(os.path.join(conp_dataset, "projects", "b", "b2", "DATS.json"))
+    index.refresh_dataset("projects/b/b2")
+    assert index.dataset("projects/b/b2") is None
+    assert index.refresh() == 0
+    assert len(index.datasets()) == 3
+
+
+def test_parallel_refresh(conp_dataset, monkeypatch):
+    monkeypatch.setattr("scripts.catalog_index.PARALLEL_PARSE_THRESHOLD", 1)
+    index = CatalogIndex(conp_dataset)
+    assert index.refresh(jobs=2) == 4
+    assert index.values("keywords", "projects/a/sub") == ["mri", "eeg"]
+
+    serial = CatalogIndex(conp_dataset, os.path.join(conp_dataset, "serial.sqlite"))
+    assert serial.refresh(jobs=1) == 4
+    assert [dict(row) for row in serial.datasets()] == [
+        dict(row) for row in index.datasets()
+    ]
@@ -0,0 +1,192 @@
+"""Test the InterLex resolution and JSON-LD generation of the CONP to NIDM terms scripts."""
+import importlib
+import json
+import os
+import threading
+import time
+
+import pytest
+
+SCRIPT_DIR = os.path.join("scripts", "conp_to_nidm_terms")
+
+
+@pytest.fixture(scope="module")
+def functions():
+    # The module loads its template and API key from the working directory.
+    cwd = os.getcwd()
+    os.chdir(SCRIPT_DIR)
+    try:
+        return importlib.import_module("scripts.conp_to_nidm_terms.functions")
+    finally:
+        os.chdir(cwd)
+
+
+def test_rate_limiter_spacing(functions):
+    rate_limiter = functions.RateLimiter(rate=20)
+    start = time.monotonic()
+    times = []
+
+    def call():
+        rate_limiter.wait()
+        times.append(time.monotonic() - start)
+
+    threads = [threading.Thread(target=call) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The n-th call may not start before n intervals have elapsed.
+    for n, elapsed in enumerate(sorted(times)):
+        assert elapsed >= n * rate_limiter.interval
+
+
+def test_rate_limiter_unlimited(functions):
+    rate_limiter = functions.RateLimiter(rate=0)
+    start = time.monotonic()
+    for _ in range(100):
+        rate_limiter.wait()
+    assert time.monotonic() - start < 0.5
+
+
+def test_term_cache_expiry(functions, tmp_path):
+    cache = functions.TermCache(path=str(tmp_path / "terms.json"), ttl=10)
+    cache.set("mri", "http://uri.interlex.org/base/ilx_1", now=100)
+
+    assert cache.get("mri", now=110) == "http://uri.interlex.org/base/ilx_1"
+    assert cache.get("mri", now=111) is None
+    assert cache.get("eeg", now=100) is None
+
+
+def test_term_cache_persistence(functions, tmp_path):
+    path = str(tmp_path / "cache" / "terms.json")
+    cache = functions.TermCache(path=path)
+    cache.set("mri", "http://uri.interlex.org/base/ilx_1")
+    cache.save()
+
+    assert functions.TermCache(path=path).get("mri") == (
+        "http://uri.interlex.org/base/ilx_1"
+    )
+    assert os.listdir(os.path.dirname(path)) == ["terms.json"]
+
+
+def test_term_cache_corrupted(functions, tmp_path):
+    path = tmp_path / "terms.json"
+    path.write_text("{")
+    assert functions.TermCache(path=str(path)).entries == {}
+
+
+def test_resolve_terms(functions, tmp_path):
+    cache = functions.TermCache(path=str(tmp_path / "terms.json"))
+    cache.set("cached", "http://uri.interlex.org/base/ilx_0")
+    calls = []
+
+    def api_call(term, rate_limiter):
+        assert isinstance(rate_limiter, functions.RateLimiter)
+        calls.append(term)
+        return None if term == "failed" else f"http://uri.interlex.org/{term}"
+
+    uris = functions.resolve_terms(
+        ["mri", "eeg", "mri", "cached", "failed", "eeg"],
+        cache=cache,
+        api_call=api_call,
+    )
+
+    assert uris == {
+        "mri": "http://uri.interlex.org/mri",
+        "eeg": "http://uri.interlex.org/eeg",
+        "cached": "http://uri.interlex.org/base/ilx_0",
+        "failed": None,
+    }
+    # Each missing term is sent once, the cached one is not.
+    assert sorted(calls) == ["eeg", "failed", "mri"]
+
+    # The failed term is retried on the next run, the others are cached.
+    calls.clear()
+    reloaded = functions.TermCache(path=cache.path)
+    assert functions.resolve_terms(
+        ["mri", "failed"],
+        cache=reloaded,
+        api_call=api_call,
+    ) == {"mri": "http://uri.interlex.org/mri", "failed": None}
+    assert calls == ["failed"]
+
+
+def test_build_jsonld_documents(functions):
+    report = {
+        "privacy": {"count": 1, "values": ["open"]},
+        "types": {"count": 2, "values": ["Magnetic Resonance", "EEG (raw)"]},
+    }
+    uris = {
+        "open": "http://uri.interlex.org/open",
+        "magnetic resonance": "http://uri.interlex.org/mr",
+        "eeg (raw)": "no match found",
+    }
+
+    documents = functions.build_jsonld_documents(report, uris)
+
+    assert sorted(documents) == [
+        os.path.join("privacy", "Open.jsonld"),
+        os.path.join("types", "EegRaw.jsonld"),
+        os.path.join("types", "MagneticResonance.jsonld"),
+    ]
+    document = documents[os.path.join("types", "MagneticResonance.jsonld")]
+    assert document == {
+        **functions.JSONLD_TEMPLATE,
+        "label": "magnetic resonance",
+        "sameAs": "http://uri.interlex.org/mr",
+    }
+    # Without the API, the sameAs of the template is kept.
+    document = functions.build_jsonld_documents(report)[
+        os.path.join("privacy", "Open.jsonld")
+    ]
+    assert document["sameAs"] == functions.JSONLD_TEMPLATE["sameAs"]
+
+
+def test_to_jsonld_graph(functions):
+    report = {"types": {"count": 2, "values": ["MRI", "EEG"]}}
+    graph = functions.to_jsonld_graph(functions.build_jsonld_documents(report))
+
+    assert list(graph) == ["@context", "@graph"]
+    assert graph["@context"] == functions.JSONLD_TEMPLATE["@context"]
+    # The nodes share the context of the graph and are sorted by path.
+    assert [node["label"] for node in graph["@graph"]] == ["eeg", "mri"]
+    for node in graph["@graph"]:
+        assert "@context" not in node
+        assert node["@type"] == functions.JSONLD_TEMPLATE["@type"]
+
+
+def test_write_if_changed(functions, tmp_path):
+    path = tmp_path / "term.jsonld"
+
+    assert functions.write_if_changed(str(path), '{"label": "mri"}')
+    assert path.read_text() == '{"label": "mri"}'
+
+    # Unchanged content leaves the file untouched.
+    os.utime(path, ns=(0, 0))
+    assert not functions.write_if_changed(str(path), '{"label": "mri"}')
+    assert path.stat().st_mtime_ns == 0
+
+    # Changed content replaces the file instead of rewriting it in place.
+    inode = path.stat().st_ino
+    assert functions.write_if_changed(str(path), '{"label": "eeg"}')
+    assert path.read_text() == '{"label": "eeg"}'
+    assert path.stat().st_ino != inode
+    assert os.listdir(tmp_path) == ["term.jsonld"]
+
+
+def test_generate_jsonld_graph(functions, tmp_path):
+    report = {"types": {"count": 2, "values": ["MRI", "EEG"]}}
+    graph_path = tmp_path / "terms.jsonld"
+
+    functions.generate_jsonld_files(
+        report,
+        use_api=False,
+        output_dir=str(tmp_path),
+        graph_path=str(graph_path),
+    )
+
+    # A single graph is written instead of a directory per property.
+    assert os.listdir(tmp_path) == ["terms.jsonld"]
+    graph = json.loads(graph_path.read_text())
+    assert [node["label"] for node in graph["@graph"]] == ["eeg", "mri"]
@@ -0,0 +1,37 @@
+"""Test suite of the CONP datasets.
+
+The datasets are not listed here but parametrized at collection time from the
+submodules of the superdataset, see `tests/create_tests.py`. Use `-k` to test a
+subset of the datasets, e.g. `pytest tests/test_datasets.py -k preventad-open`.
+"""
+import functools
+
+from tests.create_tests import get_datasets
+from tests.shard import parse_shard
+from tests.shard import read_runtimes
+from tests.shard import select_shard
+from tests.template import Template
+
+
+@functools.lru_cache(maxsize=None)
+def get_dataset_selection(shard=None, runtimes_path=None):
+    datasets = get_datasets()
+    if shard:
+        index, total = parse_shard(shard)
+        datasets = select_shard(datasets, index, total, read_runtimes(runtimes_path))
+    return datasets
+
+
+def pytest_generate_tests(metafunc):
+    if "dataset" in metafunc.fixturenames:
+        metafunc.parametrize(
+            "dataset",
+            get_dataset_selection(
+                metafunc.config.getoption("--shard"),
+                metafunc.config.getoption("--shard-runtimes"),
+            ),
+        )
+
+
+class TestDataset(Template):
+    pass
@@ -4,10 +4,13 @@ import pytest
 
 from scripts.dats_jsonld_annotator.annotator import annotate_dats_object
 from scripts.dats_jsonld_annotator.annotator import CONTEXT_DIR
+from scripts.dats_jsonld_annotator.annotator import ContextRegistry
+from scripts.dats_jsonld_annotator.annotator import dats_to_jsonld_batch
 from scripts.dats_jsonld_annotator.annotator import find_context
 from scripts.dats_jsonld_annotator.annotator import find_schema
 from scripts.dats_jsonld_annotator.annotator import gen_jsonld_outpath
 from scripts.dats_jsonld_annotator.annotator import SCHEMA_DIR
+from scripts.dats_jsonld_annotator.annotator import SchemaRegistry
 
 
 @pytest.fixture()
@@ -211,3 +214,130 @@ class TestAnnotator:
 class TestCLI:
     # TODO: write tests for the CLI parser
     pass
+
+
+@pytest.fixture()
+def schema_dir(tmp_path):
+    base = "https://example.com/schema/"
+    schemata = {
+        "parent_schema.json": {
+            "id": base + "parent_schema.json",
+            "properties": {
+                "@type": {"enum": ["Parent"]},
+                "child": {"$ref": "a_schema.json#"},
+                "children": {
+                    "type": "array",
+                    "items": {
+                        "anyOf": [
+                            {"$ref": "a_schema.json#"},
+                            {"$ref": "b_schema.json#"},
+                        ]
+                    },
+                },
+                "name": {"type": "string"},
+            },
+        },
+        "a_schema.json": {
+            "id": base + "a_schema.json",
+            "properties": {"@type": {"enum": ["A"]}, "a": {"type": "string"}},
+            "required": ["a"],
+        },
+        "b_schema.json": {
+            "id": base + "b_schema.json",
+            "properties": {"@type": {"enum": ["B"]}, "b": {"type": "string"}},
+            "required": ["b"],
+        },
+    }
+    for name, schema in schemata.items():
+        (tmp_path / name).write_text(json.dumps(schema))
+    return tmp_path
+
+
+class TestSchemaRegistry:
+    def test_precomputed_terms(self, schema_dir):
+        registry = SchemaRegistry(schema_dir)
+        parent_id = "https://example.com/schema/parent_schema.json"
+        assert registry.terms[(parent_id, "name")] is None
+        schema_rel, candidates = registry.terms[(parent_id, "children")]
+        assert schema_rel == "anyOf"
+        assert [ref for ref, _ in candidates] == ["a_schema.json#", "b_schema.json#"]
+
+    def test_find_schema(self, schema_dir):
+        registry = SchemaRegistry(schema_dir)
+        parent = json.loads((schema_dir / "parent_schema.json").read_text())
+        assert find_schema(parent, "child", {}, registry)["id"].endswith(
+            "a_schema.json"
+        )
+        assert find_schema(parent, "children", {"b": ""}, registry)["id"].endswith(
+            "b_schema.json"
+        )
+        assert find_schema(parent, "children", {"c": ""}, registry) is None
+        assert find_schema(parent, "name", "", registry) is None
+
+    def test_cached_validator(self, schema_dir):
+        registry = SchemaRegistry(schema_dir)
+        schema = registry.store["https://example.com/schema/a_schema.json"]
+        assert registry.validator(schema) is registry.validator(dict(schema))
+
+
+class TestContextRegistry:
+    def test_context_is_loaded_once(self, tmp_path):
+        context_f = tmp_path / "dataset_sdo_context.jsonld"
+        context_f.write_text(json.dumps({"@context": {"Dataset": "sdo:Dataset"}}))
+        registry = ContextRegistry(tmp_path)
+
+        context = registry.get("/remote/dataset_schema.json")
+        assert context == {"Dataset": "sdo:Dataset"}
+        context_f.unlink()
+        assert registry.get("/remote/dataset_schema.json") is context
+        with pytest.raises(FileNotFoundError):
+            registry.get("/remote/person_schema.json")
+
+    def test_find_context_shares_registry(self, tmp_path):
+        (tmp_path / "person_sdo_context.jsonld").write_text(
+            json.dumps({"@context": {"Person": "sdo:Person"}})
+        )
+        context = find_context("/remote/person_schema.json", tmp_path)
+        assert find_context("/remote/person_schema.json", str(tmp_path)) is context
+
+
+class TestBatch:
+    def test_batch(self, tmp_path, schema_dir):
+        context_dir = tmp_path / "context"
+        context_dir.mkdir()
+        for name, context in [
+            ("parent", {"Parent": "sdo:Dataset", "name": "sdo:name"}),
+            ("a", {"A": "sdo:Thing"}),
+            ("b", {"B": "sdo:Thing"}),
+        ]:
+            (context_dir / f"{name}_sdo_context.jsonld").write_text(
+                json.dumps({"@context": context})
+            )
+
+        files_to_convert = []
+        for name, dats in [
+            ("valid", {"name": "x", "children": [{"b": "y"}]}),
+            ("invalid", {"name": 1}),
+        ]:
+            (tmp_path / "projects" / name).mkdir(parents=True)
+            dats_f = tmp_path / "projects" / name / "DATS.json"
+            dats_f.write_text(json.dumps(dats))
+            files_to_convert.append(dats_f)
+        out_path = tmp_path / "out"
+        out_path.mkdir()
+
+        results = dats_to_jsonld_batch(
+            files_to_convert,
+            schema_f=schema_dir / "parent_schema.json",
+            context_dir=context_dir,
+            out_path=out_path,
+            jobs=2,
+        )
+        assert [result["status"] for result in results] == ["converted", "failed"]
+        assert "is not a valid DATS file: name: 1 is not of type" in results[1]["error"]
+        assert all(result["time"] >= 0 for result in results)
+        jsonld = json.loads((out_path / "valid_DATS.jsonld").read_text())
+        assert jsonld["@type"] == "Parent"
+        assert jsonld["children"][0]["@type"] == "B"
+        assert jsonld["@context"][0]["B"] == "sdo:Thing"
+        assert sorted(p.name for p in out_path.iterdir()) == ["valid_DATS.jsonld"]
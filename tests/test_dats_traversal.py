@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from scripts.dats_traversal import iter_datasets
+from scripts.dats_traversal import iterencode
+from scripts.dats_traversal import trampoline
+
+# Deeper than the default recursion limit of Python
+DEPTH = 3000
+
+
+def deep_dats(depth=DEPTH):
+    root = {"title": "0"}
+    dataset = root
+    for i in range(1, depth):
+        dataset["hasPart"] = [{"title": str(i)}]
+        dataset = dataset["hasPart"][0]
+    return root
+
+
+def count_nodes(node):
+    total = 1
+    for child in node.get("children", []):
+        total += yield count_nodes(child)
+    return total
+
+
+def visit_order(node, visited):
+    visited.append(node["name"])
+    for child in node.get("children", []):
+        yield visit_order(child, visited)
+    visited.append(f"/{node['name']}")
+
+
+class TestTrampoline:
+    def test_returned_values(self):
+        tree = {"children": [{"children": [{}, {}]}, {}]}
+        assert trampoline(count_nodes(tree)) == 5
+
+    def test_order_is_the_recursion_order(self):
+        tree = {"name": "a", "children": [{"name": "b"}, {"name": "c"}]}
+        visited = []
+        trampoline(visit_order(tree, visited))
+        assert visited == ["a", "b", "/b", "c", "/c", "/a"]
+
+    def test_deep_tree(self):
+        tree = {}
+        node = tree
+        for _ in range(DEPTH):
+            node["children"] = [{}]
+            node = node["children"][0]
+        assert trampoline(count_nodes(tree)) == DEPTH + 1
+
+
+class TestIterDatasets:
+    def test_preorder(self):
+        dats = {
+            "title": "a",
+            "hasPart": [{"title": "b", "hasPart": [{"title": "c"}]}, {"title": "d"}],
+        }
+        assert [dataset["title"] for dataset in iter_datasets(dats)] == [
+            "a",
+            "b",
+            "c",
+            "d",
+        ]
+
+    def test_deep_dats(self):
+        assert sum(1 for _ in iter_datasets(deep_dats())) == DEPTH
+
+
+class TestIterencode:
+    @pytest.mark.parametrize(
+        "obj",
+        [
+            {},
+            [],
+            "DATS",
+            None,
+            {"title": "Étude", "size": 1.5, "keywords": [], "types": [{}], "ok": True},
+            [[1, [2, {"a": None}]], {"b": "\n"}],
+            {1: "int key", None: "null key"},
+        ],
+    )
+    def test_same_as_json_dumps(self, obj):
+        assert "".join(iterencode(obj)) == json.dumps(obj, indent=2)
+        assert "".join(iterencode(obj, indent=4)) == json.dumps(obj, indent=4)
+
+    def test_deep_dats(self):
+        encoded = "".join(iterencode(deep_dats(), indent=0))
+        assert encoded.count('"title"') == DEPTH
+        assert encoded.endswith("}\n]\n}")
@@ -1,12 +1,32 @@
 import copy
 import json
 import os
+import shutil
+import tempfile
+import threading
 import unittest
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from unittest import mock
 
+from scripts.dats_validator import validator
+from scripts.dats_validator.validator import check_non_schema_required
+from scripts.dats_validator.validator import check_urls
+from scripts.dats_validator.validator import CHECKS
+from scripts.dats_validator.validator import collect_derived_from
+from scripts.dats_validator.validator import get_dats_files
+from scripts.dats_validator.validator import get_validator
 from scripts.dats_validator.validator import REQUIRED_EXTRA_PROPERTIES
+from scripts.dats_validator.validator import UrlStatusCache
+from scripts.dats_validator.validator import validate_all
 from scripts.dats_validator.validator import validate_extra_properties
+from scripts.dats_validator.validator import validate_file
 from scripts.dats_validator.validator import validate_json
 from scripts.dats_validator.validator import validate_non_schema_required
+from scripts.dats_validator.validator import validate_schema
+from scripts.dats_validator.validator import ValidationStore
+from scripts.dats_validator.validator import write_report
 
 EXAMPLES = os.path.join(os.getcwd(), "scripts", "dats_validator", "examples")
 VALID = os.path.join(EXAMPLES, "valid_dats.json")
@@ -27,6 +47,49 @@ class JsonschemaTest(unittest.TestCase):
         self.assertEqual(valid_validation, True)
         self.assertEqual(invalid_validation, False)
 
+    def test_validate_schema(self):
+        self.assertEqual(validate_schema(valid_obj), (True, []))
+        is_valid, errors = validate_schema(invalid_obj)
+        self.assertEqual(is_valid, False)
+        self.assertTrue(errors)
+
+    def test_cached_validator(self):
+        self.assertIs(get_validator(), get_validator())
+
+
+class FastValidationTest(unittest.TestCase):
+    def setUp(self):
+        self.validator = mock.Mock(**{"iter_errors.return_value": []})
+        patcher = mock.patch.object(
+            validator,
+            "get_validator",
+            return_value=self.validator,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_jsonschema_by_default(self):
+        fast_validator = mock.Mock()
+        with mock.patch.object(
+            validator,
+            "get_fast_validator",
+            return_value=fast_validator,
+        ):
+            self.assertEqual(validate_schema(valid_obj), (True, []))
+        fast_validator.assert_not_called()
+        self.validator.iter_errors.assert_called_once_with(valid_obj)
+
+    def test_fast_validation(self):
+        fast_validator = mock.Mock()
+        with mock.patch.object(
+            validator,
+            "get_fast_validator",
+            return_value=fast_validator,
+        ):
+            self.assertEqual(validate_schema(valid_obj, fast=True), (True, []))
+        fast_validator.assert_called_once_with(valid_obj)
+        self.validator.iter_errors.assert_not_called()
+
 
 class ExtraPropertiesTest(unittest.TestCase):
     def test_non_schema_required(self):
@@ -68,6 +131,25 @@ class ExtraPropertiesTest(unittest.TestCase):
                 error,
             )
 
+    def test_deep_has_part(self):
+        # Deeper than the default recursion limit of Python
+        dataset = root = None
+        for i in range(3000):
+            part = {
+                "title": str(i),
+                "distributions": [{"formats": ["CSV"]}],
+                "extraProperties": [
+                    {"category": category, "values": [{"value": "CONP"}]}
+                    for category in REQUIRED_EXTRA_PROPERTIES
+                ],
+            }
+            if dataset is None:
+                root = part
+            else:
+                dataset["hasPart"] = [part]
+            dataset = part
+        self.assertEqual(check_non_schema_required(root), (True, []))
+
     def test_subject(self):
         modified_copy = copy.deepcopy(valid_obj)
         for prop in modified_copy["extraProperties"]:
@@ -78,5 +160,219 @@ class ExtraPropertiesTest(unittest.TestCase):
             self.assertIn("required but not found", error)
 
 
+class ValidateAllTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.addCleanup(validator.get_url_cache.cache_clear)
+        patcher = mock.patch.object(
+            validator,
+            "URL_CACHE_PATH",
+            os.path.join(self.root, "derived-from.json"),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # projects/valid has a nested subdataset declared in its .gitmodules
+        for dataset, dats in [
+            ("projects/valid", VALID),
+            ("projects/valid/sub", INVALID),
+            ("projects/invalid", INVALID),
+        ]:
+            os.makedirs(os.path.join(self.root, dataset))
+            shutil.copy(dats, os.path.join(self.root, dataset, "DATS.json"))
+        with open(os.path.join(self.root, "projects/valid/.gitmodules"), "w") as f:
+            f.write('[submodule "sub"]\n\tpath = sub\n\turl = https://example.com\n')
+        os.makedirs(os.path.join(self.root, "projects/empty"))
+        with open(os.path.join(self.root, "projects/broken.json"), "w") as f:
+            f.write("{")
+
+    def test_get_dats_files(self):
+        self.assertEqual(
+            get_dats_files(self.root),
+            [
+                os.path.join(self.root, "projects/invalid", "DATS.json"),
+                os.path.join(self.root, "projects/valid", "DATS.json"),
+                os.path.join(self.root, "projects/valid/sub", "DATS.json"),
+            ],
+        )
+
+    def test_validate_all(self):
+        dats_files = get_dats_files(self.root) + [
+            os.path.join(self.root, "projects/broken.json"),
+        ]
+        results = validate_all(dats_files, jobs=2)
+        self.assertEqual([result["file"] for result in results], dats_files)
+        self.assertFalse(results[0]["valid"])
+        self.assertEqual(list(results[3]["errors"]), ["load"])
+        for result in results[:3]:
+            self.assertLessEqual(set(result["errors"]), set(CHECKS))
+
+        json_report = os.path.join(self.root, "report.json")
+        write_report(results, json_report)
+        with open(json_report) as f:
+            report = json.load(f)
+        self.assertEqual(report["total"], 4)
+        self.assertEqual(report["results"], results)
+
+        junit_report = os.path.join(self.root, "report.xml")
+        write_report(results, junit_report)
+        testsuite = ET.parse(junit_report).getroot()
+        self.assertEqual(int(testsuite.get("tests")), 3 * len(CHECKS) + 1)
+        self.assertEqual(
+            int(testsuite.get("failures")),
+            len(testsuite.findall("testcase/failure")),
+        )
+
+
+class ValidationStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.dats_file = os.path.join(self.tmp_dir, "DATS.json")
+        shutil.copy(INVALID, self.dats_file)
+        self.store = ValidationStore(os.path.join(self.tmp_dir, "store"))
+
+    def test_validate_file_store(self):
+        def check(json_obj):
+            return False, ["error"]
+
+        # The derivedFrom URLs of the file were checked by a previous run.
+        url_cache = UrlStatusCache(os.path.join(self.tmp_dir, "derived-from.json"))
+        for url in collect_derived_from(invalid_obj):
+            url_cache.set(url, False)
+        with mock.patch.object(
+            validator, "CHECKS", {"check": check}
+        ), mock.patch.object(
+            validator,
+            "get_url_cache",
+            return_value=url_cache,
+        ):
+            result = validate_file(self.dats_file, self.store)
+        self.assertNotIn("cached", result)
+        self.assertEqual(result["errors"], {"check": ["error"]})
+
+        with mock.patch.object(validator, "CHECKS", {}):
+            cached = validate_file(self.dats_file, self.store)
+        self.assertTrue(cached["cached"])
+        self.assertEqual(cached["errors"], result["errors"])
+
+        # A change of the content invalidates the stored result.
+        with open(self.dats_file, "a") as f:
+            f.write("\n")
+        with mock.patch.object(validator, "CHECKS", {}):
+            result = validate_file(self.dats_file, self.store)
+        self.assertNotIn("cached", result)
+        self.assertEqual(result["errors"], {})
+
+    def test_indeterminate_result_not_stored(self):
+        def failing_check(json_obj):
+            raise ValueError("network is down")
+
+        with mock.patch.object(validator, "CHECKS", {"failing": failing_check}):
+            result = validate_file(self.dats_file, self.store)
+        self.assertFalse(result["valid"])
+        self.assertFalse(os.path.exists(self.store.directory))
+
+        # A derivedFrom URL whose status is unknown is checked again on the next run.
+        url_cache = UrlStatusCache(os.path.join(self.tmp_dir, "derived-from.json"))
+        with mock.patch.object(validator, "CHECKS", {}), mock.patch.object(
+            validator,
+            "collect_derived_from",
+            return_value=["https://example.com/unreachable"],
+        ), mock.patch.object(validator, "get_url_cache", return_value=url_cache):
+            validate_file(self.dats_file, self.store)
+            self.assertFalse(os.path.exists(self.store.directory))
+
+            url_cache.set("https://example.com/unreachable", False)
+            validate_file(self.dats_file, self.store)
+            self.assertTrue(os.listdir(self.store.directory))
+
+    def test_max_age(self):
+        self.store.put("key", {"valid": True, "errors": {}}, now=0)
+        self.assertEqual(
+            self.store.get("key", now=self.store.max_age),
+            {"valid": True, "errors": {}},
+        )
+        self.assertIsNone(self.store.get("key", now=self.store.max_age + 1))
+        self.assertIsNone(self.store.get("missing"))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """/ok answers HEAD, /no-head only answers GET and anything else is missing."""
+
+    requests = []
+
+    def do_HEAD(self):
+        self.requests.append(("HEAD", self.path))
+        self.send_response(200 if self.path == "/ok" else 405)
+        self.end_headers()
+
+    def do_GET(self):
+        self.requests.append(("GET", self.path))
+        self.send_response(200 if self.path in ("/ok", "/no-head") else 404)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class UrlCheckTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        StubHandler.requests = []
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.cache_path = os.path.join(tmp_dir, "derived-from.json")
+
+    def test_check_urls(self):
+        urls = [f"{self.url}/ok", f"{self.url}/no-head", f"{self.url}/missing"]
+        statuses = check_urls(urls * 2, url_cache=UrlStatusCache(self.cache_path))
+        self.assertEqual(statuses, dict(zip(urls, [True, True, False])))
+        self.assertEqual(
+            sorted(StubHandler.requests),
+            [
+                ("GET", "/missing"),
+                ("GET", "/no-head"),
+                ("HEAD", "/missing"),
+                ("HEAD", "/no-head"),
+                ("HEAD", "/ok"),
+            ],
+        )
+
+        # A new run reads the statuses from the disk.
+        StubHandler.requests = []
+        statuses = check_urls(urls, url_cache=UrlStatusCache(self.cache_path))
+        self.assertEqual(statuses, dict(zip(urls, [True, True, False])))
+        self.assertEqual(StubHandler.requests, [])
+
+    def test_cache_ttl(self):
+        url_cache = UrlStatusCache(self.cache_path, ttl=60)
+        url_cache.set("https://example.com", True, now=0)
+        self.assertTrue(url_cache.get("https://example.com", now=60))
+        self.assertIsNone(url_cache.get("https://example.com", now=61))
+        self.assertIsNone(url_cache.get("https://example.org", now=0))
+
+    def test_collect_derived_from(self):
+        dataset = {
+            "extraProperties": [
+                {"category": "derivedFrom", "values": [{"value": "a"}]},
+            ],
+            "hasPart": [
+                {
+                    "extraProperties": [
+                        {"category": "derivedFrom", "values": [{"value": "b"}]},
+                    ],
+                },
+            ],
+        }
+        self.assertEqual(sorted(collect_derived_from(dataset)), ["a", "b"])
+
+
 if __name__ == "__main__":
     unittest.main()
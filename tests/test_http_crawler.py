@@ -0,0 +1,287 @@
+"""Test the HTTP and S3 listings of the DataLad crawlers against a local stub server."""
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import unquote
+from urllib.parse import urlsplit
+
+import pytest
+
+from scripts.datalad_crawlers import listing
+from scripts.datalad_crawlers.http_crawler import autoindex_lister
+from scripts.datalad_crawlers.http_crawler import s3_lister
+from scripts.datalad_crawlers.listing import crawl_tree
+from scripts.datalad_crawlers.listing import diff_listings
+from scripts.datalad_crawlers.listing import Entry
+from scripts.datalad_crawlers.listing import list_tree
+from scripts.datalad_crawlers.listing import load_listing
+from scripts.datalad_crawlers.listing import save_listing
+from scripts.datalad_crawlers.listing import update_entries
+
+INDEXES = {
+    "/data/": [
+        "../",
+        "?C=N;O=D",
+        "a.txt",
+        "sub/",
+        "http://example.com/other.txt",
+        "/elsewhere/b.txt",
+        "sub/#top",
+        "sub%20(1)/",
+    ],
+    "/data/sub/": ["../", "b%20c.txt", "no-head.txt"],
+    # absolute links, encoded differently than the URL of the directory
+    "/data/sub (1)/": ["/data/", "/data/sub%20(1)/d(2).txt"],
+}
+
+FILES = {
+    "/data/a.txt": ("12", '"etag-a"'),
+    "/data/sub/b c.txt": ("3", '"etag-b"'),
+    "/data/sub (1)/d(2).txt": ("4", '"etag-d"'),
+}
+
+S3_PAGES = {
+    ("", None): (
+        ["data/a.txt"],
+        ["data/sub/"],
+        "page-2",
+    ),
+    ("", "page-2"): (["data/folder/"], [], None),
+    ("sub/", None): (["data/sub/b c.txt"], [], None),
+}
+
+
+def s3_result(keys, prefixes, token):
+    contents = "".join(
+        f"<Contents><Key>{key}</Key><Size>{len(key)}</Size>"
+        f"<LastModified>2020-01-01T00:00:00.000Z</LastModified>"
+        f"<ETag>&quot;etag-{len(key)}&quot;</ETag></Contents>"
+        for key in keys
+    )
+    common_prefixes = "".join(
+        f"<CommonPrefixes><Prefix>{prefix}</Prefix></CommonPrefixes>"
+        for prefix in prefixes
+    )
+    truncated = (
+        f"<IsTruncated>true</IsTruncated><NextContinuationToken>{token}</NextContinuationToken>"
+        if token
+        else "<IsTruncated>false</IsTruncated>"
+    )
+    return (
+        '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+        f"{contents}{common_prefixes}{truncated}</ListBucketResult>"
+    )
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Serves the directory indexes, the files and the ListObjectsV2 of /bucket."""
+
+    def do_HEAD(self):
+        path = unquote(self.path)
+        if path not in FILES:
+            self.send_error(404)
+            return
+        size, etag = FILES[path]
+        self.send_response(200)
+        self.send_header("Content-Length", size)
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", "Wed, 01 Jan 2020 00:00:00 GMT")
+        self.end_headers()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/bucket":
+            query = parse_qs(url.query)
+            page = (
+                query["prefix"][0][len("data/") :],
+                query.get("continuation-token", [None])[0],
+            )
+            body = s3_result(*S3_PAGES[page])
+        elif unquote(url.path) in INDEXES:
+            body = "".join(
+                f'<a href="{href}">{href}</a>' for href in INDEXES[unquote(url.path)]
+            )
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_autoindex(server_url):
+    with ThreadPoolExecutor(max_workers=2) as head_pool:
+        list_dir = autoindex_lister(f"{server_url}/data", head_pool=head_pool)
+        entries = sorted(list_tree(list_dir, jobs=2))
+    assert entries == [
+        Entry(
+            f"{server_url}/data/a.txt",
+            "a.txt",
+            12,
+            "Wed, 01 Jan 2020 00:00:00 GMT",
+            "etag-a",
+        ),
+        # the URL of the file is kept as served
+        Entry(
+            f"{server_url}/data/sub%20(1)/d(2).txt",
+            "sub (1)/d(2).txt",
+            4,
+            "Wed, 01 Jan 2020 00:00:00 GMT",
+            "etag-d",
+        ),
+        Entry(
+            f"{server_url}/data/sub/b%20c.txt",
+            "sub/b c.txt",
+            3,
+            "Wed, 01 Jan 2020 00:00:00 GMT",
+            "etag-b",
+        ),
+        # the HEAD request of this file fails, it is listed without its headers
+        Entry(f"{server_url}/data/sub/no-head.txt", "sub/no-head.txt", None, None),
+    ]
+
+    entries = list_tree(autoindex_lister(f"{server_url}/data/"))
+    assert sorted(entry.path for entry in entries) == [
+        "a.txt",
+        "sub (1)/d(2).txt",
+        "sub/b c.txt",
+        "sub/no-head.txt",
+    ]
+
+
+def test_s3(server_url):
+    entries = sorted(list_tree(s3_lister(server_url, "bucket", "data"), jobs=2))
+    assert entries == [
+        Entry(
+            f"{server_url}/bucket/data/a.txt",
+            "a.txt",
+            10,
+            "2020-01-01T00:00:00.000Z",
+            "etag-10",
+        ),
+        Entry(
+            f"{server_url}/bucket/data/sub/b%20c.txt",
+            "sub/b c.txt",
+            16,
+            "2020-01-01T00:00:00.000Z",
+            "etag-16",
+        ),
+    ]
+
+
+def test_listing_diff(tmp_path):
+    listing_path = str(tmp_path / "listing.jsonl")
+    previous = [
+        Entry("u/a", "a", 1, "1", "x"),
+        Entry("u/b", "b", 2, "1", "x"),
+        Entry("u/c", "c", 3, "1"),
+    ]
+    assert list(save_listing(previous, listing_path)) == previous
+    previous = {entry.path: entry for entry in load_listing(listing_path)}
+
+    current = {
+        "a": Entry("u/a", "a", 1, "1", "x"),
+        "b": Entry("u/b", "b", 2, "1", "y"),
+        "d": Entry("u/d", "d", 4, "1"),
+    }
+    assert diff_listings(previous, current) == (
+        [current["d"]],
+        [previous["c"]],
+        [current["b"]],
+    )
+
+
+def test_update_entries_failures(tmp_path, monkeypatch):
+    listing_path = str(tmp_path / "listing.jsonl")
+    previous = [Entry("u/a", "a", 1, "1"), Entry("u/b", "b", 2, "1")]
+    for _ in save_listing(previous, listing_path):
+        pass
+
+    current = [
+        Entry("u/a", "a", 1, "2"),
+        Entry("u/b", "b", 2, "2"),
+        Entry("u/c", "c", 3, "1"),
+        Entry("u/d", "d", 4, "1"),
+    ]
+    # git-annex fails to add the changed file b and the new file d
+    monkeypatch.setattr(listing, "remove_files", lambda paths: None)
+    monkeypatch.setattr(
+        listing,
+        "annex_entries",
+        lambda entries, metadata: [
+            entry for entry in entries if entry.path in ("b", "d")
+        ],
+    )
+    failed = update_entries(current, listing_path)
+    assert [entry.path for entry in failed] == ["d", "b"]
+
+    # Only the failed files are updated again by the next crawl.
+    saved = {entry.path: entry for entry in load_listing(listing_path)}
+    assert saved == {"a": current[0], "b": previous[1], "c": current[2]}
+    added, removed, changed = diff_listings(
+        saved,
+        {entry.path: entry for entry in current},
+    )
+    assert (added, removed, changed) == ([current[3]], [], [current[1]])
+
+
+def test_listing_saved_before_annexing(server_url, tmp_path, monkeypatch):
+    listing_path = str(tmp_path / "listing.jsonl")
+
+    def annex_entries(entries, metadata):
+        # An interrupted crawl can be resumed from the complete listing.
+        assert sorted(entry.path for entry in load_listing(listing_path)) == [
+            "a.txt",
+            "sub (1)/d(2).txt",
+            "sub/b c.txt",
+            "sub/no-head.txt",
+        ]
+        return [entry for entry in entries if entry.path == "a.txt"]
+
+    monkeypatch.setattr(listing, "annex_entries", annex_entries)
+    failed = crawl_tree(
+        autoindex_lister(f"{server_url}/data"),
+        listing_path=listing_path,
+    )
+    assert [entry.path for entry in failed] == ["a.txt"]
+
+
+def test_remove_files_literal(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    names = ["data1.nii", "data[1].nii", "data*.nii", "other.nii"]
+    for name in names:
+        (tmp_path / name).write_text(name)
+    subprocess.run(["git", "init", "-q"], check=True)
+    subprocess.run(["git", "add", "."], check=True)
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+        + ["commit", "-q", "-m", "init"],
+        check=True,
+    )
+
+    # Glob characters only match the files named after them.
+    listing.remove_files(["data[1].nii", "data*.nii", "missing*"])
+    tracked = subprocess.run(
+        ["git", "ls-files"],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout.split()
+    assert tracked == ["data1.nii", "other.nii"]
+    assert sorted(os.listdir(tmp_path)) == [".git", "data1.nii", "other.nii"]
@@ -0,0 +1,42 @@
+"""Test the verification of the new URLs of the URL migration script."""
+import threading
+import time
+from collections import Counter
+from unittest import mock
+
+from scripts.datalad_helper_scripts import migrate_URLs
+from scripts.datalad_helper_scripts.migrate_URLs import verify_urls
+
+
+def test_verify_urls():
+    lock = threading.Lock()
+    running = Counter()
+    peak = Counter()
+
+    def get_response_status(url):
+        host = url.split("/")[2]
+        with lock:
+            running[host] += 1
+            peak[host] = max(peak[host], running[host])
+        time.sleep(0.01)
+        with lock:
+            running[host] -= 1
+        return {"ok": True, "missing": False}.get(url.rsplit("/", 1)[1])
+
+    urls = [f"https://a.org/{i}/ok" for i in range(8)] + [
+        "https://b.org/missing",
+        "https://c.org/unreachable",
+    ]
+    with mock.patch.object(
+        migrate_URLs,
+        "get_response_status",
+        side_effect=get_response_status,
+    ):
+        statuses = verify_urls(urls, jobs=8, jobs_per_host=2)
+
+    assert statuses == {
+        **{url: True for url in urls[:8]},
+        "https://b.org/missing": False,
+        "https://c.org/unreachable": False,
+    }
+    assert peak["a.org"] <= 2
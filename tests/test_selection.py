@@ -0,0 +1,126 @@
+"""Test the dataset selection from the changes of the superdataset."""
+from datetime import datetime
+
+import git
+import pytest
+
+from tests.results_cache import get_test_suite_version
+from tests.results_cache import MAX_AGE
+from tests.results_cache import ResultsCache
+from tests.results_cache import SUCCESS
+from tests.selection import DatasetTrie
+from tests.selection import get_changed_files
+from tests.selection import get_submodule_commits
+
+SHA_A = "a" * 40
+SHA_B = "b" * 40
+
+
+@pytest.fixture()
+def superdataset(tmp_path):
+    """Superdataset with two gitlinks, one of them updated in a second commit."""
+    repo = git.Repo.init(tmp_path)
+    repo.config_writer().set_value("user", "name", "conp").release()
+    repo.config_writer().set_value("user", "email", "conp@example.com").release()
+
+    (tmp_path / "README.md").write_text("CONP\n")
+    repo.git.add("README.md")
+    for path in ["projects/preventad-open", "projects/preventad-open-bids"]:
+        repo.git.update_index("--add", "--cacheinfo", f"160000,{SHA_A},{path}")
+    repo.git.commit("-m", "Add datasets")
+
+    repo.git.update_index(
+        "--cacheinfo",
+        f"160000,{SHA_B},projects/preventad-open-bids",
+    )
+    repo.git.commit("-m", "Update dataset")
+    return repo
+
+
+@pytest.mark.parametrize(
+    "filename, dataset",
+    [
+        ("projects/preventad-open", "projects/preventad-open"),
+        ("projects/preventad-open/README.md", "projects/preventad-open"),
+        ("projects/preventad-open-bids/DATS.json", "projects/preventad-open-bids"),
+        ("projects/preventad-open/sub/DATS.json", "projects/preventad-open/sub"),
+        ("projects/preventad", None),
+        ("projects/preventadXopen/README.md", None),
+        ("README.md", None),
+    ],
+)
+def test_trie_match(filename, dataset):
+    trie = DatasetTrie(
+        [
+            "projects/preventad-open",
+            "projects/preventad-open-bids",
+            "projects/preventad-open/sub",
+        ],
+    )
+    assert trie.match(filename) == dataset
+
+
+def test_submodule_commits(superdataset):
+    commits = get_submodule_commits(root=superdataset.working_dir)
+    assert commits == {
+        "projects/preventad-open": SHA_A,
+        "projects/preventad-open-bids": SHA_B,
+    }
+
+
+def test_changed_files(superdataset):
+    # A change of the gitlink commit of a dataset shows up as its path.
+    root = superdataset.working_dir
+    assert get_changed_files("HEAD~1", root=root) == ["projects/preventad-open-bids"]
+
+
+def test_results_max_age(tmp_path):
+    cache = ResultsCache(str(tmp_path / "results-cache.json"))
+    now = datetime.now().astimezone()
+    cache.update("projects/a", SHA_A, "test_has_readme", SUCCESS)
+    cache.update(
+        "projects/a",
+        SHA_A,
+        "test_download",
+        SUCCESS,
+        updated=str(now - MAX_AGE["test_download"] / 2),
+    )
+    assert cache.passed("projects/a", SHA_A, "test_download", now=now)
+    assert cache.passed("projects/a", SHA_A, now=now)
+    assert not cache.passed("projects/a", SHA_B, "test_download", now=now)
+
+    later = now + MAX_AGE["test_download"]
+    assert not cache.passed("projects/a", SHA_A, "test_download", now=later)
+    assert cache.passed("projects/a", SHA_A, "test_has_readme", now=later)
+    assert not cache.passed("projects/a", SHA_A, now=later)
+
+    # A new commit discards the results of the previous one.
+    cache.update("projects/a", SHA_B, "test_has_readme", SUCCESS)
+    assert cache.result("projects/a", SHA_A, "test_download") is None
+    assert cache.passed("projects/a", SHA_B, now=now)
+
+
+def test_results_version(tmp_path):
+    path = str(tmp_path / "results-cache.json")
+    cache = ResultsCache(path, version="v1")
+    cache.update("projects/a", SHA_A, "test_has_readme", SUCCESS)
+    cache.save()
+
+    assert ResultsCache(path, version="v1").passed("projects/a", SHA_A)
+    # A change of the test suite, validator or schemas invalidates the results.
+    cache = ResultsCache(path, version="v2")
+    assert not cache.passed("projects/a", SHA_A)
+    cache.update("projects/a", SHA_A, "test_download", SUCCESS)
+    assert cache.result("projects/a", SHA_A, "test_has_readme") is None
+    assert cache.passed("projects/a", SHA_A)
+
+
+def test_test_suite_version(tmp_path):
+    (tmp_path / "tests").mkdir()
+    (tmp_path / "tests" / "template.py").write_text("a = 1\n")
+    version = get_test_suite_version(str(tmp_path))
+    assert get_test_suite_version(str(tmp_path)) == version
+
+    (tmp_path / "scripts" / "dats_validator").mkdir(parents=True)
+    (tmp_path / "scripts" / "dats_validator" / "validator.py").write_text("b = 1\n")
+    assert get_test_suite_version(str(tmp_path)) != version
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from tests.shard import get_dataset_weights
+from tests.shard import load_runtimes
+from tests.shard import lpt_shards
+from tests.shard import parse_shard
+from tests.shard import read_runtimes
+from tests.shard import save_runtimes
+from tests.shard import select_shard
+
+
+def test_lpt_shards_balance():
+    weights = {"a": 7, "b": 5, "c": 4, "d": 3, "e": 3, "f": 2}
+    shards = lpt_shards(weights, 2)
+
+    assert sorted(item for shard in shards for item in shard) == sorted(weights)
+    loads = [sum(weights[item] for item in shard) for shard in shards]
+    assert loads == [12, 12]
+
+
+def test_lpt_shards_more_shards_than_items():
+    assert lpt_shards({"a": 1}, 3) == [["a"], [], []]
+
+
+def test_dataset_weights(tmp_path):
+    status_path = tmp_path / "test-status.json"
+    status_path.write_text(
+        json.dumps(
+            {
+                "big:download": {"Runtime": 100.0},
+                "big:files_integrity": {"Runtime": 20.0},
+                "small:download": {"Runtime": 2.0},
+                "medium_sub:download": {"Runtime": 10.0},
+                "medium_sub:files_integrity": {
+                    "Runtime": 0.01,
+                    "Message": "Already passed on dataset commit abc.",
+                },
+            },
+        ),
+    )
+    runtimes = load_runtimes(str(status_path))
+    assert runtimes == {"big": 120.0, "small": 2.0, "medium_sub": 10.0}
+
+    weights = get_dataset_weights(
+        ["projects/big", "projects/medium/sub", "projects/new"],
+        runtimes,
+    )
+    assert weights == {
+        "projects/big": 120.0,
+        "projects/medium/sub": 10.0,
+        "projects/new": 10.0,
+    }
+
+
+def test_select_shard():
+    datasets = ["projects/a", "projects/b", "projects/c", "projects/d"]
+    runtimes = {"a": 1.0, "b": 10.0, "c": 2.0, "d": 8.0}
+
+    shards = [select_shard(datasets, index, 2, runtimes) for index in range(2)]
+    assert shards == [["projects/a", "projects/b"], ["projects/c", "projects/d"]]
+
+
+@pytest.mark.parametrize("shard", ["2/2", "-1/2", "0"])
+def test_parse_invalid_shard(shard):
+    with pytest.raises(ValueError):
+        parse_shard(shard)
+
+
+def test_runtimes_shared(tmp_path):
+    path = str(tmp_path / "runtimes.json")
+    with pytest.raises(FileNotFoundError):
+        read_runtimes(path)
+
+    save_runtimes({"a": 1.0, "b": 10.0}, path)
+    assert read_runtimes(path) == {"a": 1.0, "b": 10.0}
@@ -0,0 +1,87 @@
+"""Test the statistics of the data aggregation summary scripts."""
+import pandas as pd
+import pytest
+
+from scripts.data_aggregation_summary_scripts.lib.Statistics import get_authorization
+from scripts.data_aggregation_summary_scripts.lib.Statistics import get_data_provider
+from scripts.data_aggregation_summary_scripts.lib.Statistics import (
+    get_stats_per_data_provider,
+)
+from scripts.data_aggregation_summary_scripts.lib.Statistics import get_stats_per_domain
+from scripts.data_aggregation_summary_scripts.lib.Statistics import read_tool_table
+
+
+@pytest.mark.parametrize(
+    "landing_page, data_provider",
+    [
+        ("https://zenodo.org/record/1", "zenodo"),
+        ("https://preventad.loris.ca/login", "loris"),
+        ("https://www.frdr-dfdr.ca/repo/dataset/1", "frdr"),
+        ("https://osf.io/abcde/", "osf"),
+        ("https://braincode.ca/content/open-data-releases", "braincode"),
+        ("https://data.example.ac.uk/dataset", "unknown"),
+        (None, "unknown"),
+    ],
+)
+def test_get_data_provider(landing_page, data_provider):
+    assert get_data_provider(landing_page) == data_provider
+
+
+def test_get_authorization():
+    assert get_authorization('["Restricted", "public"]') == "Restricted"
+    assert get_authorization('["with \\"quotes\\""]') == 'with "quotes"'
+    assert get_authorization("[]") == "unknown"
+    assert get_authorization(None) == "unknown"
+
+
+def test_stats_per_data_provider():
+    datasets = pd.DataFrame(
+        {
+            "title": ["A", "B", "C"],
+            "data_provider": ["zenodo", "zenodo", "osf"],
+            "authorization": ["public", "Restricted", "unknown"],
+            "size_in_gb": [0.5, 1024.0, 2.0],
+            "number_of_files": [1000, 5, float("nan")],
+            "keywords": [
+                ["mri", "canadian-open-neuroscience-platform"],
+                ["eeg", "mri"],
+                [],
+            ],
+        },
+    )
+    stats = get_stats_per_data_provider(datasets)
+    assert stats.values.tolist() == [
+        ["braincode", 0, 0, 0, 0, ""],
+        ["frdr", 0, 0, 0, 0, ""],
+        ["loris", 0, 0, 0, 0, ""],
+        ["osf", 1, 0, 0, 2, ""],
+        ["zenodo", 2, 1, 1005, 1024, "mri, eeg"],
+    ]
+
+
+def test_stats_per_domain():
+    tools = read_tool_table(
+        [
+            {
+                "name": "fmriprep BIDS App",
+                "container-image": {"type": "docker"},
+                "tags": {"domain": ["MRI", "Neuroinformatics"]},
+                "online-platform-urls": ["https://portal.cbrain.mcgill.ca"],
+            },
+            {
+                "name": "mne",
+                "container-image": {"type": "singularity"},
+                "tags": {"domain": ["EEG", "mri"]},
+            },
+            {"name": "untagged BIDS App"},
+        ],
+    )
+    stats = get_stats_per_domain(tools)
+    assert stats.values.tolist() == [
+        ["Neuroinformatics", 1, "Docker (1); Singularity (0)", "CBRAIN (1)"],
+        ["Bioinformatics", 0, "Docker (0); Singularity (0)", "CBRAIN (0)"],
+        ["MRI", 2, "Docker (1); Singularity (1)", "CBRAIN (1)"],
+        ["EEG", 1, "Docker (0); Singularity (1)", "CBRAIN (0)"],
+        ["Connectome", 0, "Docker (0); Singularity (0)", "CBRAIN (0)"],
+        ["BIDS-App", 1, "Docker (1); Singularity (0)", "CBRAIN (1)"],
+    ]
@@ -0,0 +1,98 @@
+"""Test the injection of the Zenodo access token in the archive links of a dataset."""
+import os
+import stat
+import subprocess
+
+import pytest
+from git import Repo
+
+from scripts.unlock import compile_links
+from scripts.unlock import inject_token
+from scripts.unlock import unlock_archive_links
+
+ARCHIVE = "https://zenodo.org/record/1/files/data"
+LINKS = [ARCHIVE, f"{ARCHIVE}.zip", ARCHIVE]
+
+
+def test_compile_links():
+    pattern = compile_links(LINKS)
+    assert pattern.findall(f"{ARCHIVE}.zip {ARCHIVE}") == [f"{ARCHIVE}.zip", ARCHIVE]
+
+
+def test_inject_token():
+    pattern = compile_links(LINKS)
+
+    # The longest link is matched, not its prefix.
+    assert (
+        inject_token(f"1s 1 {ARCHIVE}.zip\n", pattern, "T")
+        == f"1s 1 {ARCHIVE}.zip?access_token=T\n"
+    )
+    assert inject_token(f"1s 1 {ARCHIVE}\n", pattern, "T") == (
+        f"1s 1 {ARCHIVE}?access_token=T\n"
+    )
+    # Logs already unlocked or without any of the links are left untouched.
+    assert inject_token(f"1s 1 {ARCHIVE}?access_token=T\n", pattern, "U") is None
+    assert inject_token("1s 1 https://example.com/data\n", pattern, "T") is None
+
+
+def git(repo_dir, *args):
+    subprocess.run(["git", *args], cwd=repo_dir, check=True, capture_output=True)
+
+
+@pytest.fixture()
+def repo(tmp_path, monkeypatch):
+    # `git annex merge` has nothing to merge as the git-annex branch has no journal.
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    git_annex = bin_dir / "git-annex"
+    git_annex.write_text("#!/bin/sh\n")
+    git_annex.chmod(git_annex.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    for variable in ("AUTHOR", "COMMITTER"):
+        monkeypatch.setenv(f"GIT_{variable}_NAME", "test")
+        monkeypatch.setenv(f"GIT_{variable}_EMAIL", "test@example.com")
+
+    repo_dir = tmp_path / "dataset"
+    repo_dir.mkdir()
+    git(repo_dir, "init", "-q", "-b", "master")
+    git(repo_dir, "commit", "-q", "--allow-empty", "-m", "init")
+    git(repo_dir, "checkout", "-q", "--orphan", "git-annex")
+    git(repo_dir, "rm", "-rfq", "--cached", "--ignore-unmatch", ".")
+    logs = {
+        "uuid.log": "00000000 web\n",
+        "aaa/bbb/KEY1.log.web": f"1s 1 {ARCHIVE}.zip\n",
+        # Paths git would quote outside of -z mode.
+        "aaa/ccc/KEY\t2é.log.web": f"1s 1 {ARCHIVE}\n",
+        "aaa/ddd/KEY3.log.web": "1s 1 https://example.com/data\n",
+    }
+    for path, content in logs.items():
+        (repo_dir / path).parent.mkdir(parents=True, exist_ok=True)
+        (repo_dir / path).write_text(content)
+    git(repo_dir, "add", ".")
+    git(repo_dir, "commit", "-q", "-m", "git-annex logs")
+    git(repo_dir, "checkout", "-q", "master")
+    return Repo(repo_dir)
+
+
+def test_unlock_archive_links(repo):
+    parent = repo.git.rev_parse("refs/heads/git-annex")
+
+    assert unlock_archive_links(repo, LINKS, "T")
+
+    branch = repo.commit("refs/heads/git-annex")
+    assert [commit.hexsha for commit in branch.parents] == [parent]
+
+    def read(path):
+        return repo.git.show(f"git-annex:{path}") + "\n"
+
+    assert read("aaa/bbb/KEY1.log.web") == f"1s 1 {ARCHIVE}.zip?access_token=T\n"
+    assert read("aaa/ccc/KEY\t2é.log.web") == f"1s 1 {ARCHIVE}?access_token=T\n"
+    assert read("aaa/ddd/KEY3.log.web") == "1s 1 https://example.com/data\n"
+    assert read("uuid.log") == "00000000 web\n"
+    # The working tree and the index of the dataset are left alone.
+    assert repo.active_branch.name == "master"
+    assert not repo.is_dirty(untracked_files=True)
+
+    # The links are already unlocked on the second run.
+    assert not unlock_archive_links(repo, LINKS, "T")
+    assert repo.commit("refs/heads/git-annex") == branch